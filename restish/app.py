@@ -1,26 +1,98 @@
 """
 Core wsgi application
 """
-from restish import error, http, url
+from restish import conditional, error, http, profiling, ranges, url
+from restish.resource import child_router, compile_child_routes
 
 
 class RestishApp(object):
+    """
+    WSGI application that traverses the resource hierarchy, starting at the
+    root resource, to find the resource for the requested URL.
 
-    def __init__(self, root_resource):
+    If compiled is True then the @child factories of Resource classes are
+    compiled into a trie of path segments (see resource.ChildRouter) to speed
+    up traversal. Resources that override resource_child, and non-Resource
+    objects, are traversed as usual.
+
+    If conditional is True then GET and HEAD responses are passed through
+    conditional.conditional_response, returning 304 Not Modified responses to
+    clients whose copy is current.
+
+    If ranges is True then GET and HEAD responses are passed through
+    ranges.range_response, returning 206 Partial Content responses to requests
+    with a Range header.
+
+    A response_cache, e.g. a responsecache.ResponseCache, is used to reuse the
+    responses of GET requests.
+
+    A compression stage, a compression.Compressor, compresses responses for
+    clients that accept it.
+
+    A profiler, a profiling.Profiler, times the phases of each request.
+    """
+
+    def __init__(self, root_resource, compiled=False, conditional=False,
+                 response_cache=None, profiler=None, ranges=False,
+                 compression=None):
         self.root = root_resource
+        self.compiled = compiled
+        self.conditional = conditional
+        self.response_cache = response_cache
+        self.profiler = profiler
+        self.ranges = ranges
+        self.compression = compression
+        if compiled:
+            compile_child_routes()
 
     def __call__(self, environ, start_response):
+        profiler = self.profiler
+        if profiler is not None:
+            timings = profiler.start(environ)
+            start = timings.timer()
         # Create a request object.
         request = http.Request(environ)
+        if profiler is not None:
+            timings.add('request', start)
+        response = self.handle(request)
+        # Send the response to the WSGI parent.
+        start_response(response.status, response.headerlist)
+        app_iter = response.app_iter
+        # Let the server send files its own way, if it can.
+        if isinstance(app_iter, http.FileIter):
+            file_wrapper = environ.get('wsgi.file_wrapper')
+            if file_wrapper is not None:
+                app_iter = file_wrapper(app_iter.file, app_iter.block_size)
+        if profiler is not None:
+            return profiler.finish(environ, app_iter)
+        return app_iter
+
+    def handle(self, request):
+        """
+        Handle the request, returning an http.Response.
+
+        This is everything the application does apart from talking WSGI, i.e.
+        locating the resource, getting its response (via the response cache,
+        if any), conditional GET, range requests, compression and turning HTTP
+        errors into responses.
+        """
         try:
             # Locate the resource and convert it to a response.
             resource_or_response = self.locate_resource(request)
-            response = self.get_response(request, resource_or_response)
+            if self.response_cache is not None:
+                response = self.response_cache(request, resource_or_response,
+                                               self.get_response)
+            else:
+                response = self.get_response(request, resource_or_response)
+            if self.conditional:
+                response = conditional.conditional_response(request, response)
+            if self.ranges:
+                response = ranges.range_response(request, response)
+            if self.compression is not None:
+                response = self.compression(request, response)
         except error.HTTPError, e:
             response = e.make_response()
-        # Send the response to the WSGI parent.
-        start_response(response.status, response.headerlist)
-        return response.app_iter
+        return response
 
     def locate_resource(self, request):
         """
@@ -36,12 +108,21 @@ class RestishApp(object):
         # Recurse into the resource hierarchy until we run out of segments or
         # find a Response.
         resource = self.root
+        timings = request.environ.get(profiling.ENVIRON_KEY)
         while segments and not isinstance(resource, http.Response):
             resource_child = getattr(resource, 'resource_child', None)
             # No resource_child method? 404.
             if resource_child is None:
                 raise http.NotFoundError()
-            result = resource_child(request, segments)
+            if timings is not None:
+                start = timings.timer()
+            router = child_router(resource) if self.compiled else None
+            if router is not None:
+                result = router(resource, request, segments)
+            else:
+                result = resource_child(request, segments)
+            if timings is not None:
+                timings.add('traverse', start)
             # No result returned? 404.
             if result is None:
                 raise http.NotFoundError()
@@ -0,0 +1,204 @@
+"""
+Simple in-process caches used to avoid repeating work across requests.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+
+
+# Marker for a missing value, when None is a valid value.
+_MISSING = object()
+
+
+class LRUCache(object):
+    """
+    Thread-safe, bounded mapping that discards the least recently used items
+    when full.
+
+    The number of hits and misses are counted to allow the cache's
+    effectiveness to be checked. A maxsize of 0 disables the cache entirely,
+    i.e. nothing is ever stored.
+
+    Looking up a cached value is a dict lookup and needs no locking, which
+    matters for caches consulted on every request. The cost is paid when the
+    cache is full, when an eighth of the items are discarded at once.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # key -> [last used tick, value]
+        self._data = {}
+        self._tick = itertools.count().next
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        """
+        Return the cached value for key, or default if it is not cached.
+        """
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        entry[0] = self._tick()
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value):
+        """
+        Add the value to the cache, discarding the least recently used items
+        if the cache is full.
+        """
+        if self.maxsize <= 0:
+            return
+        self._lock.acquire()
+        try:
+            self._data[key] = [self._tick(), value]
+            if len(self._data) > self.maxsize:
+                self._discard(len(self._data) - self.maxsize +
+                              self.maxsize // 8)
+        finally:
+            self._lock.release()
+
+    def _discard(self, count):
+        oldest = heapq.nsmallest(count, self._data.iteritems(),
+                                 key=lambda item: item[1][0])
+        for key, entry in oldest:
+            del self._data[key]
+
+    def delete(self, key):
+        """
+        Remove the cached value for key, if any.
+        """
+        self._lock.acquire()
+        try:
+            self._data.pop(key, None)
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        """
+        Remove everything from the cache and reset the statistics.
+        """
+        self._lock.acquire()
+        try:
+            self._data.clear()
+            self.hits = self.misses = 0
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        """
+        Return a dict of the cache's statistics.
+        """
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(self._data), 'maxsize': self.maxsize,
+                'hit_rate': lookups and float(self.hits) / lookups or 0.0}
+
+
+class TTLCache(LRUCache):
+    """
+    LRUCache whose items also expire after a number of seconds.
+
+    The time to live is given when an item is added to the cache, defaulting
+    to the cache's ttl. A ttl of None means the item never expires, although
+    it may still be discarded to make room for other items.
+    """
+
+    def __init__(self, maxsize=128, ttl=None, timer=time.time):
+        LRUCache.__init__(self, maxsize)
+        self.ttl = ttl
+        self.timer = timer
+
+    def get(self, key, default=None):
+        """
+        Return the cached value for key, or default if it is not cached or has
+        expired.
+        """
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        expires, value = entry[1]
+        if expires is not None and expires <= self.timer():
+            # Expired items are left to be discarded, or replaced, later.
+            self.misses += 1
+            return default
+        entry[0] = self._tick()
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        """
+        Add the value to the cache for ttl seconds, or the cache's ttl if None.
+        """
+        if ttl is None:
+            ttl = self.ttl
+        if ttl is None:
+            expires = None
+        else:
+            expires = self.timer() + ttl
+        LRUCache.set(self, key, (expires, value))
+
+
+class BoundedMemo(object):
+    """
+    Memoize a function of a single, hashable argument, remembering at most
+    maxsize results.
+
+    BoundedMemo is intended for cheap functions called very often with a small
+    vocabulary of arguments, e.g. quoting URL segments. To keep the overhead
+    to a minimum the memo is simply emptied when it's full, rather than
+    tracking the least recently used result, and no locking is used. The hit
+    and miss counts may therefore be slightly out under concurrent use. A
+    maxsize of 0 disables the memo.
+    """
+
+    def __init__(self, func, maxsize=1024):
+        self.func = func
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = {}
+
+    def __len__(self):
+        return len(self._data)
+
+    def __call__(self, arg):
+        value = self._data.get(arg, _MISSING)
+        if value is not _MISSING:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = self.func(arg)
+        if len(self._data) >= self.maxsize:
+            self._data.clear()
+        if self.maxsize > 0:
+            self._data[arg] = value
+        return value
+
+    def clear(self):
+        """
+        Forget all results and reset the statistics.
+        """
+        self._data.clear()
+        self.hits = self.misses = 0
+
+    def stats(self):
+        """
+        Return a dict of the memo's statistics.
+        """
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(self._data), 'maxsize': self.maxsize,
+                'hit_rate': lookups and float(self.hits) / lookups or 0.0}
@@ -0,0 +1,231 @@
+"""
+Response compression.
+
+A Compressor passed to the application, RestishApp(root,
+compression=Compressor()), gzip or deflate encodes responses for clients that
+accept it, according to their Accept-Encoding header.
+
+Bodies already in memory, i.e. a str (or list of strs), are compressed in one
+go, and only if they are at least min_size bytes. Streamed bodies, including
+files, are compressed a chunk at a time as they are sent, so memory use does
+not depend on the size of the body. By default the compressed stream is
+flushed after each of the body's chunks so that, e.g., a streamed page still
+reaches the client progressively.
+
+Only content types that are worth compressing are compressed (see
+Compressor.types); images, archives and other already compressed content are
+sent as-is.
+"""
+
+import hashlib
+import re
+import zlib
+
+from restish import http
+
+
+# The content types compressed by default. A type ending with '/' matches any
+# subtype.
+DEFAULT_TYPES = ['text/', 'application/json', 'application/javascript',
+                 'application/x-javascript', 'application/xml',
+                 'application/xhtml+xml', 'application/atom+xml',
+                 'application/rss+xml', 'image/svg+xml']
+
+# Content codings in order of preference, with their zlib window bits.
+_CODINGS = [('gzip', 16 + zlib.MAX_WBITS), ('deflate', zlib.MAX_WBITS)]
+_WBITS = dict(_CODINGS)
+
+_NO_TRANSFORM = re.compile(r'(?:^|,)\s*no-transform\b', re.I)
+
+
+class Compressor(object):
+    """
+    Compress responses using the best content coding accepted by the client.
+
+    Only successful (200) responses to requests other than HEAD are
+    compressed, and only if they do not already have a Content-Encoding or a
+    Cache-Control: no-transform header. Vary: Accept-Encoding is added to all
+    responses that could have been compressed, whether they were or not, and
+    to HEAD responses whose GET response could have been.
+
+    A cache, e.g. a cache.LRUCache, remembers the compressed bytes of
+    in-memory bodies, keyed on the coding and a hash of the body, so the same
+    static body is not compressed again for every request.
+
+    :arg level:
+        Optional zlib compression level, 1 (fastest) to 9 (smallest).
+    :arg min_size:
+        Optional size, in bytes, below which bodies are not compressed.
+    :arg types:
+        Optional list of the content types to compress, defaults to
+        DEFAULT_TYPES.
+    :arg flush:
+        Optional flag, flush the compressed stream after each chunk of a
+        streamed body.
+    :arg cache:
+        Optional cache of compressed in-memory bodies.
+    """
+
+    def __init__(self, level=6, min_size=256, types=None, flush=True,
+                 cache=None):
+        self.level = level
+        self.min_size = min_size
+        if types is None:
+            types = DEFAULT_TYPES
+        self.types = tuple(types)
+        self.flush = flush
+        self.cache = cache
+
+    def __call__(self, request, response):
+        """
+        Return a compressed version of response, or response itself if it
+        should not, or cannot, be compressed.
+        """
+        if response.status_int != 200:
+            return response
+        headers = response.headers
+        if 'Content-Encoding' in headers or \
+                _NO_TRANSFORM.search(headers.get('Cache-Control', '')):
+            return response
+        if not self.compressible_type(headers.get('Content-Type')):
+            return response
+        head = request.method == 'HEAD'
+        app_iter = response.app_iter
+        # A HEAD response's body is empty, only its Content-Length tells the
+        # size of the GET response's body.
+        if not head and isinstance(app_iter, (list, tuple)):
+            body = ''.join(app_iter)
+            if len(body) < self.min_size:
+                return response
+        else:
+            body = None
+            content_length = headers.get('Content-Length')
+            if content_length is not None and \
+                    int(content_length) < self.min_size:
+                return response
+        _add_vary(headers)
+        if head:
+            return response
+        coding = self.coding(request)
+        if coding is None:
+            return response
+        if body is not None:
+            compressed = self.compress(coding, body)
+            if len(compressed) >= len(body):
+                return response
+        else:
+            compressed = _CompressedIter(app_iter, self._compressobj(coding),
+                                         self.flush)
+        headers = [(name, value) for (name, value) in response.headerlist
+                   if name.lower() not in ('content-length', 'accept-ranges')]
+        headers.append(('Content-Encoding', coding))
+        # The compressed body is a different entity, so its ETag must not
+        # match the original in a strong comparison, e.g. by If-Range.
+        for i, (name, value) in enumerate(headers):
+            if name.lower() == 'etag' and not value.startswith('W/'):
+                headers[i] = (name, 'W/' + value)
+        return http.Response(response.status, headers, compressed)
+
+    def compressible_type(self, content_type):
+        """
+        Test if content_type, the value of a Content-Type header or None, is
+        worth compressing.
+        """
+        if not content_type:
+            return False
+        content_type = content_type.split(';', 1)[0].strip().lower()
+        for type in self.types:
+            if type.endswith('/'):
+                if content_type.startswith(type):
+                    return True
+            elif content_type == type:
+                return True
+        return False
+
+    def coding(self, request):
+        """
+        Return the content coding to use for the request, 'gzip' or 'deflate',
+        or None if the client accepts neither.
+        """
+        accept_encoding = request.environ.get('HTTP_ACCEPT_ENCODING')
+        if not accept_encoding:
+            return None
+        qualities = {}
+        for item in accept_encoding.split(','):
+            params = item.split(';')
+            name = params[0].strip().lower()
+            if name == 'x-gzip':
+                name = 'gzip'
+            q = 1.0
+            for param in params[1:]:
+                param = param.strip()
+                if param.startswith('q='):
+                    try:
+                        q = float(param[2:])
+                    except ValueError:
+                        q = 0.0
+            qualities[name] = q
+        best, best_q = None, 0.0
+        for coding, wbits in _CODINGS:
+            q = qualities.get(coding, qualities.get('*', 0.0))
+            if q > best_q:
+                best, best_q = coding, q
+        return best
+
+    def compress(self, coding, body):
+        """
+        Compress body, a str, using the cache if there is one.
+        """
+        if self.cache is None:
+            return self._compress(coding, body)
+        key = (coding, self.level, hashlib.md5(body).digest())
+        compressed = self.cache.get(key)
+        if compressed is None:
+            compressed = self._compress(coding, body)
+            self.cache.set(key, compressed)
+        return compressed
+
+    def _compress(self, coding, body):
+        compressobj = self._compressobj(coding)
+        return compressobj.compress(body) + compressobj.flush()
+
+    def _compressobj(self, coding):
+        return zlib.compressobj(self.level, zlib.DEFLATED, _WBITS[coding])
+
+
+class _CompressedIter(object):
+    """
+    app_iter that compresses another app_iter as it is iterated.
+    """
+
+    def __init__(self, app_iter, compressobj, flush):
+        self.app_iter = app_iter
+        self.compressobj = compressobj
+        self.flush = flush
+
+    def __iter__(self):
+        compressobj = self.compressobj
+        for data in self.app_iter:
+            if not data:
+                continue
+            data = compressobj.compress(data)
+            if self.flush:
+                data += compressobj.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressobj.flush()
+
+    def close(self):
+        close = getattr(self.app_iter, 'close', None)
+        if close is not None:
+            close()
+
+
+def _add_vary(headers):
+    vary = headers.get('Vary')
+    if not vary:
+        headers['Vary'] = 'Accept-Encoding'
+    else:
+        names = [name.strip().lower() for name in vary.split(',')]
+        if 'accept-encoding' not in names and '*' not in names:
+            headers['Vary'] = vary + ', Accept-Encoding'
@@ -0,0 +1,190 @@
+"""
+Conditional GET support, i.e. answering a request that includes an
+If-None-Match or If-Modified-Since header with a 304 Not Modified response
+when the client's copy is still current.
+
+There are two, complementary, ways to use it:
+
+* The conditional decorator, for @resource.GET methods, calls cheap etag
+  and/or last_modified functions *before* the (presumably expensive) handler
+  and returns a 304 without calling the handler at all when possible.
+
+* RestishApp(..., conditional=True), which calls conditional_response for
+  every GET and HEAD response. Strong ETags are calculated automatically for
+  bodies that are already in memory, i.e. a str (or list of str), so even
+  resources that know nothing about conditional requests save the bandwidth
+  of re-sending an unchanged representation.
+"""
+
+import calendar
+import datetime
+import hashlib
+from email.utils import formatdate, mktime_tz, parsedate_tz
+
+from restish import http
+
+
+# The key for the entity tag of the GET response's body, calculated by the
+# default Resource.head, in the WSGI environ.
+HEAD_ETAG_KEY = 'restish.conditional.head_etag'
+
+# Headers copied from the full response to a 304 response.
+_NOT_MODIFIED_HEADERS = set(['cache-control', 'content-location', 'date',
+                             'etag', 'expires', 'last-modified', 'vary'])
+
+
+def conditional(etag=None, last_modified=None):
+    """
+    Decorator for @resource.GET etc methods that returns a 304 Not Modified,
+    without calling the decorated method, if the client's copy of the
+    resource is current.
+
+    The etag and last_modified functions are called as func(resource,
+    request). etag should return the entity tag, either bare or already
+    quoted; last_modified should return a datetime (UTC if naive) or a
+    timestamp. Either function may return None if it cannot tell, in which
+    case the decorated method is called as usual.
+
+    The ETag and Last-Modified headers are added to the decorated method's
+    response unless the method has already set them.
+
+    :arg etag:
+        Optional function returning the resource's entity tag.
+    :arg last_modified:
+        Optional function returning the resource's modification time.
+    """
+    def decorator(func):
+        def decorated(resource, request, *a, **k):
+            tag = etag and etag(resource, request)
+            if tag is not None:
+                tag = quote_etag(tag)
+            modified = last_modified and last_modified(resource, request)
+            if modified is not None:
+                modified = _timestamp(modified)
+            headers = []
+            if tag is not None:
+                headers.append(('ETag', tag))
+            if modified is not None:
+                headers.append(('Last-Modified', http_date(modified)))
+            if is_not_modified(request, tag, modified):
+                return http.not_modified(headers)
+            response = func(resource, request, *a, **k)
+            if isinstance(response, http.Response):
+                for name, value in headers:
+                    if name not in response.headers:
+                        response.headers[name] = value
+            return response
+        return decorated
+    return decorator
+
+
+def conditional_response(request, response):
+    """
+    Return a 304 Not Modified response in place of response if the request's
+    conditions are met, otherwise return response, adding a strong ETag if
+    one can be calculated cheaply.
+
+    Only successful GET and HEAD responses are considered. A response's ETag
+    is calculated from its body, when it does not already have one, only if
+    the body is a list of strs, e.g. the body was passed to the Response as a
+    str. Streamed bodies are never consumed. A HEAD response gets the ETag
+    the default Resource.head calculated from the GET response's body.
+    """
+    if request.method not in ('GET', 'HEAD') or response.status_int != 200:
+        return response
+    tag = response.headers.get('ETag')
+    if tag is None:
+        if request.method == 'GET':
+            app_iter = response.app_iter
+            if isinstance(app_iter, (list, tuple)):
+                tag = strong_etag(app_iter)
+        else:
+            tag = request.environ.get(HEAD_ETAG_KEY)
+        if tag is not None:
+            response.headers['ETag'] = tag
+    modified = response.headers.get('Last-Modified')
+    if modified is not None:
+        modified = parse_http_date(modified)
+    if not is_not_modified(request, tag, modified):
+        return response
+    close = getattr(response.app_iter, 'close', None)
+    if close is not None:
+        close()
+    return http.not_modified([(name, value)
+                              for (name, value) in response.headerlist
+                              if name.lower() in _NOT_MODIFIED_HEADERS])
+
+
+def is_not_modified(request, etag, last_modified):
+    """
+    Test if the request's If-None-Match or, in its absence, If-Modified-Since
+    header shows the client has the current version of the resource.
+
+    etag must be a quoted entity tag or None; last_modified must be a
+    timestamp or None.
+    """
+    if_none_match = request.environ.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        if etag is None:
+            return False
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in tags or _weak(etag) in [_weak(tag) for tag in tags]
+    if_modified_since = request.environ.get('HTTP_IF_MODIFIED_SINCE')
+    if if_modified_since and last_modified is not None:
+        since = parse_http_date(if_modified_since)
+        return since is not None and int(last_modified) <= since
+    return False
+
+
+def strong_etag(body):
+    """
+    Calculate a strong, quoted entity tag for body, a str or a list of strs.
+    """
+    if isinstance(body, str):
+        body = [body]
+    digest = hashlib.md5()
+    for chunk in body:
+        digest.update(chunk)
+    return '"%s"' % (digest.hexdigest(),)
+
+
+def quote_etag(etag):
+    """
+    Quote a bare entity tag, leaving an already quoted or weak tag as-is.
+    """
+    if etag.startswith('"') or etag.startswith('W/"'):
+        return etag
+    return '"%s"' % (etag,)
+
+
+def http_date(timestamp):
+    """
+    Format a timestamp as an HTTP date.
+    """
+    return formatdate(timestamp, usegmt=True)
+
+
+def parse_http_date(value):
+    """
+    Parse an HTTP date into a timestamp, returning None if it's malformed.
+    """
+    parsed = parsedate_tz(value)
+    if parsed is None:
+        return None
+    try:
+        return mktime_tz(parsed)
+    except (OverflowError, ValueError):
+        return None
+
+
+def _weak(etag):
+    # If-None-Match uses the weak comparison function.
+    if etag.startswith('W/'):
+        return etag[2:]
+    return etag
+
+
+def _timestamp(value):
+    if isinstance(value, datetime.datetime):
+        return calendar.timegm(value.utctimetuple())
+    return int(value)
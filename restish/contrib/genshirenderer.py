@@ -35,3 +35,11 @@ class GenshiRenderer(object):
         return self.loader.load(template).generate(**args).render(
             encoding=encoding)
 
+    def stream(self, template, args={}, encoding=None):
+        # Serialize and encode as Genshi's Stream.render would.
+        chunks = self.loader.load(template).generate(**args).serialize(
+            method=None)
+        if encoding is None:
+            return chunks
+        return (chunk.encode(encoding, 'xmlcharrefreplace') for chunk in chunks)
+
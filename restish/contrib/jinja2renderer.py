@@ -36,3 +36,12 @@ class Jinja2Renderer(object):
             return template.render(**args)
         return template.render(**args).encode(encoding)
 
+    def stream(self, template, args={}, encoding=None):
+        template = self.environment.get_template(template)
+        stream = template.stream(**args)
+        # Avoid lots of tiny chunks.
+        stream.enable_buffering()
+        if encoding is None:
+            return stream
+        return (chunk.encode(encoding) for chunk in stream)
+
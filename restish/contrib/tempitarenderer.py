@@ -5,9 +5,11 @@ A TempitaRenderer instance can be used as the renderer passed to the
 templating.Templating instance that is added to the WSGI environ.
 """
 
-import os.path
+import os
 import tempita
 
+from restish.cache import LRUCache
+
 
 class TempitaRenderer(object):
 
@@ -23,23 +25,60 @@ class TempitaRenderer(object):
 
 
 class TempitaFileSystemLoader(object):
+    """
+    Load Tempita templates from the files in a directory.
+
+    Compiled templates are kept, keyed on absolute filename, in an LRUCache of
+    cache_size templates (0 disables the cache). Templates are loaded once and
+    never reloaded unless check_mtime is True, which is useful during
+    development, when a template is reloaded if its file has been modified.
+
+    If prewarm is True then all the templates in the directory are loaded
+    immediately, see prewarm().
+    """
 
-    def __init__(self, directory, encoding='utf-8'):
+    def __init__(self, directory, encoding='utf-8', cache_size=256,
+                 check_mtime=False, prewarm=False):
         self.directory = directory
         self.encoding = encoding
+        self.check_mtime = check_mtime
+        self.cache = LRUCache(cache_size)
+        if prewarm:
+            self.prewarm()
 
     def get_template(self, template):
         template = template.lstrip('/')
         filename = os.path.join(self.directory, template)
         return self._get_template(filename)
 
+    def prewarm(self):
+        """
+        Load and compile all the templates under the directory. Files that are
+        not valid templates are skipped.
+        """
+        for dirpath, dirnames, filenames in os.walk(self.directory):
+            for filename in filenames:
+                try:
+                    self._get_template(os.path.join(dirpath, filename))
+                except (tempita.TemplateError, UnicodeDecodeError):
+                    pass
+
     def _get_template(self, filename):
         filename = os.path.abspath(filename)
         if os.path.commonprefix([filename, self.directory]) != self.directory:
             raise Exception("Illegal template: outside template directory")
-        return tempita.Template.from_filename(
+        cached = self.cache.get(filename)
+        if cached is not None:
+            mtime, template = cached
+            if not self.check_mtime or mtime == _mtime(filename):
+                return template
+        # Get the mtime first, so a change while loading is spotted next time.
+        mtime = self.check_mtime and _mtime(filename) or None
+        template = tempita.Template.from_filename(
             filename, encoding=self.encoding,
             get_template=self._tempita_get_template)
+        self.cache.set(filename, (mtime, template))
+        return template
 
     def _tempita_get_template(self, name, from_template):
         if name.startswith('/'):
@@ -50,3 +89,9 @@ class TempitaFileSystemLoader(object):
         filename = os.path.join(basedir, name)
         return self._get_template(filename)
 
+
+def _mtime(filename):
+    try:
+        return os.path.getmtime(filename)
+    except OSError:
+        return None
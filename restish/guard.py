@@ -15,11 +15,34 @@ authenticated user as the REMOTE_USER:
     def authenticated_checker(request, obj):
         if request.environ.get('REMOTE_USER') is None:
             raise guard.GuardError("No authenticated user.")
+
+Every checker of every guard on the way to, and at, the requested resource is
+called, so expensive checkers that do not depend on the object being protected,
+e.g. validating a token, should be wrapped with cached to call them only once
+per request (and, optionally, once per principal every so often).
 """
 
 import functools
+import sys
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+from restish import cache, http
+
+
+# The key for the request's cached checker results in the WSGI environ.
+ENVIRON_KEY = 'restish.guard.results'
 
-from restish import http
+# Number of threads, shared by all guards, used to run checkers in parallel.
+CHECKER_THREADS = 8
+
+# The error for a checker that did not finish before a parallel guard's
+# timeout.
+TIMEOUT_MESSAGE = 'Guard check timed out.'
+
+_checker_pool = None
+_checker_pool_lock = threading.Lock()
 
 
 class GuardError(Exception):
@@ -44,11 +67,29 @@ def guard(*checkers, **kwargs):
 
     The only requirement is that the decorated function takes the request as
     the first positional arg.
+
+    If fail_fast is True then the checkers after the first failure are not
+    called, and only the first error is passed to the error_handler.
+
+    If parallel is True then the checkers are called at the same time, on a
+    pool of CHECKER_THREADS threads shared by all guards, which helps when
+    they wait on the network. Errors are still reported in the order of the
+    checkers. A parallel guard's timeout is the number of seconds each
+    checker may run for, from when it starts; those that have not finished
+    by then fail with TIMEOUT_MESSAGE. A checker that times out is not
+    stopped, and keeps one of the pool's threads until it returns. A checker
+    that is still waiting for a thread, e.g. because the pool is busy with
+    other guards' checkers, once the guard has waited timeout seconds for it
+    to start is called on the guard's own thread instead, without a timeout.
+    Checkers called in parallel must not themselves use parallel guards.
     """
 
     # Bah, silly Python doesn't (yet) support explicit positional vs keyword
     # args so we'll have to handle it ourselves for now.
     error_handler = kwargs.pop('error_handler', _default_error_handler)
+    fail_fast = kwargs.pop('fail_fast', False)
+    parallel = kwargs.pop('parallel', False)
+    timeout = kwargs.pop('timeout', None)
     if kwargs:
         raise TypeError('guard() got unexpected keyword arguments %r' %
                         ('.'.join(kwargs),))
@@ -57,7 +98,9 @@ def guard(*checkers, **kwargs):
         @functools.wraps(func)
         def call(obj, request, *a, **k):
             """ Iterate checkers accumulating errors """
-            errors = _run_guard_checkers(checkers, request, obj, error_handler)
+            errors = _run_guard_checkers(checkers, request, obj,
+                                         error_handler, fail_fast, parallel,
+                                         timeout)
             if errors:
                 return error_handler(request, obj, errors)
             return func(obj, request, *a, **k)
@@ -70,50 +113,267 @@ class GuardResource(object):
     """
     Resource wrapper that guards access to a resource by calling each checker
     before calling the wrapped resource's methods.
+
+    If fail_fast is True then the checkers after the first failure are not
+    called.
+
+    If parallel is True then the checkers are called at the same time, see
+    guard.
     """
 
     def __init__(self, resource, *checkers, **kwargs):
         # Bah, silly Python doesn't (yet) support explicit positional vs
         # keyword args so we'll have to handle it ourselves for now.
         error_handler = kwargs.pop('error_handler', _default_error_handler)
+        fail_fast = kwargs.pop('fail_fast', False)
+        parallel = kwargs.pop('parallel', False)
+        timeout = kwargs.pop('timeout', None)
         if kwargs:
             raise TypeError('guard() got unexpected' \
                        ' keyword arguments %r' % ('.'.join(kwargs),))
         self.resource = resource
         self.checkers = checkers
         self.error_handler = error_handler
+        self.fail_fast = fail_fast
+        self.parallel = parallel
+        self.timeout = timeout
 
     def resource_child(self, request, segments):
         """
         Check the guard methods and raise error handler if errors
         """
         errors = _run_guard_checkers(self.checkers, request, \
-                                     self.resource, self.error_handler)
+                                     self.resource, self.error_handler,
+                                     self.fail_fast, self.parallel,
+                                     self.timeout)
         if errors:
             return self.error_handler(request, self.resource, errors)
         return self.resource.resource_child(request, segments)
 
     def __call__(self, request):
         errors = _run_guard_checkers(self.checkers, request, \
-                                     self.resource, self.error_handler)
+                                     self.resource, self.error_handler,
+                                     self.fail_fast, self.parallel,
+                                     self.timeout)
         if errors:
             return self.error_handler(request, self.resource, errors)
         return self.resource(request)
 
 
-def _run_guard_checkers(checkers, request, obj, error_handler):
+def cached(checker, ttl=None, principal=None, maxsize=1024):
+    """
+    Wrap a checker so that its result, success or GuardError, is remembered
+    for the rest of the request, wherever the wrapped checker is used.
+
+    If ttl is given then the result is also remembered across requests, for
+    ttl seconds, keyed by the request's principal. principal is a function
+    returning the principal of a request, by default its REMOTE_USER, or None
+    if the result must not be shared with other requests.
+
+    The checker is called with the object being protected by the first guard
+    that calls it, but its result is used for every object, so only checkers
+    that do not depend on the object should be cached.
+    """
+    return CachedChecker(checker, ttl, principal, maxsize)
+
+
+class CachedChecker(object):
+    """
+    Checker that remembers the result of another checker, see cached.
+    """
+
+    def __init__(self, checker, ttl=None, principal=None, maxsize=1024):
+        self.checker = checker
+        self.ttl = ttl
+        if principal is None:
+            principal = _remote_user
+        self.principal = principal
+        if ttl is not None:
+            self.cache = cache.TTLCache(maxsize, ttl)
+        else:
+            self.cache = None
+
+    def __call__(self, request, obj):
+        results = request.environ.get(ENVIRON_KEY)
+        if results is None:
+            results = request.environ[ENVIRON_KEY] = {}
+        try:
+            message = results[self]
+        except KeyError:
+            message = self._check(request, obj)
+            results[self] = message
+        if message is not None:
+            raise GuardError(message)
+
+    def _check(self, request, obj):
+        """
+        Return the error message of the checker, or None if it passes, using
+        the cross-request cache when possible.
+        """
+        principal = None
+        if self.cache is not None:
+            principal = self.principal(request)
+            if principal is not None:
+                # Results are cached as a 1-tuple as None means success.
+                result = self.cache.get(principal)
+                if result is not None:
+                    return result[0]
+        try:
+            self.checker(request, obj)
+        except GuardError, e:
+            message = e.message
+        else:
+            message = None
+        if principal is not None:
+            self.cache.set(principal, (message,))
+        return message
+
+    def clear(self):
+        """
+        Forget the results remembered across requests.
+        """
+        if self.cache is not None:
+            self.cache.clear()
+
+
+def _remote_user(request):
+    return request.environ.get('REMOTE_USER')
+
+
+def _run_guard_checkers(checkers, request, obj, error_handler,
+                        fail_fast=False, parallel=False, timeout=None):
     """
     Iterate through the checks, accumulating errors
     """
+    if parallel and (len(checkers) > 1 or timeout is not None):
+        return _run_parallel_guard_checkers(checkers, request, obj,
+                                            fail_fast, timeout)
     errors = []
     for checker in checkers:
         try:
             checker(request, obj)
         except GuardError, e:
             errors.append(e.message)
+            if fail_fast:
+                break
+    return errors
+
+
+def _run_parallel_guard_checkers(checkers, request, obj, fail_fast, timeout):
+    """
+    Run the checkers on the pool, collecting the errors in checker order.
+
+    A checker that no pool thread has started within timeout seconds of its
+    result being needed, or at once if there is no timeout, is run on this
+    thread, so checkers queued behind other guards' do not fail.
+    """
+    pool = _get_checker_pool()
+    tasks = [_CheckerTask(checker, request, obj) for checker in checkers]
+    for task in tasks:
+        pool.apply_async(task.run)
+    errors = []
+    try:
+        for task in tasks:
+            if timeout is not None:
+                task.claimed.wait(timeout)
+            task.run()
+            # Exceptions other than GuardError are re-raised here.
+            message = task.result(timeout)
+            if message is not None:
+                errors.append(message)
+                if fail_fast:
+                    break
+    finally:
+        # Skip the checkers that are no longer needed.
+        for task in tasks:
+            task.claim()
     return errors
 
 
+class _CheckerTask(object):
+    """
+    Call of a checker, made once by whichever thread claims it first.
+    """
+
+    def __init__(self, checker, request, obj):
+        self.checker = checker
+        self.request = request
+        self.obj = obj
+        self.started = None
+        self.claimed = threading.Event()
+        self.finished = threading.Event()
+        self.message = None
+        self.exc_info = None
+        self._lock = threading.Lock()
+
+    def claim(self):
+        """
+        Claim the call, returning False if it has already been claimed.
+        """
+        self._lock.acquire()
+        try:
+            if self.started is not None:
+                return False
+            self.started = time.time()
+            self.claimed.set()
+            return True
+        finally:
+            self._lock.release()
+
+    def run(self):
+        """
+        Call the checker, unless another thread has claimed the call.
+        """
+        if not self.claim():
+            return
+        try:
+            self.message = _call_checker(self.checker, self.request,
+                                         self.obj)
+        except:
+            self.exc_info = sys.exc_info()
+        self.finished.set()
+
+    def result(self, timeout=None):
+        """
+        Return the checker's error message, None if it passed or
+        TIMEOUT_MESSAGE if it did not finish within timeout seconds of
+        starting, re-raising any other exception.
+        """
+        if timeout is None:
+            self.finished.wait()
+        else:
+            self.finished.wait(max(self.started + timeout - time.time(), 0))
+        if not self.finished.isSet():
+            return TIMEOUT_MESSAGE
+        if self.exc_info is not None:
+            exc_info, self.exc_info = self.exc_info, None
+            raise exc_info[0], exc_info[1], exc_info[2]
+        return self.message
+
+
+def _call_checker(checker, request, obj):
+    """
+    Call the checker, returning its error message or None if it passed.
+    """
+    try:
+        checker(request, obj)
+    except GuardError, e:
+        return e.message
+    return None
+
+
+def _get_checker_pool():
+    global _checker_pool
+    if _checker_pool is None:
+        _checker_pool_lock.acquire()
+        try:
+            if _checker_pool is None:
+                _checker_pool = ThreadPool(CHECKER_THREADS)
+        finally:
+            _checker_pool_lock.release()
+    return _checker_pool
+
+
 def _default_error_handler(request, obj, errors):
     """
     Standard error handler produced unauthorized http response
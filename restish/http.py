@@ -3,11 +3,19 @@ HTTP Request and Response objects, simple Response factories and exceptions
 types for common HTTP errors.
 """
 import cgi
+import mimetypes
+import os
+import stat
 import webob
 
 from restish import error, url
 
 
+# The environ keys that Request's URL properties are calculated from.
+_URL_ENVIRON_KEYS = ('wsgi.url_scheme', 'HTTP_HOST', 'SERVER_NAME',
+                     'SERVER_PORT', 'SCRIPT_NAME', 'PATH_INFO', 'QUERY_STRING')
+
+
 class Request(webob.Request):
     """
     HTTP request class.
@@ -18,45 +26,70 @@ class Request(webob.Request):
     Request is basically a webob.Request with one important difference:
     url-like properties are represented as url.URL instances to allow them
     to manipulated easily and safely.
+
+    The url-like properties are only calculated once, unless the environ
+    values they are built from (e.g. SCRIPT_NAME and PATH_INFO) change.
     """
 
     def __init__(self, environ):
         webob.Request.__init__(self, environ)
+        self._url_cache = {}
+        self._url_cache_key = None
+
+    def _cached_url(self, name):
+        """
+        Return the named url-like property as a url.URL, creating it only if
+        it is not already cached.
+        """
+        environ = self.environ
+        key = tuple([environ.get(k) for k in _URL_ENVIRON_KEYS])
+        if key != self._url_cache_key:
+            self._url_cache = {}
+            self._url_cache_key = key
+        try:
+            return self._url_cache[name]
+        except KeyError:
+            if name == 'application_path':
+                value = self.application_url.path
+            else:
+                value = url.URL(getattr(super(Request, self), name))
+            self._url_cache[name] = value
+            return value
 
     @property
     def host_url(self):
         """
         Return the host's URL, i.e. the URL of the HTTP server.
         """
-        return url.URL(super(Request, self).host_url)
+        return self._cached_url('host_url')
 
     @property
     def application_url(self):
         """
         Return the WSGI application's URL.
         """
-        return url.URL(super(Request, self).application_url)
+        return self._cached_url('application_url')
 
     @property
     def application_path(self):
         """
         Return the path part of the WSGI application's URL.
         """
-        return self.application_url.path
+        return self._cached_url('application_path')
 
     @property
     def path_url(self):
         """
         Return the path's URL, i.e. the current URL without the query string.
         """
-        return url.URL(super(Request, self).path_url)
+        return self._cached_url('path_url')
 
     @property
     def url(self):
         """
         Return the full current (i.e. requested), URL.
         """
-        return url.URL(super(Request, self).url)
+        return self._cached_url('url')
 
     @property
     def path(self):
@@ -64,7 +97,7 @@ class Request(webob.Request):
         Return the path part of the current URL, relative to the root of the
         web server.
         """
-        return url.URL(super(Request, self).path)
+        return self._cached_url('path')
 
     @property
     def path_qs(self):
@@ -72,7 +105,7 @@ class Request(webob.Request):
         Return the path of the current URL, relative to the root of the web
         server, and the query string.
         """
-        return url.URL(super(Request, self).path_qs)
+        return self._cached_url('path_qs')
 
 
 class Response(webob.Response):
@@ -83,6 +116,10 @@ class Response(webob.Response):
     and is created by passing a status code, a list of (name, value) headers
     and a body.
 
+    The body may be a str, an iterable of strs or a file-like object, i.e.
+    anything with a read method, that is sent in blocks (see FileIter) and
+    closed afterwards.
+
     Response is basically just a webob.Response with a modified initializer and
     less implicit behaviour.
     """
@@ -103,6 +140,8 @@ class Response(webob.Response):
             content_length = header_dict.get('content-length')
         elif isinstance(body, str):
             kwargs['body'] = body
+        elif hasattr(body, 'read'):
+            kwargs['app_iter'] = FileIter(body)
         else:
             kwargs['app_iter'] = body
         webob.Response.__init__(self, **kwargs)
@@ -111,6 +150,34 @@ class Response(webob.Response):
             self.headers['Content-Length'] = content_length
 
 
+class FileIter(object):
+    """
+    WSGI app_iter that reads a file-like object in blocks of block_size bytes,
+    closing the file when the app_iter is closed.
+
+    RestishApp passes the file to the WSGI server's wsgi.file_wrapper, if it
+    has one, which may be able to send the file more efficiently.
+    """
+
+    def __init__(self, file, block_size=8192):
+        self.file = file
+        self.block_size = block_size
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        data = self.file.read(self.block_size)
+        if not data:
+            raise StopIteration()
+        return data
+
+    def close(self):
+        close = getattr(self.file, 'close', None)
+        if close is not None:
+            close()
+
+
 # Successful 2xx
 
 def ok(headers, body):
@@ -157,6 +224,89 @@ def created(location, headers, body):
     return Response("201 Created", headers, body)
 
 
+def file_response(path_or_file, content_type=None, chunk_size=65536,
+                  headers=None):
+    """
+    200 OK, with a file as the body.
+
+    The file is given as a filename or an open file-like object, which will be
+    closed once the response has been sent. When the file is a real file the
+    Content-Length and Last-Modified headers are set from its status.
+
+    The file is sent using the WSGI server's wsgi.file_wrapper, which may use
+    sendfile, if there is one. Otherwise, it is read in blocks of chunk_size
+    bytes.
+
+    :arg path_or_file:
+        Filename or file-like object.
+    :arg content_type:
+        Optional Content-Type of the file, guessed from the filename by
+        default.
+    :arg chunk_size:
+        Optional size of the blocks the file is read in, default 64KB.
+    :arg headers:
+        Optional extra HTTP headers.
+    """
+    # conditional imports this module, so it can't be imported at the top.
+    from restish import conditional
+    if isinstance(path_or_file, basestring):
+        filename = path_or_file
+        f = open(filename, 'rb')
+    else:
+        filename = getattr(path_or_file, 'name', None)
+        f = path_or_file
+    headers = list(headers or [])
+    names = set(name.lower() for (name, value) in headers)
+    if 'content-type' not in names:
+        if content_type is None and isinstance(filename, basestring):
+            content_type = mimetypes.guess_type(filename)[0]
+        headers.append(('Content-Type',
+                        content_type or 'application/octet-stream'))
+    try:
+        st = os.fstat(f.fileno())
+    except (AttributeError, IOError, OSError, ValueError):
+        st = None
+    if st is not None and stat.S_ISREG(st.st_mode):
+        # Only the rest of the file is sent, if it has been read from.
+        try:
+            position = f.tell()
+        except (AttributeError, IOError):
+            position = 0
+        if 'content-length' not in names:
+            headers.append(('Content-Length', str(st.st_size - position)))
+        if 'last-modified' not in names:
+            headers.append(('Last-Modified',
+                            conditional.http_date(st.st_mtime)))
+    return Response("200 OK", headers, FileIter(f, chunk_size))
+
+
+def partial_content(headers, body):
+    """
+    206 Partial Content
+
+    The server has fulfilled the partial GET request for the resource. The
+    request MUST have included a Range header field (section 14.35) indicating
+    the desired range, and MAY have included an If-Range header field (section
+    14.27) to make the request conditional.
+
+    If the 206 response is the result of an If-Range request that used a
+    strong cache validator, the response SHOULD NOT include other
+    entity-headers. Otherwise, the response MUST include all of the
+    entity-headers that would have been returned with a 200 (OK) response to
+    the same request.
+
+    The response MUST include either a Content-Range header field (section
+    14.16) indicating the range included with this response, or a
+    multipart/byteranges Content-Type including Content-Range fields for each
+    part. If a Content-Length header field is present in the response, its
+    value MUST match the actual number of OCTETs transmitted in the
+    message-body.
+
+    See restish.ranges for serving Range requests automatically.
+    """
+    return Response("206 Partial Content", headers, body)
+
+
 # Redirection 3xx
 
 _REDIRECTION_PAGE = """<html>
@@ -481,6 +631,33 @@ class ConflictError(error.HTTPClientError):
     response_factory = staticmethod(conflict)
 
 
+def requested_range_not_satisfiable(length, headers=None, body=None):
+    """
+    416 Requested Range Not Satisfiable
+
+    A server SHOULD return a response with this status code if a request
+    included a Range request-header field (section 14.35), and none of the
+    range-specifier values in this field overlap the current extent of the
+    selected resource, and the request did not include an If-Range
+    request-header field.
+
+    When this status code is returned for a byte-range request, the response
+    SHOULD include a Content-Range entity-header field specifying the current
+    length of the selected resource (see section 14.16).
+    """
+    if headers is None and body is None:
+        headers = [('Content-Type', 'text/plain')]
+        body = '416 Requested Range Not Satisfiable'
+    headers = list(headers or [])
+    headers.append(('Content-Range', 'bytes */%d' % (length,)))
+    return Response("416 Requested Range Not Satisfiable", headers, body)
+
+
+class RequestedRangeNotSatisfiableError(error.HTTPClientError):
+    """ Exception for the 416 http code """
+    response_factory = staticmethod(requested_range_not_satisfiable)
+
+
 # Server Error 5xx
 
 def internal_server_error(headers=None, body=None):
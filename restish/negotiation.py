@@ -0,0 +1,150 @@
+"""
+Content negotiation using pre-parsed media ranges.
+
+The matching rules (fitness and quality scoring) are equivalent to those of
+the mimeparse module. However, the server's supported types are parsed just
+once, typically when a Resource class is created, and each request header is
+parsed once per request, rather than everything being re-parsed each time a
+match is made.
+
+Unlike mimeparse, malformed media ranges are ignored rather than causing an
+exception.
+"""
+
+
+class MediaRange(object):
+    """
+    A parsed media range, e.g. 'text/html;level=1;q=0.5'.
+    """
+
+    __slots__ = ['value', 'type', 'subtype', 'params', 'q']
+
+    def __init__(self, value, type, subtype, params, q):
+        self.value = value
+        self.type = type
+        self.subtype = subtype
+        self.params = params
+        self.q = q
+
+    def __repr__(self):
+        return '<MediaRange %r>' % (self.value,)
+
+    def fitness(self, ranges):
+        """
+        Return the (fitness, quality) of the best of the ranges matching this
+        media range, or (-1, 0.0) if none of the ranges match.
+        """
+        best_fitness, best_q = -1, 0.0
+        type, subtype = self.type, self.subtype
+        for range in ranges:
+            if (range.type == type or range.type == '*' or type == '*') and \
+               (range.subtype == subtype or range.subtype == '*' or \
+                subtype == '*'):
+                fitness = 0
+                if range.type == type:
+                    fitness += 100
+                if range.subtype == subtype:
+                    fitness += 10
+                for key, value in self.params.iteritems():
+                    if range.params.get(key) == value:
+                        fitness += 1
+                if fitness > best_fitness:
+                    best_fitness, best_q = fitness, range.q
+        return best_fitness, best_q
+
+
+def parse_media_range(value):
+    """
+    Parse a single media range, returning a MediaRange or None if the value is
+    malformed.
+    """
+    parts = value.split(';')
+    full_type = parts[0].strip()
+    # Java's URLConnection class sends a single '*'.
+    if full_type == '*':
+        full_type = '*/*'
+    type_parts = full_type.split('/')
+    if len(type_parts) != 2:
+        return None
+    params = {}
+    for param in parts[1:]:
+        if '=' not in param:
+            continue
+        k, v = param.split('=', 1)
+        params[k.strip()] = v.strip()
+    # Missing, zero or out of range qualities all mean q=1 (as mimeparse).
+    q = params.pop('q', None)
+    try:
+        q = float(q)
+    except (TypeError, ValueError):
+        q = 1.0
+    if not q or q > 1 or q < 0:
+        q = 1.0
+    return MediaRange(value, type_parts[0].strip(), type_parts[1].strip(),
+                      params, q)
+
+
+def parse_header(header):
+    """
+    Parse a header in the format of an HTTP Accept header, i.e. a comma
+    separated list of media ranges, into a list of MediaRange instances.
+    """
+    ranges = []
+    for value in header.split(','):
+        if not value.strip():
+            continue
+        range = parse_media_range(value)
+        if range is not None:
+            ranges.append(range)
+    return ranges
+
+
+def parse_supported(values):
+    """
+    Parse a list of supported types into a list of (value, MediaRange) tuples,
+    as used by best_match. Types that cannot be parsed never match.
+    """
+    supported = []
+    for value in values:
+        range = parse_media_range(value)
+        if range is not None:
+            supported.append((value, range))
+    return supported
+
+
+def best_match(supported, ranges):
+    """
+    Return the best of the supported types for the parsed header ranges, or ''
+    if there is no acceptable type.
+
+    The supported types are a list of (value, MediaRange) tuples, as returned
+    by parse_supported, in order of decreasing preference. The first of the
+    equally good matches is chosen.
+    """
+    best, best_score = '', None
+    for value, range in supported:
+        score = range.fitness(ranges)
+        if best_score is None or score > best_score:
+            best, best_score = value, score
+    if best_score is None or not best_score[1]:
+        return ''
+    return best
+
+
+_ENVIRON_KEYS = {'accept': 'HTTP_ACCEPT', 'content-type': 'CONTENT_TYPE'}
+
+
+def header_ranges(request, name):
+    """
+    Return the parsed media ranges of the request's 'accept' or 'content-type'
+    header, parsing the header at most once per request.
+    """
+    environ = request.environ
+    header = environ.get(_ENVIRON_KEYS[name]) or ''
+    key = 'restish.negotiation.%s' % (name,)
+    cached = environ.get(key)
+    if cached is not None and cached[0] == header:
+        return cached[1]
+    ranges = parse_header(header)
+    environ[key] = (header, ranges)
+    return ranges
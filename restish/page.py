@@ -2,24 +2,154 @@
 Page resource.
 """
 
+import binascii
 import inspect
+import os
+import threading
+from multiprocessing.pool import ThreadPool, TimeoutError
 
 from restish import resource
+from restish.cache import TTLCache
 
 
 _RESTISH_ELEMENT = 'restish_element'
+_RESTISH_ELEMENT_PREFETCH = 'restish_element_prefetch'
+_RESTISH_ELEMENT_CACHE = 'restish_element_cache'
+_RESTISH_ELEMENT_NAMESPACE = 'restish_element_namespace'
 
 
-def element(name):
+# Marker for an element that has not been rendered yet.
+_NOT_RENDERED = object()
+
+
+# Number of threads, shared by all pages, used to prefetch elements.
+PREFETCH_THREADS = 8
+
+_prefetch_pool = None
+_prefetch_pool_lock = threading.Lock()
+
+
+def element(name, prefetch=False, cache=None):
     """
     Decorator to mark a method as an element factory.
+
+    If prefetch is True then the element is created, and rendered, in the
+    background when the page starts rendering, see ElementMixin.prefetch.
+
+    If a cache, a FragmentCache, is given then the element's rendering, i.e.
+    the result of calling it with just the request, is reused across
+    requests. The element itself is only created if it's needed for something
+    else.
     """
     def decorator(func):
         setattr(func, _RESTISH_ELEMENT, name)
+        setattr(func, _RESTISH_ELEMENT_PREFETCH, prefetch)
+        setattr(func, _RESTISH_ELEMENT_CACHE, cache)
         return func
     return decorator
 
 
+class FragmentCache(object):
+    """
+    Cache of rendered elements, shared across requests.
+
+    Renderings are cached by element factory (the module, class and name of
+    the decorated method), absolute element name and, if vary is given, the
+    value returned by calling vary(request), e.g. the user's language. They
+    expire after ttl seconds, if given, and the least recently used are
+    discarded when there are more than maxsize.
+
+    Any backend with get(key), set(key, value, ttl) and delete(key) methods
+    can be used in place of the default cache.TTLCache, including one shared
+    by several processes. The keys are tuples and the values are the rendered
+    elements and, for ('generation', name) keys, the element's current
+    generation, which is set with a ttl of None and should not expire.
+    """
+
+    def __init__(self, ttl=None, vary=None, maxsize=256, backend=None):
+        if backend is None:
+            backend = TTLCache(maxsize)
+        self.ttl = ttl
+        self.vary = vary
+        self.backend = backend
+        # Namespaces of the factories seen for each element name, to find the
+        # renderings to invalidate.
+        self._namespaces = {}
+
+    def key(self, request, name, factory=None):
+        """
+        Return the key of the element's rendering for the request.
+
+        Invalidating all of an element's renderings changes its generation,
+        which is part of the key, rather than finding the renderings.
+        """
+        namespace = getattr(factory, _RESTISH_ELEMENT_NAMESPACE, None)
+        namespaces = self._namespaces.get(name)
+        if namespaces is None:
+            namespaces = self._namespaces.setdefault(name, set())
+        namespaces.add(namespace)
+        return self._key(request, name, namespace)
+
+    def _key(self, request, name, namespace):
+        if self.vary is None:
+            vary = None
+        else:
+            vary = self.vary(request)
+        return (namespace, name, self._generation(name), vary)
+
+    def _generation(self, name):
+        key = ('generation', name)
+        generation = self.backend.get(key)
+        if generation is None:
+            # A new, random generation, rather than a count, so renderings
+            # from before the generation was lost can never match.
+            generation = self._new_generation(name)
+        return generation
+
+    def _new_generation(self, name):
+        generation = binascii.hexlify(os.urandom(8))
+        self.backend.set(('generation', name), generation, None)
+        return generation
+
+    def get(self, key):
+        """
+        Return the cached rendering, or None.
+        """
+        return self.backend.get(key)
+
+    def set(self, key, rendered):
+        """
+        Cache the rendering.
+        """
+        self.backend.set(key, rendered, self.ttl)
+
+    def invalidate(self, name, request=None, factory=None):
+        """
+        Forget the element's rendering for the request or, if no request is
+        given, all of the element's renderings, in all processes sharing the
+        backend.
+
+        A rendering for a request is forgotten for the given factory, e.g.
+        MyPage.nav, or for each of the element's factories used by this
+        process.
+        """
+        if request is None:
+            self._new_generation(name)
+            return
+        if factory is not None:
+            namespaces = [getattr(factory, _RESTISH_ELEMENT_NAMESPACE, None)]
+        else:
+            namespaces = list(self._namespaces.get(name, [None]))
+        for namespace in namespaces:
+            self.backend.delete(self._key(request, name, namespace))
+
+    def clear(self):
+        """
+        Forget all the renderings.
+        """
+        self.backend.clear()
+
+
 class _metaPage(resource._metaResource):
     def __new__(cls, name, bases, clsattrs):
         cls = resource._metaResource.__new__(cls, name, bases, clsattrs)
@@ -40,6 +170,7 @@ def _gather_element_factories(cls, clsattrs):
     of name to callable.
     """
     cls.element_factories = dict(getattr(cls, 'element_factories', {}))
+    prefetch_elements = list(getattr(cls, 'prefetch_elements', []))
     for (name, callable) in clsattrs.iteritems():
         if not inspect.isroutine(callable):
             continue
@@ -47,6 +178,13 @@ def _gather_element_factories(cls, clsattrs):
         if element is None:
             continue
         cls.element_factories[name] = callable
+        if getattr(callable, _RESTISH_ELEMENT_NAMESPACE, None) is None:
+            setattr(callable, _RESTISH_ELEMENT_NAMESPACE,
+                    '%s.%s.%s' % (cls.__module__, cls.__name__, name))
+        if getattr(callable, _RESTISH_ELEMENT_PREFETCH, False) and \
+                name not in prefetch_elements:
+            prefetch_elements.append(name)
+    cls.prefetch_elements = prefetch_elements
 
 
 class ElementMixin(object):
@@ -56,6 +194,15 @@ class ElementMixin(object):
 
     element_name = None
 
+    # Names of the elements to prefetch, see prefetch(). Elements whose
+    # factory is decorated with @element(name, prefetch=True) are added
+    # automatically.
+    prefetch_elements = []
+
+    # Seconds to wait for a prefetched element, or None to wait for as long as
+    # it takes.
+    prefetch_timeout = None
+
     def element(self, request, name):
         """
         Locate an element by name.
@@ -64,17 +211,56 @@ class ElementMixin(object):
         the same object is returned if the element is located again later.
         """
         cache = _element_cache(request, self)
-        try:
-            element = cache[name]
-        except KeyError:
+        element = cache.get(name)
+        if element is None:
             try:
                 factory = self.element_factories[name]
             except KeyError:
                 raise ElementNotFound(name)
-            element = cache[name] = factory(self, request)
+            # Prefetched elements look up their own elements on other
+            # threads, so the first element cached wins.
+            element = cache.setdefault(name, _create_element(self, request,
+                                                             name, factory))
+        if isinstance(element, _Prefetch):
+            element = cache[name] = element.get(name)
         element.element_name = _element_name(self.element_name, name)
         return element
 
+    def prefetch(self, request, names=None):
+        """
+        Start creating and rendering the named elements, by default those
+        listed in prefetch_elements, concurrently on a bounded pool of
+        PREFETCH_THREADS threads.
+
+        Each element is created by calling its factory and, if it's a callable
+        Element, rendered by calling it with the request. The element is then
+        added to the element cache and element() waits, for up to
+        prefetch_timeout seconds, for it to be ready. Calling the element
+        with just the request returns the prefetched rendering.
+
+        Prefetched elements run in other threads so their factories, and the
+        elements themselves, must not rely on thread-local state. Any state
+        they share through the request's environ must be set up before
+        calling prefetch; render_page builds the templating args before
+        prefetching the page's elements.
+        """
+        if names is None:
+            names = self.prefetch_elements
+        if not names:
+            return
+        cache = _element_cache(request, self)
+        pool = _get_prefetch_pool()
+        for name in names:
+            if name in cache:
+                continue
+            try:
+                factory = self.element_factories[name]
+            except KeyError:
+                raise ElementNotFound(name)
+            result = pool.apply_async(_prefetch, (self, request, name,
+                                                  factory))
+            cache[name] = _Prefetch(result, self.prefetch_timeout)
+
 
 class Page(ElementMixin, resource.Resource):
     """ Define a base Page type that includes elements """
@@ -90,6 +276,135 @@ class ElementNotFound(Exception):
     pass
 
 
+class ElementTimeout(Exception):
+    """
+    A prefetched element was not ready in time.
+    """
+
+
+class _Prefetch(object):
+    """
+    Placeholder, in the element cache, for an element being prefetched.
+    """
+
+    def __init__(self, result, timeout):
+        self.result = result
+        self.timeout = timeout
+
+    def get(self, name):
+        try:
+            return self.result.get(self.timeout)
+        except TimeoutError:
+            raise ElementTimeout(name)
+
+
+class _RenderedElement(Element):
+    """
+    Stand-in for an element that remembers its rendering, i.e. the result of
+    calling it with just the request.
+
+    The rendering may already be known, e.g. from a FragmentCache, in which
+    case the actual element is only created, by calling factory, if something
+    else is needed of it. Otherwise, the element is rendered when first
+    called and store is called with the rendering.
+
+    Everything else is passed on to the actual element.
+    """
+
+    def __init__(self, element=None, factory=None, rendered=_NOT_RENDERED,
+                 store=None):
+        object.__setattr__(self, '_element', element)
+        object.__setattr__(self, '_factory', factory)
+        object.__setattr__(self, '_rendered', rendered)
+        object.__setattr__(self, '_store', store)
+        object.__setattr__(self, '_attrs', {})
+
+    def __call__(self, request, *a, **k):
+        if a or k:
+            return self._get_element()(request, *a, **k)
+        rendered = self._rendered
+        if rendered is _NOT_RENDERED:
+            rendered = self._get_element()(request)
+            object.__setattr__(self, '_rendered', rendered)
+            if self._store is not None:
+                self._store(rendered)
+        return rendered
+
+    def _get_element(self):
+        element = self._element
+        if element is None:
+            element = self._factory()
+            for name, value in self._attrs.iteritems():
+                setattr(element, name, value)
+            object.__setattr__(self, '_element', element)
+        return element
+
+    def __getattribute__(self, name):
+        if name.startswith('_') and name in _RENDERED_ELEMENT_ATTRS:
+            return object.__getattribute__(self, name)
+        # Avoid creating the element just to read back an attribute.
+        if self._element is None and name in self._attrs:
+            return self._attrs[name]
+        return getattr(self._get_element(), name)
+
+    def __setattr__(self, name, value):
+        if self._element is None:
+            self._attrs[name] = value
+        else:
+            setattr(self._element, name, value)
+
+
+_RENDERED_ELEMENT_ATTRS = set(['_element', '_factory', '_rendered', '_store',
+                               '_attrs', '_get_element', '__class__'])
+
+
+def _create_element(parent, request, name, factory):
+    """
+    Create the element, or a stand-in for it if the element's rendering is
+    cached across requests.
+    """
+    cache = getattr(factory, _RESTISH_ELEMENT_CACHE, None)
+    if cache is None:
+        return factory(parent, request)
+    key = cache.key(request, _element_name(parent.element_name, name), factory)
+    rendered = cache.get(key)
+    if rendered is not None:
+        return _RenderedElement(factory=lambda: factory(parent, request),
+                                rendered=rendered)
+    element = factory(parent, request)
+    if isinstance(element, Element) and callable(element):
+        return _RenderedElement(element,
+                                store=lambda rendered: cache.set(key, rendered))
+    return element
+
+
+def _prefetch(parent, request, name, factory):
+    """
+    Create, and render if possible, an element, returning the object to put
+    in the element cache.
+    """
+    element = _create_element(parent, request, name, factory)
+    element.element_name = _element_name(parent.element_name, name)
+    if not isinstance(element, _RenderedElement):
+        if not (isinstance(element, Element) and callable(element)):
+            return element
+        element = _RenderedElement(element)
+    element(request)
+    return element
+
+
+def _get_prefetch_pool():
+    global _prefetch_pool
+    if _prefetch_pool is None:
+        _prefetch_pool_lock.acquire()
+        try:
+            if _prefetch_pool is None:
+                _prefetch_pool = ThreadPool(PREFETCH_THREADS)
+        finally:
+            _prefetch_pool_lock.release()
+    return _prefetch_pool
+
+
 def _element_name(parent_name, child_name):
     """
     Return the new, abosolute element name
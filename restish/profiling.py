@@ -0,0 +1,255 @@
+"""
+Request profiling.
+
+A Profiler passed to the application, RestishApp(root,
+profiler=Profiler(sink)), times the phases of each request and sends the
+timings to the sink once the response has been sent. The phases are:
+
+* request - creating the http.Request
+* traverse - each resource_child hop while locating the resource
+* negotiate - choosing a Resource's handler method
+* handler - calling a Resource's handler method, including any rendering
+* render - rendering a template (elements are timed separately from, but also
+  as part of, the page they are rendered in)
+* stream - iterating the response's app_iter until it is closed
+* total - the whole request, including streaming
+
+A sink is any object with a record(environ, timings) method, where timings is
+a list of (phase, seconds) tuples in the order the phases finished. MemorySink,
+StatsdSink and LogSink are provided.
+"""
+
+import logging
+import socket
+import threading
+import time
+import types
+
+
+# The key for the request's Timings in the WSGI environ.
+ENVIRON_KEY = 'restish.profile'
+
+
+class Timings(object):
+    """
+    Timings of the phases of a single request.
+    """
+
+    __slots__ = ['timer', 'started', 'timings']
+
+    def __init__(self, timer=time.time):
+        self.timer = timer
+        self.started = timer()
+        self.timings = []
+
+    def add(self, phase, start):
+        """
+        Record the time taken by the phase since start, a value returned by
+        the timer.
+        """
+        self.timings.append((phase, self.timer() - start))
+
+
+def timings(request):
+    """
+    Return the request's Timings, or None if the request is not profiled.
+    """
+    return request.environ.get(ENVIRON_KEY)
+
+
+class Profiler(object):
+    """
+    Profile requests, sending the timings of each request to the sink.
+
+    :arg sink:
+        Object to record the timings, see MemorySink, StatsdSink and LogSink.
+    :arg timer:
+        Optional function that returns the time in seconds.
+    """
+
+    def __init__(self, sink, timer=time.time):
+        self.sink = sink
+        self.timer = timer
+
+    def start(self, environ):
+        """
+        Start profiling the request, returning its Timings.
+        """
+        timings = environ[ENVIRON_KEY] = Timings(self.timer)
+        return timings
+
+    def finish(self, environ, app_iter):
+        """
+        Return an app_iter that times the response's app_iter and records the
+        request's timings once it is closed.
+
+        An app_iter created by the server's wsgi.file_wrapper is returned
+        as-is, with its close method replaced, so the server can still send
+        the file its own way, e.g. using sendfile. If the wrapper does not
+        allow that, profiling the request stops the server from recognising
+        the wrapper.
+        """
+        profiled = _ProfiledAppIter(self, environ, app_iter)
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if isinstance(file_wrapper, (type, types.ClassType)) and \
+                isinstance(app_iter, file_wrapper):
+            try:
+                app_iter.close = profiled.close
+            except (AttributeError, TypeError):
+                pass
+            else:
+                return app_iter
+        return profiled
+
+    def record(self, environ, timings):
+        """
+        Record the request's total time and send the timings to the sink.
+        """
+        timings.add('total', timings.started)
+        self.sink.record(environ, timings.timings)
+
+
+class _ProfiledAppIter(object):
+
+    def __init__(self, profiler, environ, app_iter):
+        self.profiler = profiler
+        self.environ = environ
+        self.app_iter = app_iter
+        # The app_iter's own close, which Profiler.finish may replace.
+        self._close = getattr(app_iter, 'close', None)
+        self.timings = environ[ENVIRON_KEY]
+        self.start = self.timings.timer()
+
+    def __iter__(self):
+        return iter(self.app_iter)
+
+    def close(self):
+        try:
+            if self._close is not None:
+                self._close()
+        finally:
+            self.timings.add('stream', self.start)
+            self.profiler.record(self.environ, self.timings)
+
+
+class Histogram(object):
+    """
+    Counts of the times taken by a phase, in buckets of milliseconds.
+    """
+
+    # Upper bounds, in milliseconds, of the buckets. The last bucket has no
+    # upper bound.
+    bounds = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.buckets = [0] * (len(self.bounds) + 1)
+
+    def add(self, seconds):
+        ms = seconds * 1000
+        self.count += 1
+        self.total += ms
+        if self.min is None or ms < self.min:
+            self.min = ms
+        if self.max is None or ms > self.max:
+            self.max = ms
+        for i, bound in enumerate(self.bounds):
+            if ms <= bound:
+                break
+        else:
+            i = len(self.bounds)
+        self.buckets[i] += 1
+
+    def stats(self):
+        """
+        Return a dict of the histogram's statistics, in milliseconds.
+        """
+        return {'count': self.count, 'total': self.total, 'min': self.min,
+                'max': self.max,
+                'mean': self.count and self.total / self.count or 0.0,
+                'buckets': zip(self.bounds + [None], self.buckets)}
+
+
+class MemorySink(object):
+    """
+    Sink that keeps a Histogram per phase in memory.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def record(self, environ, timings):
+        self._lock.acquire()
+        try:
+            for phase, seconds in timings:
+                histogram = self.histograms.get(phase)
+                if histogram is None:
+                    histogram = self.histograms[phase] = Histogram()
+                histogram.add(seconds)
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        """
+        Return a dict of each phase's histogram statistics.
+        """
+        return dict((phase, histogram.stats())
+                    for (phase, histogram) in self.histograms.iteritems())
+
+    def clear(self):
+        """
+        Forget all the timings.
+        """
+        self._lock.acquire()
+        try:
+            self.histograms.clear()
+        finally:
+            self._lock.release()
+
+
+class StatsdSink(object):
+    """
+    Sink that sends the timings to a statsd server, using its UDP line
+    protocol, as one packet per request.
+
+    Errors sending the packet are ignored; profiling should never break the
+    application.
+    """
+
+    def __init__(self, host='127.0.0.1', port=8125, prefix='restish'):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def record(self, environ, timings):
+        lines = ['%s.%s:%.3f|ms' % (self.prefix, phase, seconds * 1000)
+                 for (phase, seconds) in timings]
+        try:
+            self.socket.sendto('\n'.join(lines), self.address)
+        except socket.error:
+            pass
+
+
+class LogSink(object):
+    """
+    Sink that logs a line per request, listing the time, in milliseconds, of
+    each phase.
+    """
+
+    def __init__(self, logger=None, level=logging.INFO):
+        if logger is None:
+            logger = logging.getLogger('restish.profiling')
+        self.logger = logger
+        self.level = level
+
+    def record(self, environ, timings):
+        self.logger.log(self.level, '%s %s%s %s',
+                        environ.get('REQUEST_METHOD'),
+                        environ.get('SCRIPT_NAME', ''),
+                        environ.get('PATH_INFO', ''),
+                        ' '.join(['%s=%.3fms' % (phase, seconds * 1000)
+                                  for (phase, seconds) in timings]))
@@ -0,0 +1,268 @@
+"""
+Byte range requests, i.e. answering a GET that includes a Range header with a
+206 Partial Content response containing only the requested parts of the body,
+so clients can resume interrupted downloads.
+
+RestishApp(root, ranges=True) passes every GET and HEAD response through
+range_response. Ranges are served from bodies that can be sliced, or seeked,
+without reading the bytes before the range: a str (or list of strs) and a
+seekable file-like object, including an mmap. Other bodies, e.g. generators,
+are always sent in full.
+
+A single range is sent as the 206 response's body; several ranges are sent as
+a multipart/byteranges body. A Range header that cannot be satisfied gets a
+416 Requested Range Not Satisfiable response. The If-Range header is compared
+with the response's ETag or Last-Modified header, sending the whole body if
+the client's copy is out of date.
+"""
+
+import binascii
+import os
+import re
+
+from restish import http
+from restish.conditional import parse_http_date
+
+
+# The most ranges served from one request. A Range header with more than
+# this, after overlapping ranges are merged, is ignored and the whole body is
+# sent.
+MAX_RANGES = 32
+
+_BYTE_RANGES = re.compile(r'^\s*bytes\s*=(.*)$', re.I)
+_BYTE_RANGE_SPEC = re.compile(r'^\s*(\d*)\s*-\s*(\d*)\s*$')
+
+
+def range_response(request, response):
+    """
+    Return a 206 Partial Content or 416 Requested Range Not Satisfiable
+    response in place of response if the request has a Range header that can
+    be served from the response's body, otherwise return response.
+
+    Only successful GET and HEAD responses are considered, and HEAD responses
+    are never ranged, only advertised. Accept-Ranges: bytes is added to GET
+    responses whose bodies can be ranged and to HEAD responses with a
+    Content-Length, unless the response already has an Accept-Ranges header.
+    A response with Accept-Ranges: none is never ranged.
+    """
+    if request.method not in ('GET', 'HEAD') or response.status_int != 200:
+        return response
+    headers = response.headers
+    accept_ranges = headers.get('Accept-Ranges')
+    if request.method == 'HEAD':
+        if accept_ranges is None and 'Content-Length' in headers:
+            headers['Accept-Ranges'] = 'bytes'
+        return response
+    if accept_ranges is not None and accept_ranges.lower() != 'bytes':
+        return response
+    body = _range_body(response)
+    if body is None:
+        return response
+    if accept_ranges is None:
+        headers['Accept-Ranges'] = 'bytes'
+    header = request.environ.get('HTTP_RANGE')
+    if not header or not body.length or not if_range(request, response):
+        return response
+    ranges = parse_range(header, body.length)
+    if ranges is None or len(ranges) > MAX_RANGES:
+        return response
+    if not ranges:
+        body.close()
+        return http.requested_range_not_satisfiable(body.length)
+    headers = [(name, value) for (name, value) in response.headerlist
+               if name.lower() not in ('content-length', 'content-range')]
+    if len(ranges) == 1:
+        start, stop = ranges[0]
+        headers.extend([
+            ('Content-Range', _content_range(start, stop, body.length)),
+            ('Content-Length', str(stop - start))])
+        return http.partial_content(headers,
+                                    _RangeIter(body, [('', start, stop)]))
+    return _multipart_response(headers, body, ranges)
+
+
+def parse_range(header, length):
+    """
+    Parse a Range header into a list of (start, stop) byte offsets, stop being
+    exclusive, of a body of length bytes.
+
+    Overlapping and adjacent ranges are merged. None is returned if the header
+    is malformed, or not for byte ranges, and an empty list if none of the
+    ranges can be satisfied.
+    """
+    match = _BYTE_RANGES.match(header)
+    if match is None:
+        return None
+    ranges = []
+    specs = 0
+    for spec in match.group(1).split(','):
+        if not spec.strip():
+            continue
+        match = _BYTE_RANGE_SPEC.match(spec)
+        if match is None:
+            return None
+        specs += 1
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            if last:
+                if int(last) < start:
+                    return None
+                stop = min(int(last) + 1, length)
+            else:
+                stop = length
+        elif last:
+            start, stop = max(length - int(last), 0), length
+        else:
+            return None
+        if start < stop:
+            ranges.append((start, stop))
+    if not specs:
+        return None
+    ranges.sort()
+    merged = ranges[:1]
+    for start, stop in ranges[1:]:
+        if start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(stop, merged[-1][1]))
+        else:
+            merged.append((start, stop))
+    return merged
+
+
+def if_range(request, response):
+    """
+    Test if the request's If-Range header, if any, matches the response's
+    validator, i.e. if the requested ranges may be sent.
+
+    Entity tags use the strong comparison function, so weak tags never match.
+    """
+    value = request.environ.get('HTTP_IF_RANGE')
+    if not value:
+        return True
+    value = value.strip()
+    if value.startswith('"') or value.startswith('W/'):
+        etag = response.headers.get('ETag')
+        return etag is not None and not value.startswith('W/') and \
+                value == etag.strip()
+    last_modified = response.headers.get('Last-Modified')
+    if last_modified is None:
+        return False
+    since = parse_http_date(value)
+    return since is not None and since == parse_http_date(last_modified)
+
+
+def _multipart_response(headers, body, ranges):
+    boundary = binascii.hexlify(os.urandom(16))
+    content_type = None
+    for i, (name, value) in enumerate(headers):
+        if name.lower() == 'content-type':
+            content_type = value
+            del headers[i]
+            break
+    parts = []
+    content_length = 0
+    for start, stop in ranges:
+        part_headers = ['\r\n--%s\r\n' % (boundary,)]
+        if content_type is not None:
+            part_headers.append('Content-Type: %s\r\n' % (content_type,))
+        part_headers.append('Content-Range: %s\r\n\r\n' %
+                            (_content_range(start, stop, body.length),))
+        part_headers = ''.join(part_headers)
+        parts.append((part_headers, start, stop))
+        content_length += len(part_headers) + stop - start
+    end = '\r\n--%s--\r\n' % (boundary,)
+    content_length += len(end)
+    headers.extend([
+        ('Content-Type', 'multipart/byteranges; boundary=%s' % (boundary,)),
+        ('Content-Length', str(content_length))])
+    return http.partial_content(headers, _RangeIter(body, parts, end))
+
+
+def _content_range(start, stop, length):
+    return 'bytes %d-%d/%d' % (start, stop - 1, length)
+
+
+def _range_body(response):
+    """
+    Return a body, providing the length of the response's body and random
+    access to its bytes, or None if the body cannot be ranged cheaply.
+    """
+    app_iter = response.app_iter
+    if isinstance(app_iter, (list, tuple)):
+        return _StrBody(''.join(app_iter))
+    if not isinstance(app_iter, http.FileIter):
+        return None
+    file = app_iter.file
+    if not hasattr(file, 'seek'):
+        return None
+    try:
+        offset = file.tell()
+        content_length = response.headers.get('Content-Length')
+        if content_length is not None:
+            length = int(content_length)
+        else:
+            file.seek(0, 2)
+            length = file.tell() - offset
+            file.seek(offset)
+    except (IOError, OSError, ValueError):
+        return None
+    return _FileBody(app_iter, offset, length)
+
+
+class _StrBody(object):
+
+    def __init__(self, data):
+        self.data = data
+        self.length = len(data)
+
+    def read(self, start, stop):
+        yield self.data[start:stop]
+
+    def close(self):
+        pass
+
+
+class _FileBody(object):
+
+    def __init__(self, file_iter, offset, length):
+        self.file_iter = file_iter
+        self.offset = offset
+        self.length = length
+
+    def read(self, start, stop):
+        file, block_size = self.file_iter.file, self.file_iter.block_size
+        file.seek(self.offset + start)
+        remaining = stop - start
+        while remaining > 0:
+            data = file.read(min(block_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+    def close(self):
+        self.file_iter.close()
+
+
+class _RangeIter(object):
+    """
+    app_iter of the ranges of a body, each preceded by a str of part headers
+    and the last followed by end.
+    """
+
+    def __init__(self, body, parts, end=''):
+        self.body = body
+        self.parts = parts
+        self.end = end
+
+    def __iter__(self):
+        for part_headers, start, stop in self.parts:
+            if part_headers:
+                yield part_headers
+            for data in self.body.read(start, stop):
+                yield data
+        if self.end:
+            yield self.end
+
+    def close(self):
+        self.body.close()
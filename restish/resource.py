@@ -4,9 +4,9 @@ Base Resource class and associates methods for children and content negotiation
 
 import mimetypes
 import re
-import mimeparse
 
-from restish import http
+from restish import conditional, http, negotiation, profiling
+from restish.cache import LRUCache
 
 
 _RESTISH_CHILD = "restish_child"
@@ -14,6 +14,10 @@ _RESTISH_METHOD = "restish_method"
 _RESTISH_MATCH = "restish_match"
 
 
+# Marker for a dispatcher cache miss (None means "no acceptable dispatcher").
+_UNCACHED = object()
+
+
 SHORT_CONTENT_TYPE_EXTRA = {
         'json': 'application/json',
         }
@@ -27,6 +31,8 @@ class _metaResource(type):
         cls = type.__new__(cls, name, bases, clsattrs)
         _gather_request_dispatchers(cls, clsattrs)
         _gather_child_factories(cls, clsattrs)
+        cls.dispatcher_cache = LRUCache(
+            getattr(cls, 'dispatcher_cache_size', 0))
         return cls
 
 
@@ -41,7 +47,7 @@ def _gather_request_dispatchers(cls, clsattrs):
         method = getattr(wrapper, _RESTISH_METHOD, None)
         match = getattr(wrapper, _RESTISH_MATCH)
         request_dispatchers.setdefault(method, []).append(
-            (wrapper.func, match))
+            Dispatcher(wrapper.func, match))
     # Append any handlers that were added by base classes.
     for method, dispatchers in getattr(cls, 'request_dispatchers', {}).iteritems():
         request_dispatchers.setdefault(method, []).extend(dispatchers)
@@ -88,13 +94,66 @@ class MethodDecorator(object):
             content_type = [content_type]
         accept = [_normalise_mimetype(a) for a in accept]
         content_type = [_normalise_mimetype(a) for a in content_type]
-        self.match = {'accept': accept, 'content_type': content_type}
+        # Parse the types now to avoid doing it during content negotiation.
+        parsed = {'accept': negotiation.parse_supported(accept),
+                  'content_type': negotiation.parse_supported(content_type)}
+        self.match = {'accept': accept, 'content_type': content_type,
+                      'parsed': parsed}
 
     def __call__(self, func):
-        wrapper = ResourceMethodWrapper(func)
-        setattr(wrapper, _RESTISH_METHOD, self.method)
-        setattr(wrapper, _RESTISH_MATCH, self.match)
-        return wrapper
+        return ResourceMethodWrapper(func, self.method, self.match)
+
+
+class Dispatcher(object):
+    """
+    A request handler, i.e. a @resource.GET etc -decorated function, and the
+    content negotiation data it was decorated with.
+
+    Dispatchers are created once, when the Resource class is created, so that
+    dispatching a request to the handler needs no further work.
+    """
+
+    __slots__ = ['func', 'match']
+
+    def __init__(self, func, match):
+        self.func = func
+        self.match = match
+
+    def __repr__(self):
+        return '<Dispatcher %r>' % (self.func,)
+
+    def __call__(self, resource, request):
+        """
+        Call the handler method of the resource and complete the response.
+        """
+        return self.complete(request, self.func(resource, request))
+
+    def complete(self, request, response):
+        """
+        Complete the handler's response, autocompleting the content-type
+        header if it was not set explicitly.
+        """
+        # If the best match if not a wildcard then we know what content-type
+        # should be.
+        if isinstance(response, http.Response) and \
+                not response.headers.get('content-type'):
+            best_match = self.negotiated_type(request)
+            if '*' not in best_match:
+                response.headers['content-type'] = best_match
+        return response
+
+    def negotiated_type(self, request):
+        """
+        Return the best of the handler's types for the request's Accept header.
+        """
+        # If there's no accept from the client and there's only one possible
+        # type from the match then use that as the best match. Otherwise use
+        # content negotiation to work out what the best match was.
+        match = self.match
+        ranges = negotiation.header_ranges(request, 'accept')
+        if not ranges and len(match['accept']) == 1:
+            return match['accept'][0]
+        return negotiation.best_match(match['parsed']['accept'], ranges)
 
 
 class ResourceMethodWrapper(object):
@@ -110,20 +169,21 @@ class ResourceMethodWrapper(object):
     a whole suite of dispatchers to worry about.
     """
 
-    def __init__(self, func):
+    def __init__(self, func, method=None, match=None):
         self.func = func
+        setattr(self, _RESTISH_METHOD, method)
+        setattr(self, _RESTISH_MATCH, match)
+        self._method = method
+        self._dispatchers = [Dispatcher(func, match)]
 
     def __call__(self, request):
-        # Extract annotations.
-        method = getattr(self, _RESTISH_METHOD)
-        match = getattr(self, _RESTISH_MATCH)
         # Check for correct method.
-        if request.method != method:
-            return http.method_not_allowed([method])
+        if request.method != self._method:
+            return http.method_not_allowed([self._method])
         # Look for a dispatcher.
-        dispatcher = _best_dispatcher([(self.func, match)], request)
+        dispatcher = _best_dispatcher(self._dispatchers, request)
         if dispatcher is not None:
-            return _dispatch(request, match, self.func)
+            return dispatcher.complete(request, self.func(request))
         # No dispatcher.
         return http.not_acceptable([('Content-Type', 'text/plain')], \
                                    '406 Not Acceptable')
@@ -183,6 +243,11 @@ class Resource(object):
 
     __metaclass__ = _metaResource
 
+    # Maximum number of (method, content type, accept) combinations whose
+    # negotiated dispatcher is remembered by the class's dispatcher_cache.
+    # Set to 0 to disable the cache.
+    dispatcher_cache_size = 128
+
     def resource_child(self, request, segments):
         for matcher, func in self.child_factories:
             match = matcher(request, segments)
@@ -190,14 +255,7 @@ class Resource(object):
                 break
         else:
             return None
-        match_args, match_kwargs, segments = match
-        result = func(self, request, segments, *match_args, **match_kwargs)
-        if result is None:
-            return None
-        elif isinstance(result, tuple):
-            return result
-        else:
-            return result, segments
+        return _call_child_factory(self, request, func, match)
 
     def __call__(self, request):
         # Get the dispatchers for the request method.
@@ -205,11 +263,22 @@ class Resource(object):
         # No dispatchers for method, send 405 with list of allowed methods.
         if dispatchers is None:
             return http.method_not_allowed(', '.join(self.request_dispatchers))
+        timings = request.environ.get(profiling.ENVIRON_KEY)
+        if timings is not None:
+            start = timings.timer()
         # Look up the best dispatcher
-        dispatcher = _best_dispatcher(dispatchers, request)
+        dispatcher = _best_dispatcher(dispatchers, request,
+                                      self.dispatcher_cache)
+        if timings is not None:
+            timings.add('negotiate', start)
         if dispatcher is not None:
-            (callable, match) = dispatcher
-            return _dispatch(request, match, lambda r: callable(self, r))
+            if timings is None:
+                return dispatcher(self, request)
+            start = timings.timer()
+            try:
+                return dispatcher(self, request)
+            finally:
+                timings.add('handler', start)
         # No match, send 406
         return http.not_acceptable([('Content-Type', 'text/plain')], \
                                    '406 Not Acceptable')
@@ -226,80 +295,138 @@ class Resource(object):
 
         In that scenario add a HEAD-decorated method to the application
         resource's class that includes a Content-Length header but no body.
+        Alternatively, define a head_headers(request) method that returns the
+        list of headers for a 200 OK response, or None to fall back to the GET
+        behaviour. head_headers is only called if the request is acceptable to
+        one of the GET methods, otherwise the response is 406 Not Acceptable.
+
+        The GET response's body is never iterated. If it's an iterator with a
+        close() method it is closed, as the WSGI server would have done. If
+        it's a list of strs, its ETag is left for conditional_response, so
+        the HEAD response has the same validators as the GET response.
         """
+        head_headers = getattr(self, 'head_headers', None)
+        if head_headers is not None:
+            request.method = 'GET'
+            try:
+                content_type = negotiated_type(self, request)
+            finally:
+                request.method = 'HEAD'
+            if content_type is None:
+                return http.not_acceptable([('Content-Type', 'text/plain')], \
+                                           '406 Not Acceptable')
+            headers = head_headers(request)
+            if headers is not None:
+                return http.ok(headers, None)
         request.method = 'GET'
-        # Loop until we get an actual response to support resource forwarding.
-        response = self(request)
-        while not isinstance(response, http.Response):
-            response = response(request)
+        try:
+            # Loop until we get an actual response to support resource
+            # forwarding.
+            response = self(request)
+            while not isinstance(response, http.Response):
+                response = response(request)
+        finally:
+            # Later stages, e.g. compression, must still see a HEAD request.
+            request.method = 'HEAD'
         content_length = response.headers.get('content-length')
+        app_iter = response.app_iter
+        if isinstance(app_iter, (list, tuple)) and \
+                'etag' not in response.headers:
+            request.environ[conditional.HEAD_ETAG_KEY] = \
+                    conditional.strong_etag(app_iter)
+        close = getattr(app_iter, 'close', None)
+        if close is not None:
+            close()
         response.body = ''
         if content_length is not None:
             response.headers['content-length'] = content_length
         return response
 
 
-def _dispatch(request, match, func):
-    response = func(request)
-    # Try to autocomplete the content-type header if not set
-    # explicitly.
-    # If there's no accept from the client and there's only one
-    # possible type from the match then use that as the best match.
-    # Otherwise use mimeparse to work out what the best match was. If
-    # the best match if not a wildcard then we know what content-type
-    # should be.
-    if isinstance(response, http.Response) and \
-            not response.headers.get('content-type'):
-        accept = str(request.accept)
-        if not accept and len(match['accept']) == 1:
-            best_match = match['accept'][0]
-        else:
-            # XXX mimeparse picks *last* matching item so we reverse.
-            best_match = mimeparse.best_match(match['accept'][::-1], accept)
-        if '*' not in best_match:
-            response.headers['content-type'] = best_match
-    return response
+def _call_child_factory(resource, request, func, match):
+    """
+    Call the child factory with the matcher's result, returning a (resource,
+    remaining segments) tuple or None.
+    """
+    match_args, match_kwargs, segments = match
+    result = func(resource, request, segments, *match_args, **match_kwargs)
+    if result is None:
+        return None
+    elif isinstance(result, tuple):
+        return result
+    else:
+        return result, segments
+
+
+def negotiated_type(resource, request):
+    """
+    Return the content type that calling the Resource would negotiate for the
+    request, or None if no method would be dispatched to.
+
+    The type may be a wildcard, e.g. '*/*', if that's what the method accepts.
+    """
+    dispatchers = resource.request_dispatchers.get(request.method)
+    if dispatchers is None:
+        return None
+    dispatcher = _best_dispatcher(dispatchers, request,
+                                  resource.dispatcher_cache)
+    if dispatcher is None:
+        return None
+    return dispatcher.negotiated_type(request)
 
 
-def _best_dispatcher(dispatchers, request):
+def _best_dispatcher(dispatchers, request, cache=None):
     """
     Find the best dispatcher for the request.
+
+    If a cache (see cache.LRUCache) is given then the position of the chosen
+    dispatcher is remembered for the request's combination of method, media
+    type (the Content-Type header without its parameters, e.g. a multipart
+    boundary) and Accept header, skipping the content negotiation next time.
     """
+    if cache is not None:
+        content_type = request.environ.get('CONTENT_TYPE')
+        if content_type:
+            content_type = content_type.split(';', 1)[0].strip().lower()
+        key = (request.method, content_type,
+               request.environ.get('HTTP_ACCEPT'))
+        index = cache.get(key, _UNCACHED)
+        if index is None:
+            return None
+        elif index is not _UNCACHED:
+            return dispatchers[index]
     # Use content negotation to filter the dispatchers to an ordered list of
     # only those that match.
-    content_type = request.headers.get('content-type')
-    if content_type:
-        dispatchers = _filter_dispatchers_on_content_type(dispatchers,
-                                                          str(content_type))
-    accept = str(request.accept)
-    if accept:
-        dispatchers = _filter_dispatchers_on_accept(dispatchers, accept)
+    matching = dispatchers
+    ranges = negotiation.header_ranges(request, 'content-type')
+    if ranges:
+        matching = _filter_dispatchers_on_match(matching, 'content_type',
+                                                ranges)
+    ranges = negotiation.header_ranges(request, 'accept')
+    if ranges:
+        matching = _filter_dispatchers_on_match(matching, 'accept', ranges)
     # Return the best match or None
-    if dispatchers:
-        return dispatchers[0]
+    if matching:
+        best = matching[0]
     else:
-        return None
-
-
-def _filter_dispatchers_on_content_type(dispatchers, content_type):
-    return _filter_dispatchers_on_match(dispatchers, 'content_type', content_type)
-
-
-def _filter_dispatchers_on_accept(dispatchers, accept):
-    return _filter_dispatchers_on_match(dispatchers, 'accept', accept)
+        best = None
+    if cache is not None:
+        if best is None:
+            cache.set(key, None)
+        else:
+            cache.set(key, [d is best for d in dispatchers].index(True))
+    return best
 
 
-def _filter_dispatchers_on_match(dispatchers, match, value):
-    # Build an ordered list of the supported types.
+def _filter_dispatchers_on_match(dispatchers, match, ranges):
+    # Build an ordered list of the supported (pre-parsed) types.
     supported = []
     for d in dispatchers:
-        supported.extend(d[1][match])
+        supported.extend(d.match['parsed'][match])
     # Find the best match
-    # XXX mimeparse picks *last* matching item so we reverse.
-    supported.reverse()
-    best_match = mimeparse.best_match(supported, value)
+    best_match = negotiation.best_match(supported, ranges)
     # Return the matching dispatchers
-    return [d for d in dispatchers if best_match in d[1][match]]
+    return [d for d in dispatchers if best_match in d.match[match]]
 
 
 def child(matcher=None):
@@ -377,3 +504,142 @@ class AnyChildMatcher(object):
 
 
 any = AnyChildMatcher()
+
+
+class _TrieNode(object):
+    """
+    Node of a ChildRouter's segment trie.
+    """
+
+    __slots__ = ['static', 'dynamic', 'factories']
+
+    def __init__(self):
+        self.static = {}
+        self.dynamic = None
+        self.factories = []
+
+
+class ChildRouter(object):
+    """
+    Compiled form of a Resource class's child factories.
+
+    Every TemplateChildMatcher pattern is added to a trie of path segments:
+    static segments are dict lookups and {dynamic} segments are wildcard edges,
+    so finding a child costs O(depth) rather than a regex match per factory.
+    Any other matcher (including templates with partially dynamic segments,
+    e.g. 'page-{n}') is tried in its usual order of precedence.
+
+    A ChildRouter is used exactly like Resource.resource_child, except that the
+    resource is passed explicitly.
+    """
+
+    def __init__(self, child_factories):
+        self.root = _TrieNode()
+        self.factories = list(child_factories)
+        self.others = []
+        for index, (matcher, func) in enumerate(self.factories):
+            if not self._add(index, matcher):
+                self.others.append((index, matcher, func))
+
+    def _add(self, index, matcher):
+        """
+        Add the matcher to the trie, returning False if it cannot be compiled.
+        """
+        if not isinstance(matcher, TemplateChildMatcher):
+            return False
+        node, names = self.root, []
+        for depth, segment in enumerate(matcher.pattern.split('/')):
+            if _is_dynamic_segment(segment):
+                names.append((depth, segment[1:-1]))
+                if node.dynamic is None:
+                    node.dynamic = _TrieNode()
+                node = node.dynamic
+            elif '{' in segment or '}' in segment:
+                return False
+            else:
+                node = node.static.setdefault(segment, _TrieNode())
+        node.factories.append((index, depth + 1, names))
+        return True
+
+    def _lookup(self, segments):
+        """
+        Return the (index, depth, names) of the highest precedence template
+        matching the segments, or None.
+        """
+        best = None
+        nodes = [self.root]
+        for segment in segments:
+            next_nodes = []
+            for node in nodes:
+                child = node.static.get(segment)
+                if child is not None:
+                    next_nodes.append(child)
+                if node.dynamic is not None:
+                    next_nodes.append(node.dynamic)
+            if not next_nodes:
+                break
+            for node in next_nodes:
+                for factory in node.factories:
+                    if best is None or factory[0] < best[0]:
+                        best = factory
+            nodes = next_nodes
+        return best
+
+    def __call__(self, resource, request, segments):
+        # A template's regex can match across an (unquoted) '/' inside a
+        # segment, which the trie cannot; such paths are rare enough to just
+        # take the slow route.
+        for segment in segments:
+            if '/' in segment:
+                return resource.resource_child(request, segments)
+        best = self._lookup(segments)
+        # Any uncompiled matchers that take precedence must be tried first.
+        for index, matcher, func in self.others:
+            if best is not None and index > best[0]:
+                break
+            match = matcher(request, segments)
+            if match is not None:
+                return _call_child_factory(resource, request, func, match)
+        if best is None:
+            return None
+        index, depth, names = best
+        match_kwargs = dict((name, segments[i]) for (i, name) in names)
+        func = self.factories[index][1]
+        return _call_child_factory(resource, request, func,
+                                   ([], match_kwargs, segments[depth:]))
+
+
+def _is_dynamic_segment(segment):
+    """
+    Test if the template segment is in the form {name}.
+    """
+    return len(segment) >= 2 and segment[0] == '{' and segment[-1] == '}' \
+            and '{' not in segment[1:-1] and '}' not in segment[1:-1]
+
+
+def child_router(obj):
+    """
+    Return the (cached) ChildRouter for obj, or None if obj is not a Resource
+    using the default resource_child implementation.
+    """
+    cls = obj.__class__
+    if not isinstance(obj, Resource) or \
+            cls.resource_child.im_func is not Resource.resource_child.im_func:
+        return None
+    router = cls.__dict__.get('_child_router')
+    if router is None:
+        router = cls._child_router = ChildRouter(cls.child_factories)
+    return router
+
+
+def compile_child_routes(cls=Resource):
+    """
+    Build the ChildRouter of cls and all of its currently defined subclasses
+    up front, so the first requests do not pay the compilation cost.
+
+    Classes defined later are still compiled on first use.
+    """
+    if cls.resource_child.im_func is Resource.resource_child.im_func:
+        cls._child_router = ChildRouter(cls.child_factories)
+    for subclass in cls.__subclasses__():
+        compile_child_routes(subclass)
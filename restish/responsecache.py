@@ -0,0 +1,151 @@
+"""
+Server-side cache of complete GET responses.
+
+A ResponseCache is passed to the application, RestishApp(root,
+response_cache=ResponseCache()), and remembers the status, headers and body
+of successful GET responses so hot, read-only resources are not rendered again
+for every request.
+
+Responses are cached for as long as their Cache-Control header's s-maxage or
+max-age allows. Responses that are private, must not be stored, set cookies or
+are streamed are never cached.
+
+The cache is shared by all clients so, following the rules for shared caches
+(RFC 7234, section 3.2), requests with credentials, i.e. an Authorization
+header or a Cookie header the cache does not vary on, only use, and store,
+responses that are explicitly public or have an s-maxage. This also stops
+the cache from bypassing a guard for clients without the credentials.
+"""
+
+import re
+
+from restish import cache, http
+from restish.resource import Resource, negotiated_type
+
+
+_NOT_CACHEABLE = re.compile(r'(?:^|,)\s*(?:no-store|no-cache|private)\b',
+                            re.I)
+_MAX_AGE = re.compile(r'(?:^|,)\s*(s-maxage|max-age)\s*=\s*"?(\d+)', re.I)
+_SHARED = re.compile(r'(?:^|,)\s*(?:public\b|s-maxage\s*=)', re.I)
+
+
+class ResponseCache(object):
+    """
+    Cache of GET responses, keyed on the request path and query, the content
+    type negotiated by the resource and the values of any extra request
+    headers the responses vary on.
+
+    The storage is provided by a backend, an in-process cache.TTLCache by
+    default. Shared backends, e.g. memcached, need only provide get(key,
+    default) and set(key, value, ttl) methods, and clear() if the cache is to
+    be cleared. The keys are tuples of strs (or None) and the values are
+    (status, headers, body, shared) tuples, shared being True if the response
+    may be used for requests with credentials.
+
+    :arg backend:
+        Optional storage, defaults to a cache.TTLCache of maxsize responses.
+    :arg vary:
+        Optional list of the names of request headers that responses depend
+        on, in addition to the Accept header.
+    :arg max_age:
+        Optional number of seconds to cache responses without a max-age, by
+        default they are not cached.
+    :arg maxsize:
+        Optional size of the default backend.
+    """
+
+    def __init__(self, backend=None, vary=None, max_age=None, maxsize=1024):
+        if backend is None:
+            backend = cache.TTLCache(maxsize)
+        self.backend = backend
+        self.vary = [name.lower() for name in (vary or [])]
+        self.max_age = max_age
+        self._vary_keys = ['HTTP_' + name.upper().replace('-', '_')
+                           for name in self.vary]
+
+    def __call__(self, request, resource, get_response):
+        """
+        Return the cached response for the request to resource, or call
+        get_response(request, resource), caching the response if possible.
+        """
+        if request.method != 'GET' or isinstance(resource, http.Response):
+            return get_response(request, resource)
+        key = self.key(request, resource)
+        if key is None:
+            return get_response(request, resource)
+        credentials = self.has_credentials(request)
+        cached = self.backend.get(key, None)
+        if cached is not None:
+            status, headers, body, shared = cached
+            if shared or not credentials:
+                return http.Response(status, list(headers), body)
+        response = get_response(request, resource)
+        ttl = self.ttl(response)
+        if ttl:
+            shared = bool(_SHARED.search(
+                response.headers.get('Cache-Control', '')))
+            if shared or not credentials:
+                self.backend.set(key, (response.status, response.headerlist,
+                                       ''.join(response.app_iter), shared),
+                                 ttl)
+        return response
+
+    def has_credentials(self, request):
+        """
+        Test if the request has credentials that the response may depend on
+        but that are not part of the cache key.
+        """
+        environ = request.environ
+        if environ.get('HTTP_AUTHORIZATION'):
+            return True
+        return bool(environ.get('HTTP_COOKIE')) and 'cookie' not in self.vary
+
+    def key(self, request, resource):
+        """
+        Return the cache key for the request to resource, or None if the
+        request should not be cached.
+        """
+        environ = request.environ
+        if isinstance(resource, Resource):
+            content_type = negotiated_type(resource, request)
+            if content_type is None:
+                return None
+        else:
+            content_type = environ.get('HTTP_ACCEPT')
+        key = (environ.get('SCRIPT_NAME', ''), environ.get('PATH_INFO', ''),
+               environ.get('QUERY_STRING', ''), content_type)
+        if self._vary_keys:
+            key += tuple([environ.get(name) for name in self._vary_keys])
+        return key
+
+    def ttl(self, response):
+        """
+        Return the number of seconds to cache the response for, or None if it
+        should not be cached.
+        """
+        if response.status_int != 200:
+            return None
+        if not isinstance(response.app_iter, (list, tuple)):
+            return None
+        headers = response.headers
+        if 'Set-Cookie' in headers:
+            return None
+        for name in headers.get('Vary', '').split(','):
+            name = name.strip().lower()
+            if name and name != 'accept' and name not in self.vary:
+                return None
+        cache_control = headers.get('Cache-Control')
+        if cache_control:
+            if _NOT_CACHEABLE.search(cache_control):
+                return None
+            max_ages = dict((name.lower(), int(value)) for (name, value)
+                            in _MAX_AGE.findall(cache_control))
+            if max_ages:
+                return max_ages.get('s-maxage', max_ages.get('max-age'))
+        return self.max_age
+
+    def clear(self):
+        """
+        Remove all responses from the cache.
+        """
+        self.backend.clear()
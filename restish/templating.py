@@ -2,10 +2,16 @@
 Templating support.
 """
 
-from restish import http, url, util
-from restish.page import Element
+from restish import http, profiling, url, util
+from restish.page import Element, ElementMixin
 
 
+# WSGI environ keys of the request-scoped templating args.
+_URLS_KEY = 'restish.templating.urls'
+_ARGS_KEY = 'restish.templating.args'
+_ARGS_BUILT_KEY = 'restish.templating.args_built'
+_ARGS_COPIED_KEY = 'restish.templating.args_copied'
+
 class Templating(object):
 
     def __init__(self, renderer):
@@ -17,23 +23,45 @@ class Templating(object):
         """
         return self.renderer(template, args, encoding=encoding)
 
+    def stream(self, request, template, args=None, encoding=None):
+        """
+        Render the template and args as an iterator of chunks, optionally
+        encoding each chunk to a byte string.
+
+        Renderers that can generate their output in chunks provide a stream
+        method, taking the same args as the renderer itself. Otherwise, the
+        template is rendered in one go and returned as a single chunk.
+        """
+        stream = getattr(self.renderer, 'stream', None)
+        if stream is None:
+            return [self.render(request, template, args, encoding=encoding)]
+        return stream(template, args, encoding=encoding)
+
     def args(self, request):
         """
         Return a dict of args that should always be present.
+
+        The args are built once per request, see args_built, and shared by
+        all the templates rendered for the request. Each render still gets
+        its own shallow copy of the dict, see args_copied, to add its own args
+        to, including a new 'element' function for each element or page
+        rendered. If element_args or page_args are overridden they are called
+        for every element or page rendered instead.
         """
-        return {'urls': url.URLAccessor(request)}
+        if request is None:
+            return {'urls': url.URLAccessor(request)}
+        urls = request.environ.get(_URLS_KEY)
+        if urls is None:
+            urls = request.environ.setdefault(_URLS_KEY,
+                                              url.URLAccessor(request))
+        return {'urls': urls}
 
     def element_args(self, request, element):
         """
         Return a dict of args that should be present when rendering elements.
         """
-        def page_element(name):
-            E = element.element(request, name)
-            if isinstance(E, Element):
-                E = util.RequestBoundCallable(E, request)
-            return E
         args = self.args(request)
-        args['element'] = page_element
+        args['element'] = _element_lookup(request, element)
         return args
 
     def page_args(self, request, page):
@@ -60,10 +88,10 @@ def render(request, template, args={}, encoding=None):
     # Lookup the templating implementation.
     templating = request.environ['restish.templating']
     # Combine common args with those passed in.
-    args_ = templating.args(request)
+    args_ = _request_args(templating, request)
     args_.update(args)
     # Return the rendered template.
-    return templating.render(request, template, args_, encoding=encoding)
+    return _render(templating, request, template, args_, encoding)
 
 
 def render_element(request, element, template, args={}):
@@ -82,13 +110,18 @@ def render_element(request, element, template, args={}):
     # Lookup the templating implementation.
     templating = request.environ['restish.templating']
     # Combine common element args with those passed in.
-    args_ = templating.element_args(request, element)
+    if _overridden(templating, 'element_args'):
+        args_ = templating.element_args(request, element)
+    else:
+        args_ = _request_args(templating, request)
+        args_['element'] = _element_lookup(request, element)
     args_.update(args)
     # Return the rendered template.
-    return templating.render(request, template, args=args_)
+    return _render(templating, request, template, args_, None)
 
 
-def render_page(request, page, template, args={}, encoding='utf-8'):
+def render_page(request, page, template, args={}, encoding='utf-8',
+                stream=False):
     """
     Render a page using the template and args.
 
@@ -102,24 +135,112 @@ def render_page(request, page, template, args={}, encoding='utf-8'):
         Dictionary of args to pass to the template renderer.
     :arg encoding:
         Optional encoding of output, default to 'utf-8'.
+    :arg stream:
+        Optionally return an iterator of rendered chunks, see
+        Templating.stream.
     """
     # Lookup the templating implementation.
     templating = request.environ['restish.templating']
     # Combine common page args with those passed in.
-    args_ = templating.page_args(request, page)
+    if _overridden(templating, 'page_args') or \
+            _overridden(templating, 'element_args'):
+        args_ = templating.page_args(request, page)
+    else:
+        args_ = _request_args(templating, request)
+        args_['element'] = _element_lookup(request, page)
     args_.update(args)
+    # Start any slow elements off in the background, now the args they share
+    # with the page are built.
+    if isinstance(page, ElementMixin):
+        page.prefetch(request)
     # Return the rendered template.
-    return templating.render(request, template, args=args_, encoding=encoding)
+    return _render(templating, request, template, args_, encoding, stream)
+
+
+def args_built(request):
+    """
+    Return the number of times the common args have been built for the
+    request.
+    """
+    return request.environ.get(_ARGS_BUILT_KEY, 0)
+
+
+def args_copied(request):
+    """
+    Return the number of copies of the common args made for the request, one
+    for each render that used them.
+    """
+    return request.environ.get(_ARGS_COPIED_KEY, 0)
+
+
+def _request_args(templating, request):
+    """
+    Return a copy of the templating's common args for the request, building
+    them at most once per request.
+    """
+    environ = request.environ
+    built = environ.get(_ARGS_KEY)
+    if built is None or built[0] is not templating:
+        built = (templating, templating.args(request))
+        environ[_ARGS_KEY] = built
+        environ[_ARGS_BUILT_KEY] = environ.get(_ARGS_BUILT_KEY, 0) + 1
+    environ[_ARGS_COPIED_KEY] = environ.get(_ARGS_COPIED_KEY, 0) + 1
+    return dict(built[1])
+
+
+def _overridden(templating, name):
+    """
+    Test if the templating's class overrides the Templating method.
+    """
+    return getattr(templating.__class__, name).im_func is not \
+            getattr(Templating, name).im_func
+
+
+def _element_lookup(request, element):
+    """
+    Return the 'element' arg, a function to look up one of element's
+    elements.
+    """
+    def page_element(name):
+        E = element.element(request, name)
+        if isinstance(E, Element):
+            E = util.RequestBoundCallable(E, request)
+        return E
+    return page_element
+
+
+def _render(templating, request, template, args, encoding, stream=False):
+    """
+    Render, or stream, the template, timing it if the request is being
+    profiled.
+    """
+    if stream:
+        render = templating.stream
+    else:
+        render = templating.render
+    timings = request.environ.get(profiling.ENVIRON_KEY)
+    if timings is None:
+        return render(request, template, args=args, encoding=encoding)
+    start = timings.timer()
+    try:
+        return render(request, template, args=args, encoding=encoding)
+    finally:
+        timings.add('render', start)
 
 
 def render_response(request, page, template, args={},
                     type='text/html', encoding='utf-8',
-                    headers=[]):
+                    headers=[], stream=False):
     """
     Render a page, using the template and args, and return a '200 OK'
     response.  The response's Content-Type header will be constructed from
     the type and encoding.
 
+    If stream is True then the response's body is the iterator of chunks
+    returned by Templating.stream, so the start of the page can be sent to the
+    client before the rest has been rendered. Note that errors that happen
+    after the first chunk can no longer change the response's status.
+
     :arg request:
         Request instance.
     :arg page:
@@ -134,6 +255,8 @@ def render_response(request, page, template, args={},
         Optional encoding of output, default to 'utf-8'.
     :arg headers:
         Optional extra HTTP headers for the output, default to []
+    :arg stream:
+        Optionally stream the rendered page, default to False.
     """
     # Copy the headers to avoid changing the arg default or the list passed by
     # the caller.
@@ -141,10 +264,10 @@ def render_response(request, page, template, args={},
     headers.extend([('Content-Type', '%s; charset=%s' % (type, encoding))])
     return http.ok(headers,
                    render_page(request, page, template, args,
-                               encoding=encoding))
+                               encoding=encoding, stream=stream))
 
 
-def page(template, type='text/html', encoding='utf-8'):
+def page(template, type='text/html', encoding='utf-8', stream=False):
     """
     Convenience decorator that calls render_response, passing the dict
     returned from calling the decorated method as the template 'args'.
@@ -164,6 +287,8 @@ def page(template, type='text/html', encoding='utf-8'):
         Optional mime type of content, defaults to 'text/html'
     :arg encoding:
         Optional encoding of output, default to 'utf-8'.
+    :arg stream:
+        Optionally stream the rendered page, default to False.
     """
     def decorator(func):
         def decorated(page, request, *a, **k):
@@ -175,7 +300,8 @@ def page(template, type='text/html', encoding='utf-8'):
             else:
                 headers, args = [], result
             return render_response(request, page, template, args, type=type,
-                                   encoding=encoding, headers=headers)
+                                   encoding=encoding, headers=headers,
+                                   stream=stream)
         return decorated
     return decorator
 
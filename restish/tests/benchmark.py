@@ -0,0 +1,194 @@
+"""
+Micro-benchmarks for restish's hot paths.
+
+Run all the benchmarks, or just those named on the command line, with:
+
+    python -m restish.tests.benchmark [name ...]
+"""
+
+import gc
+import sys
+import timeit
+
+from restish import http, negotiation, resource, url
+
+
+def bench(name, func, number=10000):
+    """
+    Time func and print the cost per call in microseconds.
+    """
+    best = min(timeit.repeat(func, number=number, repeat=3))
+    print '%-40s %8.2f usec' % (name, best / number * 1e6)
+
+
+def count_calls(func):
+    """
+    Return the number of function calls, both Python and builtin, made by
+    calling func.
+    """
+    calls = [0]
+    def profile(frame, event, arg):
+        if event in ('call', 'c_call'):
+            calls[0] += 1
+    sys.setprofile(profile)
+    try:
+        func()
+    finally:
+        sys.setprofile(None)
+    # Don't count the call to setprofile.
+    return calls[0] - 1
+
+
+def count_allocations(func):
+    """
+    Return the approximate number of garbage collected objects (functions,
+    closures, cells, dicts, instances, etc) allocated by calling func.
+
+    Python 2 has no allocation tracing, so this samples the collector's count
+    of new objects at every function call and return and adds up the
+    increases. Objects allocated and freed between two samples are missed.
+    """
+    allocations = [0, None]
+    def profile(frame, event, arg):
+        count = gc.get_count()[0]
+        if allocations[1] is not None and count > allocations[1]:
+            allocations[0] += count - allocations[1]
+        allocations[1] = gc.get_count()[0]
+    gc.collect()
+    gc.disable()
+    sys.setprofile(profile)
+    try:
+        func()
+    finally:
+        sys.setprofile(None)
+        gc.enable()
+    return allocations[0]
+
+
+def benchmark_negotiation():
+    """
+    Compare accept negotiation using mimeparse on the raw header strings with
+    the pre-parsed media ranges.
+    """
+    import mimeparse
+    class Resource(resource.Resource):
+        @resource.GET(accept=['text/html', 'application/xhtml+xml'])
+        def html(self, request):
+            pass
+        @resource.GET(accept='json')
+        def json(self, request):
+            pass
+        @resource.GET(accept='xml')
+        def xml(self, request):
+            pass
+        @resource.GET(accept='text/plain')
+        def text(self, request):
+            pass
+    dispatchers = Resource.request_dispatchers['GET']
+    accept = 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8'
+    def filter_on_match(dispatchers, match, value):
+        supported = []
+        for d in dispatchers:
+            supported.extend(d.match[match])
+        supported.reverse()
+        best_match = mimeparse.best_match(supported, value)
+        return [d for d in dispatchers if best_match in d.match[match]]
+    def mimeparse_match():
+        request = http.Request.blank('/', headers={'Accept': accept})
+        matching = dispatchers
+        content_type = request.headers.get('content-type')
+        if content_type:
+            matching = filter_on_match(matching, 'content_type',
+                                       str(content_type))
+        if str(request.accept):
+            matching = filter_on_match(matching, 'accept', str(request.accept))
+        return matching[0]
+    def negotiation_match():
+        request = http.Request.blank('/', headers={'Accept': accept})
+        return resource._best_dispatcher(dispatchers, request)
+    def request_only():
+        http.Request.blank('/', headers={'Accept': accept})
+    assert mimeparse_match() == negotiation_match()
+    bench('negotiation: mimeparse', mimeparse_match)
+    bench('negotiation: pre-parsed', negotiation_match)
+    bench('negotiation: (request creation only)', request_only)
+
+
+def benchmark_dispatch():
+    """
+    Compare dispatching a request to a Resource's handler through a lambda,
+    as Resource.__call__ used to, with calling the precompiled Dispatcher.
+    """
+    class Resource(resource.Resource):
+        @resource.GET(accept='text/html')
+        def html(self, request):
+            return None
+    class LambdaResource(Resource):
+        def __call__(self, request):
+            dispatchers = self.request_dispatchers.get(request.method)
+            dispatcher = resource._best_dispatcher(dispatchers, request,
+                                                   self.dispatcher_cache)
+            (callable, match) = dispatcher.func, dispatcher.match
+            return self._dispatch(request, dispatcher,
+                                  lambda r: callable(self, r))
+        def _dispatch(self, request, dispatcher, func):
+            return dispatcher.complete(request, func(request))
+    request = http.Request.blank('/', headers={'Accept': 'text/html'})
+    for name, res in [('lambda', LambdaResource()),
+                      ('Dispatcher', Resource())]:
+        func = lambda: res(request)
+        func()
+        bench('dispatch: %s' % (name,), func, number=100000)
+        print '%-40s %8d' % ('dispatch: %s, calls' % (name,),
+                             count_calls(func))
+        print '%-40s %8d' % ('dispatch: %s, allocations' % (name,),
+                             count_allocations(func))
+
+
+def benchmark_url():
+    """
+    Compare building many child URLs, with a query arg, by re-parsing the base
+    URL each time with using URL.child and URL.add_query.
+    """
+    base = url.URL('http://localhost/app/items/')
+    ids = [str(i) for i in range(100)]
+    def reparsing():
+        for id in ids:
+            u = url.URL(str(base))
+            path = url.join_path(url.split_path(u.path)[:-1] + [id])
+            u = u.clone(path=path, query=None, fragment=None)
+            u = url.URL(str(u))
+            u.clone(query=url.join_query(url.split_query(u.query) +
+                                         [('format', 'json')]))
+    def deriving():
+        for id in ids:
+            base.child(id).add_query('format', 'json')
+    bench('url: 100 x child+add_query, re-parsing', reparsing, number=1000)
+    bench('url: 100 x child+add_query', deriving, number=1000)
+
+
+def benchmark_url_children():
+    """
+    Compare building many child URLs one at a time with URL.children.
+    """
+    base = url.URL('http://localhost/app/items/')
+    ids = [str(i) for i in range(1000)]
+    def child_loop():
+        [base.child(id) for id in ids]
+    def children():
+        base.children(ids)
+    bench('url: 1000 x child', child_loop, number=100)
+    bench('url: children(1000)', children, number=100)
+
+
+def main(names):
+    benchmarks = sorted((name[len('benchmark_'):], func)
+                        for (name, func) in globals().items()
+                        if name.startswith('benchmark_'))
+    for name, func in benchmarks:
+        if not names or name in names:
+            func()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -27,6 +27,14 @@ class TestApp(unittest.TestCase):
         R = webtest.TestApp(A).get('/', status=200)
         assert R.body == 'root'
 
+    def test_handle(self):
+        A = app.RestishApp(Resource('root', {'child': Resource('child')}))
+        response = A.handle(http.Request.blank('/child'))
+        assert isinstance(response, http.Response)
+        assert response.body == 'child'
+        response = A.handle(http.Request.blank('/missing'))
+        assert response.status_int == 404
+
     def test_not_found(self):
         A = app.RestishApp(resource.Resource())
         R = webtest.TestApp(A).get('/not_found', status=404)
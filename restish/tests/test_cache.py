@@ -0,0 +1,95 @@
+import unittest
+
+from restish import cache
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_get_set(self):
+        c = cache.LRUCache(2)
+        assert c.get('a') is None
+        assert c.get('a', 'default') == 'default'
+        c.set('a', 1)
+        assert c.get('a') == 1
+        assert (c.hits, c.misses) == (1, 2)
+
+    def test_eviction(self):
+        c = cache.LRUCache(2)
+        c.set('a', 1)
+        c.set('b', 2)
+        c.get('a')
+        c.set('c', 3)
+        assert 'a' in c and 'c' in c and 'b' not in c
+
+    def test_discard_oldest(self):
+        c = cache.LRUCache(16)
+        for i in range(16):
+            c.set(i, i)
+        c.get(0)
+        c.set(16, 16)
+        assert len(c) == 14
+        assert [i for i in range(17) if i in c] == [0] + range(4, 17)
+        assert c.get(1) is None and c.get(16) == 16
+
+    def test_disabled(self):
+        c = cache.LRUCache(0)
+        c.set('a', 1)
+        assert len(c) == 0
+
+
+class TestTTLCache(unittest.TestCase):
+
+    def test_expires(self):
+        now = [0]
+        c = cache.TTLCache(10, ttl=10, timer=lambda: now[0])
+        c.set('a', 1)
+        c.set('b', 2, ttl=20)
+        now[0] = 9
+        assert (c.get('a'), c.get('b')) == (1, 2)
+        now[0] = 10
+        assert (c.get('a'), c.get('b')) == (None, 2)
+        now[0] = 20
+        assert c.get('b') is None
+        assert (c.hits, c.misses) == (3, 2)
+
+    def test_no_ttl(self):
+        c = cache.TTLCache(1)
+        c.set('a', 1)
+        assert c.get('a') == 1
+        c.set('b', 2)
+        assert c.get('a') is None
+
+
+class TestBoundedMemo(unittest.TestCase):
+
+    def test_memo(self):
+        calls = []
+        def func(arg):
+            calls.append(arg)
+            return arg * 2
+        memo = cache.BoundedMemo(func, maxsize=2)
+        assert [memo(1), memo(1), memo(2)] == [2, 2, 4]
+        assert calls == [1, 2]
+        assert memo.stats() == {'hits': 1, 'misses': 2, 'size': 2,
+                                'maxsize': 2, 'hit_rate': 1 / 3.0}
+
+    def test_bounded(self):
+        memo = cache.BoundedMemo(lambda arg: arg, maxsize=2)
+        for i in range(5):
+            memo(i)
+            assert len(memo) <= 2
+
+    def test_none_result(self):
+        memo = cache.BoundedMemo(lambda arg: None)
+        assert memo(1) is None
+        assert memo(1) is None
+        assert memo.hits == 1
+
+    def test_disabled(self):
+        memo = cache.BoundedMemo(lambda arg: arg, maxsize=0)
+        assert memo(1) == 1
+        assert len(memo) == 0
+
+
+if __name__ == '__main__':
+    unittest.main()
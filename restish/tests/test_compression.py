@@ -0,0 +1,172 @@
+import gzip
+import StringIO
+import unittest
+import webtest
+import zlib
+
+from restish import app, cache, compression, http, resource
+
+
+BODY = '<p>%s</p>' % ('hello ' * 200,)
+
+
+def gunzip(data):
+    return gzip.GzipFile(fileobj=StringIO.StringIO(data)).read()
+
+
+class TestCompressor(unittest.TestCase):
+
+    def make_app(self, body, headers=None, content_type='text/html',
+                 compressor=None, **kw):
+        class Resource(resource.Resource):
+            @resource.GET()
+            def html(self, request):
+                return http.ok([('Content-Type', content_type)] +
+                               list(headers or []), body())
+        if compressor is None:
+            compressor = compression.Compressor(**kw)
+        return webtest.TestApp(app.RestishApp(Resource(),
+                                              compression=compressor))
+
+    def test_gzip(self):
+        A = self.make_app(lambda: BODY)
+        R = A.get('/', headers={'Accept-Encoding': 'gzip, deflate'}, status=200)
+        assert R.headers['Content-Encoding'] == 'gzip'
+        assert R.headers['Vary'] == 'Accept-Encoding'
+        assert R.headers['Content-Length'] == str(len(R.body))
+        assert len(R.body) < len(BODY)
+        assert gunzip(R.body) == BODY
+
+    def test_deflate(self):
+        A = self.make_app(lambda: BODY)
+        R = A.get('/', headers={'Accept-Encoding': 'gzip;q=0.5, deflate'}, status=200)
+        assert R.headers['Content-Encoding'] == 'deflate'
+        assert zlib.decompress(R.body) == BODY
+
+    def test_not_accepted(self):
+        A = self.make_app(lambda: BODY)
+        for accept_encoding in [None, 'identity', 'gzip;q=0, deflate;q=0', 'br',
+                                '*;q=0']:
+            headers = {}
+            if accept_encoding:
+                headers['Accept-Encoding'] = accept_encoding
+            R = A.get('/', headers=headers, status=200)
+            assert 'Content-Encoding' not in R.headers
+            assert R.headers['Vary'] == 'Accept-Encoding'
+            assert R.body == BODY
+        R = A.get('/', headers={'Accept-Encoding': '*'}, status=200)
+        assert R.headers['Content-Encoding'] == 'gzip'
+
+    def test_skipped(self):
+        for kw in [{'body': lambda: '<p>hello</p>'},
+                   {'body': lambda: BODY, 'content_type': 'image/png'},
+                   {'body': lambda: BODY, 'headers': [('Content-Encoding', 'br')]},
+                   {'body': lambda: BODY, 'headers': [('Cache-Control', 'public, no-transform')]}]:
+            A = self.make_app(**kw)
+            R = A.get('/', headers={'Accept-Encoding': 'gzip'}, status=200)
+            assert R.headers.get('Content-Encoding') in (None, 'br')
+            assert R.body == BODY or R.body == '<p>hello</p>'
+        A = self.make_app(lambda: BODY)
+        R = A.head('/', headers={'Accept-Encoding': 'gzip'}, status=200)
+        assert 'Content-Encoding' not in R.headers
+        assert R.headers['Vary'] == 'Accept-Encoding'
+        A = self.make_app(lambda: '<p>hello</p>')
+        R = A.head('/', headers={'Accept-Encoding': 'gzip'}, status=200)
+        assert 'Vary' not in R.headers
+
+    def test_compressible_type(self):
+        compressor = compression.Compressor()
+        assert compressor.compressible_type('text/html; charset=utf-8')
+        assert compressor.compressible_type('application/json')
+        assert not compressor.compressible_type('application/zip')
+        assert not compressor.compressible_type(None)
+        compressor = compression.Compressor(types=['application/x-custom'])
+        assert compressor.compressible_type('application/x-custom')
+        assert not compressor.compressible_type('text/html')
+
+    def test_existing_vary(self):
+        A = self.make_app(lambda: BODY, [('Vary', 'Cookie')])
+        R = A.get('/', headers={'Accept-Encoding': 'gzip'}, status=200)
+        assert R.headers['Vary'] == 'Cookie, Accept-Encoding'
+
+    def test_etag(self):
+        A = self.make_app(lambda: BODY, [('ETag', '"v1"')])
+        R = A.get('/', headers={'Accept-Encoding': 'gzip'}, status=200)
+        assert R.headers['ETag'] == 'W/"v1"'
+        R = A.get('/', status=200)
+        assert R.headers['ETag'] == '"v1"'
+
+    def test_level(self):
+        sizes = []
+        for level in [1, 9]:
+            A = self.make_app(lambda: BODY, level=level)
+            R = A.get('/', headers={'Accept-Encoding': 'gzip'}, status=200)
+            sizes.append(len(R.body))
+            assert gunzip(R.body) == BODY
+        assert sizes[1] <= sizes[0]
+
+    def test_streamed(self):
+        closed = []
+        class Body(object):
+            def __iter__(self):
+                for i in range(10):
+                    yield BODY
+            def close(self):
+                closed.append(True)
+        A = self.make_app(Body)
+        R = A.get('/', headers={'Accept-Encoding': 'gzip'}, status=200)
+        assert R.headers['Content-Encoding'] == 'gzip'
+        assert gunzip(R.body) == BODY * 10
+        assert closed == [True]
+
+    def test_stream_flush(self):
+        def body():
+            yield BODY
+            yield BODY
+        compressor = compression.Compressor()
+        request = http.Request.blank('/', headers={'Accept-Encoding': 'deflate'})
+        response = compressor(request, http.ok([('Content-Type', 'text/html')], body()))
+        assert response.headers['Content-Encoding'] == 'deflate'
+        assert 'Content-Length' not in response.headers
+        app_iter = iter(response.app_iter)
+        # Each chunk is flushed, so can be decompressed without waiting for
+        # the rest of the body.
+        decompressor = zlib.decompressobj()
+        assert decompressor.decompress(app_iter.next()) == BODY
+        assert decompressor.decompress(''.join(app_iter)) == BODY
+
+    def test_small_stream(self):
+        def body():
+            yield 'hello'
+        A = self.make_app(body, [('Content-Length', '5')])
+        R = A.get('/', headers={'Accept-Encoding': 'gzip'}, status=200)
+        assert 'Content-Encoding' not in R.headers
+        assert R.body == 'hello'
+
+    def test_cache(self):
+        compressor = compression.Compressor(cache=cache.LRUCache(10))
+        A = self.make_app(lambda: BODY, compressor=compressor)
+        R1 = A.get('/', headers={'Accept-Encoding': 'gzip'}, status=200)
+        R2 = A.get('/', headers={'Accept-Encoding': 'gzip'}, status=200)
+        R3 = A.get('/', headers={'Accept-Encoding': 'deflate'}, status=200)
+        assert R1.body == R2.body
+        assert zlib.decompress(R3.body) == BODY
+        assert compressor.cache.stats()['hits'] == 1
+        assert len(compressor.cache) == 2
+
+    def test_ranges(self):
+        class Resource(resource.Resource):
+            @resource.GET()
+            def html(self, request):
+                return http.ok([('Content-Type', 'text/html')], BODY)
+        A = webtest.TestApp(app.RestishApp(Resource(), ranges=True,
+            compression=compression.Compressor()))
+        R = A.get('/', headers={'Accept-Encoding': 'gzip'}, status=200)
+        assert 'Accept-Ranges' not in R.headers
+        R = A.get('/', headers={'Accept-Encoding': 'gzip', 'Range': 'bytes=0-9'}, status=206)
+        assert 'Content-Encoding' not in R.headers
+        assert R.body == BODY[:10]
+
+
+if __name__ == '__main__':
+    unittest.main()
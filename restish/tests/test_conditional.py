@@ -0,0 +1,132 @@
+import datetime
+import unittest
+import webtest
+
+from restish import app, conditional, http, resource
+
+
+class TestDecorator(unittest.TestCase):
+
+    def make_app(self, **kw):
+        calls = []
+        class Resource(resource.Resource):
+            @resource.GET()
+            @conditional.conditional(**kw)
+            def html(self, request):
+                calls.append(request)
+                return http.ok([('Content-Type', 'text/html')], '<p>hello</p>')
+        return webtest.TestApp(app.RestishApp(Resource())), calls
+
+    def test_etag(self):
+        A, calls = self.make_app(etag=lambda resource, request: 'abc')
+        R = A.get('/', status=200)
+        assert R.headers['ETag'] == '"abc"'
+        assert len(calls) == 1
+        R = A.get('/', headers={'If-None-Match': '"abc"'}, status=304)
+        assert R.headers['ETag'] == '"abc"'
+        assert R.body == ''
+        assert len(calls) == 1
+        A.get('/', headers={'If-None-Match': '"xyz"'}, status=200)
+        A.get('/', headers={'If-None-Match': '"xyz", W/"abc"'}, status=304)
+        A.get('/', headers={'If-None-Match': '*'}, status=304)
+        assert len(calls) == 2
+
+    def test_unknown_etag(self):
+        A, calls = self.make_app(etag=lambda resource, request: None)
+        R = A.get('/', headers={'If-None-Match': '*'}, status=200)
+        assert 'ETag' not in R.headers
+        assert len(calls) == 1
+
+    def test_last_modified(self):
+        modified = datetime.datetime(2009, 1, 2, 3, 4, 5)
+        A, calls = self.make_app(last_modified=lambda resource, request: modified)
+        R = A.get('/', status=200)
+        assert R.headers['Last-Modified'] == 'Fri, 02 Jan 2009 03:04:05 GMT'
+        A.get('/', headers={'If-Modified-Since': 'Fri, 02 Jan 2009 03:04:05 GMT'}, status=304)
+        A.get('/', headers={'If-Modified-Since': 'Sat, 03 Jan 2009 00:00:00 GMT'}, status=304)
+        A.get('/', headers={'If-Modified-Since': 'Thu, 01 Jan 2009 00:00:00 GMT'}, status=200)
+        A.get('/', headers={'If-Modified-Since': 'rubbish'}, status=200)
+        assert len(calls) == 3
+
+    def test_etag_takes_precedence(self):
+        A, calls = self.make_app(etag=lambda resource, request: 'abc',
+                                 last_modified=lambda resource, request: 0)
+        A.get('/', headers={'If-None-Match': '"xyz"',
+                            'If-Modified-Since': 'Fri, 02 Jan 2009 03:04:05 GMT'},
+              status=200)
+
+    def test_head(self):
+        A, calls = self.make_app(etag=lambda resource, request: 'abc')
+        A.head('/', headers={'If-None-Match': '"abc"'}, status=304)
+        assert not calls
+
+
+class TestApp(unittest.TestCase):
+
+    def make_app(self, body, headers=None):
+        class Resource(resource.Resource):
+            @resource.GET()
+            def html(self, request):
+                return http.ok([('Content-Type', 'text/html')] +
+                               list(headers or []), body)
+            @resource.POST()
+            def post(self, request):
+                return http.ok([('Content-Type', 'text/html')], body)
+        return webtest.TestApp(app.RestishApp(Resource(), conditional=True))
+
+    def test_automatic_etag(self):
+        A = self.make_app('<p>hello</p>', [('Cache-Control', 'max-age=60')])
+        R = A.get('/', status=200)
+        etag = R.headers['ETag']
+        assert etag == conditional.strong_etag('<p>hello</p>')
+        R = A.get('/', headers={'If-None-Match': etag}, status=304)
+        assert R.headers['ETag'] == etag
+        assert R.headers['Cache-Control'] == 'max-age=60'
+        assert 'Content-Type' not in R.headers
+        A.get('/', headers={'If-None-Match': '"other"'}, status=200)
+        A.post('/', headers={'If-None-Match': etag}, status=200)
+
+    def test_head(self):
+        A = self.make_app('<p>hello</p>')
+        etag = A.get('/', status=200).headers['ETag']
+        R = A.head('/', status=200)
+        assert R.headers['ETag'] == etag
+        A.head('/', headers={'If-None-Match': etag}, status=304)
+        A.head('/', headers={'If-None-Match': '"other"'}, status=200)
+
+    def test_existing_etag(self):
+        A = self.make_app('<p>hello</p>', [('ETag', '"v1"')])
+        assert A.get('/', status=200).headers['ETag'] == '"v1"'
+        A.get('/', headers={'If-None-Match': '"v1"'}, status=304)
+        A.head('/', headers={'If-None-Match': '"v1"'}, status=304)
+
+    def test_last_modified(self):
+        A = self.make_app('<p>hello</p>', [('Last-Modified', 'Fri, 02 Jan 2009 03:04:05 GMT')])
+        A.get('/', headers={'If-Modified-Since': 'Fri, 02 Jan 2009 03:04:05 GMT'}, status=304)
+        A.get('/', headers={'If-Modified-Since': 'Thu, 01 Jan 2009 00:00:00 GMT'}, status=200)
+
+    def test_streamed_body(self):
+        def body():
+            yield '<p>hello</p>'
+        A = self.make_app(body())
+        R = A.get('/', status=200)
+        assert 'ETag' not in R.headers
+
+
+class TestHelpers(unittest.TestCase):
+
+    def test_quote_etag(self):
+        assert conditional.quote_etag('abc') == '"abc"'
+        assert conditional.quote_etag('"abc"') == '"abc"'
+        assert conditional.quote_etag('W/"abc"') == 'W/"abc"'
+
+    def test_strong_etag(self):
+        assert conditional.strong_etag('ab') == conditional.strong_etag(['a', 'b'])
+
+    def test_http_date(self):
+        assert conditional.parse_http_date(conditional.http_date(1234567890)) == 1234567890
+        assert conditional.parse_http_date('rubbish') is None
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -113,6 +113,19 @@ class RendererTestMixin(object):
             'restish.templating': templating.Templating(self.renderer)})
         assert page(None, request).body == self.content('static', 'utf-8')
 
+    def test_page_stream(self):
+        @templating.page('dynamic', stream=True)
+        def page(page, request):
+            return {'foo': 'bar'}
+        request = http.Request.blank('/', environ={
+            'restish.templating': templating.Templating(self.renderer)})
+        response = page(None, request)
+        chunks = list(response.app_iter)
+        assert chunks
+        for chunk in chunks:
+            assert isinstance(chunk, str)
+        assert ''.join(chunks) == '<p>bar</p>'
+
 
 try:
     from restish.contrib import makorenderer
@@ -160,6 +173,54 @@ try:
             self.renderer = tempitarenderer.TempitaRenderer(
                 tempitarenderer.TempitaFileSystemLoader(self.tmpdir))
             self.add_content('dynamic', '<p>{{foo}}</p>')
+
+    class TestTempitaFileSystemLoader(unittest.TestCase):
+        def setUp(self):
+            self.tmpdir = tempfile.mkdtemp()
+            os.mkdir(os.path.join(self.tmpdir, 'sub'))
+            self.add_content('page', '{{inherit "base"}}page')
+            self.add_content('base', '<p>{{self.body}}</p>')
+            self.add_content('sub/other', '{{foo}}')
+            self.add_content('broken', '{{if}}')
+        def tearDown(self):
+            shutil.rmtree(self.tmpdir)
+        def add_content(self, name, content, mtime=None):
+            filename = os.path.join(self.tmpdir, name)
+            f = file(filename, 'w')
+            f.write(content)
+            f.close()
+            if mtime is not None:
+                os.utime(filename, (mtime, mtime))
+        def test_cache(self):
+            loader = tempitarenderer.TempitaFileSystemLoader(self.tmpdir)
+            template = loader.get_template('page')
+            assert template.substitute() == '<p>page</p>'
+            assert loader.get_template('/page') is template
+            assert loader.get_template('page').substitute() == '<p>page</p>'
+            assert loader.cache.stats()['size'] == 2
+            # Changes are not seen, by default.
+            self.add_content('page', 'changed')
+            assert loader.get_template('page') is template
+        def test_check_mtime(self):
+            loader = tempitarenderer.TempitaFileSystemLoader(self.tmpdir,
+                                                             check_mtime=True)
+            self.add_content('sub/other', 'old', 1000)
+            template = loader.get_template('sub/other')
+            assert loader.get_template('sub/other') is template
+            self.add_content('sub/other', 'new', 2000)
+            assert loader.get_template('sub/other').substitute() == 'new'
+        def test_disabled(self):
+            loader = tempitarenderer.TempitaFileSystemLoader(self.tmpdir,
+                                                             cache_size=0)
+            assert loader.get_template('page') is not loader.get_template('page')
+        def test_prewarm(self):
+            loader = tempitarenderer.TempitaFileSystemLoader(self.tmpdir,
+                                                             prewarm=True)
+            assert loader.cache.stats()['size'] == 3
+            assert os.path.join(self.tmpdir, 'sub', 'other') in loader.cache
+        def test_outside_directory(self):
+            loader = tempitarenderer.TempitaFileSystemLoader(self.tmpdir)
+            self.assertRaises(Exception, loader.get_template, '../page')
 except ImportError:
     warnings.warn('Skipping TempitaRenderer tests due to missing packages.', RuntimeWarning)
 
@@ -1,3 +1,5 @@
+import threading
+import time
 import unittest
 
 from restish import guard, http
@@ -97,6 +99,221 @@ class TestGuard(unittest.TestCase):
         self.assertRaises(http.UnauthorizedError, guard.GuardResource(Resource(), make_checker(False)).resource_child, request, ['foo'])
 
 
+class TestFailFast(unittest.TestCase):
+
+    def test_fail_fast(self):
+        calls = []
+        def checker(request, obj):
+            calls.append(obj)
+        class Resource(object):
+            @guard.guard(make_checker(False, 1), make_checker(False, 2),
+                         checker, fail_fast=True)
+            def __call__(self, request):
+                pass
+        try:
+            Resource()(http.Request.blank('/'))
+        except http.UnauthorizedError, e:
+            response = e.make_response()
+            assert response.body == """401 Unauthorized\n\nchecker #1 failed\n"""
+        else:
+            self.fail()
+        assert calls == []
+
+    def test_wrapper(self):
+        errors = []
+        def error_handler(request, obj, e):
+            errors.extend(e)
+        resource = guard.GuardResource(None, make_checker(False, 1),
+                                       make_checker(False, 2),
+                                       error_handler=error_handler,
+                                       fail_fast=True)
+        resource(http.Request.blank('/'))
+        assert errors == ['checker #1 failed']
+
+
+class TestCached(unittest.TestCase):
+
+    def make_checker(self, allow=True):
+        calls = []
+        def checker(request, obj):
+            calls.append(obj)
+            if not allow:
+                raise guard.GuardError("denied")
+        return checker, calls
+
+    def test_per_request(self):
+        checker, calls = self.make_checker()
+        checker = guard.cached(checker)
+        class Resource(object):
+            def resource_child(self, request, segments):
+                return guard.GuardResource(Resource(), checker), segments[1:]
+            @guard.guard(checker)
+            def __call__(self, request):
+                return 'ok'
+        request = http.Request.blank('/')
+        root = guard.GuardResource(Resource(), checker)
+        child, segments = root.resource_child(request, ['a', 'b'])
+        child, segments = child.resource_child(request, segments)
+        assert child(request) == 'ok'
+        assert len(calls) == 1
+        child(http.Request.blank('/'))
+        assert len(calls) == 2
+
+    def test_failure(self):
+        checker, calls = self.make_checker(False)
+        checker = guard.cached(checker)
+        class Resource(object):
+            @guard.guard(checker)
+            def __call__(self, request):
+                pass
+        request = http.Request.blank('/')
+        self.assertRaises(http.UnauthorizedError, Resource(), request)
+        try:
+            Resource()(request)
+        except http.UnauthorizedError, e:
+            assert 'denied' in e.make_response().body
+        else:
+            self.fail()
+        assert len(calls) == 1
+
+    def test_principal(self):
+        checker, calls = self.make_checker()
+        checker = guard.cached(checker, ttl=60)
+        class Resource(object):
+            @guard.guard(checker)
+            def __call__(self, request):
+                pass
+        for user in ['alice', 'alice', 'bob', None, None]:
+            environ = {}
+            if user:
+                environ['REMOTE_USER'] = user
+            Resource()(http.Request.blank('/', environ=environ))
+        # Anonymous requests are never shared.
+        assert len(calls) == 4
+        checker.clear()
+        Resource()(http.Request.blank('/', environ={'REMOTE_USER': 'alice'}))
+        assert len(calls) == 5
+
+    def test_custom_principal(self):
+        checker, calls = self.make_checker(False)
+        checker = guard.cached(checker, ttl=60,
+            principal=lambda request: request.headers.get('X-Token'))
+        for token in ['abc', 'abc', 'xyz']:
+            request = http.Request.blank('/', headers={'X-Token': token})
+            self.assertRaises(guard.GuardError, checker, request, None)
+        assert len(calls) == 2
+
+    def test_expiry(self):
+        now = [0]
+        checker, calls = self.make_checker()
+        checker = guard.cached(checker, ttl=60)
+        checker.cache.timer = lambda: now[0]
+        for t in [0, 30, 61]:
+            now[0] = t
+            checker(http.Request.blank('/', environ={'REMOTE_USER': 'alice'}), None)
+        assert len(calls) == 2
+
+
+class TestParallel(unittest.TestCase):
+
+    def test_parallel(self):
+        """
+        Check the checkers run at the same time, errors being reported in
+        checker order.
+        """
+        lock = threading.Lock()
+        running = [0, 0]
+        def make_waiting_checker(allow, checker_num):
+            def checker(request, obj):
+                lock.acquire()
+                running[0] += 1
+                running[1] = max(running)
+                lock.release()
+                time.sleep(0.05)
+                lock.acquire()
+                running[0] -= 1
+                lock.release()
+                if not allow:
+                    raise guard.GuardError("checker #%d failed" % checker_num)
+            return checker
+        class Resource(object):
+            @guard.guard(make_waiting_checker(False, 1),
+                         make_waiting_checker(True, 2),
+                         make_waiting_checker(False, 3), parallel=True,
+                         timeout=5)
+            def __call__(self, request):
+                pass
+        try:
+            Resource()(http.Request.blank('/'))
+        except http.UnauthorizedError, e:
+            response = e.make_response()
+            assert response.body == """401 Unauthorized\n\nchecker #1 failed\nchecker #3 failed\n"""
+        else:
+            self.fail()
+        assert running[1] > 1
+
+    def test_timeout(self):
+        event = threading.Event()
+        def slow_checker(request, obj):
+            event.wait(5)
+        errors = []
+        def error_handler(request, obj, e):
+            errors.extend(e)
+        resource = guard.GuardResource(None, make_checker(False, 1),
+                                       slow_checker, make_checker(True, 3),
+                                       error_handler=error_handler,
+                                       parallel=True, timeout=0.05)
+        start = time.time()
+        resource(http.Request.blank('/'))
+        event.set()
+        assert time.time() - start < 1
+        assert errors == ['checker #1 failed', guard.TIMEOUT_MESSAGE]
+
+    def test_pool_full(self):
+        """
+        Check checkers queued behind other guards' slow checkers are still
+        called, and not timed out.
+        """
+        event = threading.Event()
+        pool = guard._get_checker_pool()
+        for i in range(guard.CHECKER_THREADS):
+            pool.apply_async(event.wait, (5,))
+        try:
+            errors = []
+            def error_handler(request, obj, e):
+                errors.extend(e)
+            calls = []
+            resource = guard.GuardResource(lambda request: calls.append(request),
+                                           make_checker(True, 1),
+                                           make_checker(True, 2),
+                                           error_handler=error_handler,
+                                           parallel=True, timeout=0.05)
+            start = time.time()
+            resource(http.Request.blank('/'))
+            assert time.time() - start < 1
+            assert errors == []
+            assert len(calls) == 1
+        finally:
+            event.set()
+
+    def test_pass(self):
+        request = http.Request.blank('/')
+        calls = []
+        resource = guard.GuardResource(lambda request: calls.append(request),
+                                       make_checker(True, 1),
+                                       make_checker(True, 2), parallel=True)
+        resource(request)
+        assert calls == [request]
+
+    def test_exception(self):
+        def checker(request, obj):
+            raise http.ForbiddenError()
+        resource = guard.GuardResource(None, make_checker(True, 1), checker,
+                                       parallel=True)
+        self.assertRaises(http.ForbiddenError, resource,
+                          http.Request.blank('/'))
+
+
 class TestArgs(unittest.TestCase):
     """
     Check explicit keyword args handling.
@@ -105,11 +322,15 @@ class TestArgs(unittest.TestCase):
     def test_decorator(self):
         guard.guard()
         guard.guard(error_handler=lambda: None)
+        guard.guard(fail_fast=True)
+        guard.guard(parallel=True, timeout=1)
         self.assertRaises(TypeError, guard.guard, bad_arg=None)
 
     def test_resource(self):
         guard.GuardResource(None)
         guard.GuardResource(None, error_handler=lambda: None)
+        guard.GuardResource(None, fail_fast=True)
+        guard.GuardResource(None, parallel=True, timeout=1)
         self.assertRaises(TypeError, guard.GuardResource, None, bad_arg=None)
 
 
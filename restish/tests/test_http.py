@@ -1,4 +1,8 @@
 import cgi
+import os
+import shutil
+import StringIO
+import tempfile
 import unittest
 import webtest
 
@@ -43,6 +47,28 @@ class TestRequestAttributes(unittest.TestCase):
         r = http.Request.blank('/', base_url='/foo/')
         self.assertEquals(r.application_path, '/foo/')
 
+    def test_url_caching(self):
+        r = http.Request.blank('/foo?a=b')
+        for name in ['host_url', 'application_url', 'application_path',
+                     'path_url', 'url', 'path', 'path_qs']:
+            assert getattr(r, name) is getattr(r, name), name
+
+    def test_url_cache_invalidation(self):
+        r = http.Request.blank('/foo/bar?a=b')
+        assert r.path == '/foo/bar'
+        assert r.url == 'http://localhost/foo/bar?a=b'
+        r.environ['SCRIPT_NAME'] = '/foo'
+        r.environ['PATH_INFO'] = '/bar'
+        assert r.path == '/foo/bar'
+        assert r.application_path == '/foo'
+        r.environ['PATH_INFO'] = '/baz'
+        assert r.path == '/foo/baz'
+        assert r.path_qs == '/foo/baz?a=b'
+        r.environ['QUERY_STRING'] = ''
+        assert r.url == 'http://localhost/foo/baz'
+        r.environ['HTTP_HOST'] = 'example.com:8080'
+        assert r.host_url == 'http://example.com:8080'
+
 
 class TestResponseCreation(unittest.TestCase):
 
@@ -83,6 +109,87 @@ class TestSuccessResponseFactories(unittest.TestCase):
         assert r.body == location
 
 
+class TestPartialContent(unittest.TestCase):
+
+    def test_partial_content(self):
+        r = http.partial_content([('Content-Type', 'text/plain'),
+                                  ('Content-Range', 'bytes 0-2/10')], 'abc')
+        assert r.status.startswith('206')
+        assert r.headers['Content-Range'] == 'bytes 0-2/10'
+        assert r.body == 'abc'
+
+    def test_requested_range_not_satisfiable(self):
+        r = http.requested_range_not_satisfiable(10)
+        assert r.status.startswith('416')
+        assert r.headers['Content-Type'] == 'text/plain'
+        assert r.headers['Content-Range'] == 'bytes */10'
+        r = http.requested_range_not_satisfiable(10, body='nope')
+        assert r.headers['Content-Range'] == 'bytes */10'
+        assert r.body == 'nope'
+        headers = [('Content-Type', 'text/html')]
+        r = http.requested_range_not_satisfiable(10, headers, '<p>nope</p>')
+        assert r.headers['Content-Range'] == 'bytes */10'
+        assert headers == [('Content-Type', 'text/html')]
+        r = http.RequestedRangeNotSatisfiableError(10).make_response()
+        assert r.status.startswith('416')
+
+
+class TestFileResponse(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'test.txt')
+        f = open(self.filename, 'wb')
+        f.write('x' * 100000)
+        f.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_filename(self):
+        r = http.file_response(self.filename, chunk_size=4096)
+        assert r.status.startswith('200')
+        assert r.headers['Content-Type'] == 'text/plain'
+        assert r.headers['Content-Length'] == '100000'
+        assert r.headers['Last-Modified'].endswith(' GMT')
+        assert isinstance(r.app_iter, http.FileIter)
+        assert r.app_iter.block_size == 4096
+        assert ''.join(r.app_iter) == 'x' * 100000
+        r.app_iter.close()
+        assert r.app_iter.file.closed
+
+    def test_file(self):
+        f = open(self.filename, 'rb')
+        f.read(1000)
+        r = http.file_response(f, content_type='text/csv',
+                               headers=[('Cache-Control', 'max-age=60')])
+        assert r.headers['Content-Type'] == 'text/csv'
+        assert r.headers['Content-Length'] == '99000'
+        assert r.headers['Cache-Control'] == 'max-age=60'
+        assert ''.join(r.app_iter) == 'x' * 99000
+        r.app_iter.close()
+
+    def test_file_like(self):
+        r = http.file_response(StringIO.StringIO('abc'))
+        assert r.headers['Content-Type'] == 'application/octet-stream'
+        assert 'Content-Length' not in r.headers
+        assert 'Last-Modified' not in r.headers
+        assert ''.join(r.app_iter) == 'abc'
+
+    def test_file_wrapper(self):
+        wrapped = []
+        def file_wrapper(file, block_size):
+            wrapped.append((file, block_size))
+            return http.FileIter(file, block_size)
+        testapp = webtest.TestApp(app.RestishApp(
+            lambda request: http.file_response(self.filename)),
+            extra_environ={'wsgi.file_wrapper': file_wrapper})
+        response = testapp.get('/', status=200)
+        assert response.headers['Content-Length'] == '100000'
+        assert response.body == 'x' * 100000
+        assert [block_size for (file, block_size) in wrapped] == [65536]
+
+
 class TestRedirectionResponseFactories(unittest.TestCase):
 
     def test_moved_permanently(self):
@@ -0,0 +1,94 @@
+import unittest
+
+from restish import http, negotiation
+
+
+class TestParse(unittest.TestCase):
+
+    def test_media_range(self):
+        r = negotiation.parse_media_range('text/html; level=1 ;q=0.5')
+        assert (r.type, r.subtype, r.params, r.q) == \
+                ('text', 'html', {'level': '1'}, 0.5)
+
+    def test_default_quality(self):
+        for value in ['text/html', 'text/html;q=', 'text/html;q=0',
+                      'text/html;q=2', 'text/html;q=foo']:
+            assert negotiation.parse_media_range(value).q == 1.0
+
+    def test_java_wildcard(self):
+        r = negotiation.parse_media_range('*')
+        assert (r.type, r.subtype) == ('*', '*')
+
+    def test_malformed(self):
+        assert negotiation.parse_media_range('foo') is None
+        assert [r.value for r in negotiation.parse_header('foo, text/html,,')] == \
+                [' text/html']
+
+
+class TestBestMatch(unittest.TestCase):
+
+    def test_mimeparse_equivalence(self):
+        try:
+            import mimeparse
+        except ImportError:
+            return
+        supported = [
+            ['application/xbel+xml', 'text/xml'],
+            ['application/xbel+xml', 'application/xml'],
+            ['text/html', 'application/xhtml+xml'],
+            ['application/xhtml+xml', 'text/html'],
+            ['text/*', 'text/html', 'image/*'],
+            ['text/html;level=1', 'text/html;level=2', 'text/html'],
+            ['application/json', '*/*'],
+            ['*/*'],
+            ]
+        headers = [
+            'application/xbel+xml',
+            'application/xbel+xml; q=1',
+            'application/xml; q=1',
+            'application/*; q=1',
+            '*/*',
+            'text/*;q=0.5,*/*; q=0.1',
+            'text/html,application/xhtml+xml;q=0.9',
+            'text/html;q=0.9,application/xhtml+xml',
+            'text/html;level=2;q=0.5, text/html;level=1;q=0.7',
+            'text/*;q=0.3, text/html;q=0.7, text/html;level=1, */*;q=0.5',
+            'image/png',
+            'application/json',
+            '*',
+            ]
+        for s in supported:
+            for header in headers:
+                expected = mimeparse.best_match(s[::-1], header)
+                actual = negotiation.best_match(negotiation.parse_supported(s),
+                                                negotiation.parse_header(header))
+                assert actual == expected, (s, header, actual, expected)
+
+    def test_no_match(self):
+        supported = negotiation.parse_supported(['text/html'])
+        assert negotiation.best_match(supported, negotiation.parse_header('image/png')) == ''
+        assert negotiation.best_match([], negotiation.parse_header('*/*')) == ''
+
+    def test_first_of_equals(self):
+        supported = negotiation.parse_supported(['text/html', 'text/plain'])
+        assert negotiation.best_match(supported, negotiation.parse_header('text/*')) == 'text/html'
+
+
+class TestHeaderRanges(unittest.TestCase):
+
+    def test_parsed_once(self):
+        request = http.Request.blank('/', headers={'Accept': 'text/html'})
+        ranges = negotiation.header_ranges(request, 'accept')
+        assert [r.value for r in ranges] == ['text/html']
+        assert negotiation.header_ranges(request, 'accept') is ranges
+
+    def test_changed_header(self):
+        request = http.Request.blank('/', headers={'Accept': 'text/html'})
+        negotiation.header_ranges(request, 'accept')
+        request.headers['Accept'] = 'application/json'
+        ranges = negotiation.header_ranges(request, 'accept')
+        assert [r.value for r in ranges] == ['application/json']
+
+
+if __name__ == '__main__':
+    unittest.main()
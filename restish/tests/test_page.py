@@ -1,7 +1,9 @@
+import threading
 import unittest
 import webtest
 
 from restish import app, http, resource, page, templating
+from restish import cache as cache_module
 
 
 def make_app(root):
@@ -74,6 +76,259 @@ class TestElement(unittest.TestCase):
         assert P.element(request1, 'foo') is not P.element(request2, 'foo')
 
 
+class TestPrefetch(unittest.TestCase):
+
+    def make_page(self, timeout=None):
+        self.threads = threads = []
+        self.events = events = {'foo': threading.Event(), 'bar': threading.Event()}
+        class Element(page.Element):
+            def __init__(self, name):
+                self.name = name
+            @templating.element('element.html')
+            def __call__(self, request):
+                threads.append(threading.currentThread())
+                # Wait for the other element to have started.
+                events[self.name].set()
+                events[{'foo': 'bar', 'bar': 'foo'}[self.name]].wait(5)
+                return {'name': self.name}
+        class Page(page.Page):
+            prefetch_timeout = timeout
+            @resource.GET()
+            @templating.page('page.html')
+            def html(self, request):
+                return {}
+            @page.element('foo', prefetch=True)
+            def foo(self, request):
+                return Element('foo')
+            @page.element('bar', prefetch=True)
+            def bar(self, request):
+                return Element('bar')
+            @page.element('baz')
+            def baz(self, request):
+                return Element('baz')
+        return Page
+
+    def renderer(self, template, args, encoding=None):
+        if template == 'page.html':
+            element = args['element']
+            return '<div>%s%s%s</div>' % (element('foo')(), element('bar')(),
+                                          element('foo')())
+        elif template == 'element.html':
+            return '<p>%s</p>' % (args['name'],)
+
+    def test_prefetch_elements(self):
+        Page = self.make_page()
+        assert sorted(Page.prefetch_elements) == ['bar', 'foo']
+
+    def test_prefetch(self):
+        Page = self.make_page()
+        response = make_app(Page()).get('/', extra_environ={'restish.templating': templating.Templating(self.renderer)}, status=200)
+        assert response.body == '<div><p>foo</p><p>bar</p><p>foo</p></div>'
+        # Both elements were rendered once, concurrently, in other threads.
+        assert len(self.threads) == 2
+        assert threading.currentThread() not in self.threads
+
+    def test_element_cache(self):
+        Page = self.make_page()
+        P = Page()
+        request = http.Request.blank('/', environ={'restish.templating': templating.Templating(self.renderer)})
+        P.prefetch(request)
+        foo = P.element(request, 'foo')
+        assert P.element(request, 'foo') is foo
+        assert isinstance(foo, page.Element)
+        assert foo.name == 'foo'
+        assert foo.element_name == 'foo'
+        assert foo(request) == '<p>foo</p>'
+        assert len(self.threads) == 2
+
+    def test_shared_state(self):
+        Page = self.make_page()
+        request = http.Request.blank('/', environ={'restish.templating': templating.Templating(self.renderer)})
+        rendered = templating.render_page(request, Page(), 'page.html')
+        assert rendered == '<div><p>foo</p><p>bar</p><p>foo</p></div>'
+        # The page's args were built before the elements rendered
+        # concurrently, so they only read them.
+        assert templating.args_built(request) == 1
+
+    def test_timeout(self):
+        Page = self.make_page(timeout=0.01)
+        P = Page()
+        request = http.Request.blank('/', environ={'restish.templating': templating.Templating(self.renderer)})
+        P.prefetch(request, ['foo'])
+        self.assertRaises(page.ElementTimeout, P.element, request, 'foo')
+        # Let the element finish.
+        self.events['bar'].set()
+
+    def test_missing(self):
+        request = http.Request.blank('/')
+        self.assertRaises(page.ElementNotFound, page.Page().prefetch, request, ['foo'])
+
+    def test_errors(self):
+        class Page(page.Page):
+            @page.element('foo', prefetch=True)
+            def foo(self, request):
+                raise ValueError()
+        P = Page()
+        request = http.Request.blank('/')
+        P.prefetch(request)
+        self.assertRaises(ValueError, P.element, request, 'foo')
+
+
+class TestFragmentCache(unittest.TestCase):
+
+    def make_page(self, cache):
+        self.calls = calls = []
+        class Element(page.Element):
+            def __init__(self, request):
+                calls.append('factory')
+                self.lang = request.environ.get('HTTP_ACCEPT_LANGUAGE', 'en')
+            @templating.element('element.html')
+            def __call__(self, request):
+                calls.append('render')
+                return {'lang': self.lang}
+        class Page(page.Page):
+            @resource.GET()
+            @templating.page('page.html')
+            def html(self, request):
+                return {}
+            @page.element('nav', cache=cache)
+            def nav(self, request):
+                return Element(request)
+        return Page()
+
+    def renderer(self, template, args, encoding=None):
+        if template == 'page.html':
+            element = args['element']
+            return '<div>%s%s</div>' % (element('nav')(), element('nav')())
+        elif template == 'element.html':
+            return '<p>%s</p>' % (args['lang'],)
+
+    def get(self, P, lang='en'):
+        environ = {'restish.templating': templating.Templating(self.renderer)}
+        return make_app(P).get('/', headers={'Accept-Language': lang},
+                               extra_environ=environ).body
+
+    def test_cache(self):
+        P = self.make_page(page.FragmentCache())
+        assert self.get(P) == '<div><p>en</p><p>en</p></div>'
+        assert self.get(P) == '<div><p>en</p><p>en</p></div>'
+        assert self.calls == ['factory', 'render']
+        # Different languages aren't distinguished without vary.
+        assert self.get(P, 'fr') == '<div><p>en</p><p>en</p></div>'
+
+    def test_vary(self):
+        cache = page.FragmentCache(vary=lambda request: request.accept_language.best_match(['en', 'fr']))
+        P = self.make_page(cache)
+        assert self.get(P, 'en') == '<div><p>en</p><p>en</p></div>'
+        assert self.get(P, 'fr') == '<div><p>fr</p><p>fr</p></div>'
+        assert self.get(P, 'fr') == '<div><p>fr</p><p>fr</p></div>'
+        assert self.calls == ['factory', 'render', 'factory', 'render']
+
+    def test_ttl(self):
+        now = [0]
+        cache = page.FragmentCache(ttl=10, backend=cache_module.TTLCache(timer=lambda: now[0]))
+        P = self.make_page(cache)
+        self.get(P)
+        now[0] = 9
+        self.get(P)
+        now[0] = 10
+        self.get(P)
+        assert self.calls == ['factory', 'render', 'factory', 'render']
+
+    def test_invalidate(self):
+        cache = page.FragmentCache(vary=lambda request: request.environ.get('HTTP_ACCEPT_LANGUAGE'))
+        P = self.make_page(cache)
+        self.get(P, 'en')
+        self.get(P, 'fr')
+        cache.invalidate('nav', http.Request.blank('/', headers={'Accept-Language': 'fr'}))
+        self.get(P, 'en')
+        self.get(P, 'fr')
+        assert self.calls.count('render') == 3
+        cache.invalidate('nav')
+        self.get(P, 'en')
+        self.get(P, 'fr')
+        assert self.calls.count('render') == 5
+        cache.clear()
+        self.get(P, 'en')
+        assert self.calls.count('render') == 6
+
+    def test_pages_share_cache(self):
+        """
+        Check elements of the same name from different pages are cached
+        separately.
+        """
+        cache = page.FragmentCache()
+        class Element(page.Element):
+            def __init__(self, name):
+                self.name = name
+            def __call__(self, request):
+                return self.name
+        class PageA(page.Page):
+            @page.element('nav', cache=cache)
+            def nav(self, request):
+                return Element('nav-A')
+        class PageB(page.Page):
+            @page.element('nav', cache=cache)
+            def nav(self, request):
+                return Element('nav-B')
+        class PageC(PageB):
+            pass
+        for P, expected in [(PageA, 'nav-A'), (PageB, 'nav-B'),
+                            (PageA, 'nav-A'), (PageC, 'nav-B')]:
+            request = http.Request.blank('/')
+            assert P().element(request, 'nav')(request) == expected
+        # An inherited factory shares its class's renderings, so the backend
+        # has two renderings and the element's generation.
+        assert len(cache.backend) == 3
+
+    def test_shared_backend(self):
+        """
+        Check invalidating all of an element's renderings is seen by other
+        caches, e.g. in other processes, using the same backend.
+        """
+        backend = cache_module.TTLCache()
+        cache1 = page.FragmentCache(backend=backend)
+        cache2 = page.FragmentCache(backend=backend)
+        request = http.Request.blank('/')
+        key = cache1.key(request, 'nav')
+        cache1.set(key, 'rendered')
+        assert cache2.get(cache2.key(request, 'nav')) == 'rendered'
+        cache1.invalidate('nav')
+        assert cache2.get(cache2.key(request, 'nav')) is None
+        # Losing the generation also loses the renderings.
+        cache2.set(cache2.key(request, 'nav'), 'rendered')
+        backend.delete(('generation', 'nav'))
+        assert cache1.get(cache1.key(request, 'nav')) is None
+
+    def test_invalidate_factory(self):
+        cache = page.FragmentCache()
+        P = self.make_page(cache)
+        self.get(P)
+        cache.invalidate('nav', http.Request.blank('/'), P.nav)
+        self.get(P)
+        assert self.calls.count('render') == 2
+
+    def test_lazy_element(self):
+        P = self.make_page(page.FragmentCache())
+        self.get(P)
+        request = http.Request.blank('/')
+        element = P.element(request, 'nav')
+        assert element(request) == '<p>en</p>'
+        assert element.element_name == 'nav'
+        assert self.calls == ['factory', 'render']
+        # The element is created if something else is needed.
+        assert element.lang == 'en'
+        assert self.calls == ['factory', 'render', 'factory']
+
+    def test_prefetch(self):
+        P = self.make_page(page.FragmentCache())
+        request = http.Request.blank('/', environ={'restish.templating': templating.Templating(self.renderer)})
+        P.prefetch(request, ['nav'])
+        assert P.element(request, 'nav')(request) == '<p>en</p>'
+        self.get(P)
+        assert self.calls == ['factory', 'render']
+
+
 if __name__ == '__main__':
     unittest.main()
 
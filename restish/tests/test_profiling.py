@@ -0,0 +1,157 @@
+import logging
+import socket
+import StringIO
+import unittest
+import webtest
+from wsgiref.util import FileWrapper
+
+from restish import app, http, profiling, resource, templating
+
+
+class Timer(object):
+    """
+    Timer that moves on by a second each time it's called.
+    """
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        self.now += 1
+        return self.now
+
+
+class Templating(templating.Templating):
+
+    def render(self, request, template, args=None, encoding=None):
+        return template
+
+
+class Child(resource.Resource):
+
+    @resource.GET()
+    @templating.page('page')
+    def html(self, request):
+        return {}
+
+
+class Root(resource.Resource):
+
+    @resource.child()
+    def child(self, request, segments):
+        return Child()
+
+
+def make_app(profiler):
+    return webtest.TestApp(app.RestishApp(Root(), profiler=profiler),
+                           extra_environ={'restish.templating': Templating(None)})
+
+
+class Sink(object):
+
+    def __init__(self):
+        self.records = []
+
+    def record(self, environ, timings):
+        self.records.append((environ['PATH_INFO'], timings))
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_phases(self):
+        sink = Sink()
+        R = make_app(profiling.Profiler(sink, Timer())).get('/child')
+        assert R.body == 'page'
+        [(path, timings)] = sink.records
+        assert path == '/child'
+        assert [phase for (phase, seconds) in timings] == \
+                ['request', 'traverse', 'negotiate', 'render', 'handler',
+                 'stream', 'total']
+        assert dict(timings)['request'] == 1
+        assert dict(timings)['handler'] == 3
+        assert dict(timings)['total'] > dict(timings)['handler']
+
+    def test_not_found(self):
+        sink = Sink()
+        make_app(profiling.Profiler(sink)).get('/missing', status=404)
+        [(path, timings)] = sink.records
+        assert [phase for (phase, seconds) in timings] == \
+                ['request', 'traverse', 'stream', 'total']
+
+    def test_file_wrapper(self):
+        """
+        Check the server's file_wrapper reaches it, and is still timed.
+        """
+        class Files(resource.Resource):
+            @resource.GET()
+            def text(self, request):
+                return http.file_response(StringIO.StringIO('hello'),
+                                          content_type='text/plain')
+        sink = Sink()
+        A = app.RestishApp(Files(), profiler=profiling.Profiler(sink))
+        environ = http.Request.blank('/').environ
+        environ['wsgi.file_wrapper'] = FileWrapper
+        app_iter = A(environ, lambda status, headers: None)
+        assert isinstance(app_iter, FileWrapper)
+        assert ''.join(app_iter) == 'hello'
+        assert sink.records == []
+        app_iter.close()
+        [(path, timings)] = sink.records
+        assert [phase for (phase, seconds) in timings][-2:] == ['stream', 'total']
+
+    def test_not_profiled(self):
+        environ = http.Request.blank('/child').environ
+        environ['restish.templating'] = Templating(None)
+        request = http.Request(environ)
+        assert profiling.timings(request) is None
+        assert Child()(request).body == 'page'
+
+
+class TestSinks(unittest.TestCase):
+
+    def test_memory(self):
+        sink = profiling.MemorySink()
+        sink.record({}, [('handler', 0.0005), ('handler', 0.003), ('handler', 10)])
+        stats = sink.stats()['handler']
+        assert stats['count'] == 3
+        assert stats['min'] == 0.5
+        assert stats['max'] == 10000
+        buckets = dict(stats['buckets'])
+        assert (buckets[1], buckets[5], buckets[None]) == (1, 1, 1)
+        sink.clear()
+        assert sink.stats() == {}
+
+    def test_memory_app(self):
+        sink = profiling.MemorySink()
+        A = make_app(profiling.Profiler(sink))
+        A.get('/child')
+        A.get('/child')
+        assert sink.stats()['total']['count'] == 2
+
+    def test_statsd(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(('127.0.0.1', 0))
+        server.settimeout(5)
+        try:
+            sink = profiling.StatsdSink(port=server.getsockname()[1])
+            sink.record({}, [('request', 0.001), ('handler', 0.0025)])
+            assert server.recv(1024) == 'restish.request:1.000|ms\nrestish.handler:2.500|ms'
+        finally:
+            server.close()
+
+    def test_log(self):
+        records = []
+        class Handler(logging.Handler):
+            def emit(self, record):
+                records.append(record.getMessage())
+        logger = logging.getLogger('restish.tests.profiling')
+        logger.addHandler(Handler())
+        logger.propagate = False
+        sink = profiling.LogSink(logger, logging.WARNING)
+        sink.record({'REQUEST_METHOD': 'GET', 'PATH_INFO': '/foo'},
+                    [('request', 0.001)])
+        assert records == ['GET /foo request=1.000ms']
+
+
+if __name__ == '__main__':
+    unittest.main()
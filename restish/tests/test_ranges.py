@@ -0,0 +1,200 @@
+import mmap
+import os
+import shutil
+import tempfile
+import unittest
+import webtest
+
+from restish import app, http, ranges, resource
+
+
+BODY = ''.join([chr(ord('a') + i % 26) for i in range(1000)])
+
+
+class TestRangeResponse(unittest.TestCase):
+
+    def make_app(self, body, headers=None, **kw):
+        class Resource(resource.Resource):
+            @resource.GET()
+            def text(self, request):
+                return http.ok([('Content-Type', 'text/plain')] +
+                               list(headers or []), body())
+        return webtest.TestApp(app.RestishApp(Resource(), ranges=True, **kw))
+
+    def test_no_range(self):
+        A = self.make_app(lambda: BODY)
+        R = A.get('/', status=200)
+        assert R.headers['Accept-Ranges'] == 'bytes'
+        assert R.body == BODY
+
+    def test_single_range(self):
+        A = self.make_app(lambda: BODY)
+        for header, start, stop in [('bytes=0-99', 0, 100),
+                                    ('bytes=900-', 900, 1000),
+                                    ('bytes=-100', 900, 1000),
+                                    ('bytes=990-2000', 990, 1000),
+                                    ('bytes=-2000', 0, 1000),
+                                    ('bytes=0-9,10-19', 0, 20),
+                                    ('bytes=5-9,0-7', 0, 10)]:
+            R = A.get('/', headers={'Range': header}, status=206)
+            assert R.headers['Content-Range'] == 'bytes %d-%d/1000' % (start, stop - 1)
+            assert R.headers['Content-Length'] == str(stop - start)
+            assert R.headers['Content-Type'] == 'text/plain'
+            assert R.body == BODY[start:stop]
+
+    def test_multiple_ranges(self):
+        A = self.make_app(lambda: BODY)
+        R = A.get('/', headers={'Range': 'bytes=500-509,0-9,-5'}, status=206)
+        content_type, boundary = R.headers['Content-Type'].split('; boundary=')
+        assert content_type == 'multipart/byteranges'
+        assert 'Content-Range' not in R.headers
+        assert R.headers['Content-Length'] == str(len(R.body))
+        parts = R.body.split('\r\n--%s' % (boundary,))
+        assert parts[0] == '' and parts[-1] == '--\r\n'
+        expected = [(0, 10), (500, 510), (995, 1000)]
+        assert len(parts[1:-1]) == len(expected)
+        for part, (start, stop) in zip(parts[1:-1], expected):
+            part_headers, data = part.split('\r\n\r\n', 1)
+            assert part_headers == ('\r\nContent-Type: text/plain\r\n'
+                                    'Content-Range: bytes %d-%d/1000'
+                                    % (start, stop - 1))
+            assert data == BODY[start:stop]
+
+    def test_not_satisfiable(self):
+        A = self.make_app(lambda: BODY)
+        R = A.get('/', headers={'Range': 'bytes=1000-'}, status=416)
+        assert R.headers['Content-Range'] == 'bytes */1000'
+
+    def test_ignored(self):
+        A = self.make_app(lambda: BODY)
+        for header in ['rubbish', 'bytes=', 'bytes=10-5', 'bytes=a-b',
+                       'lines=0-9', ','.join(['bytes=0-0'] + ['%d-%d' % (i, i) for i in range(2, 200, 2)])]:
+            R = A.get('/', headers={'Range': header}, status=200)
+            assert R.body == BODY
+        A.post('/', headers={'Range': 'bytes=0-9'}, status=405)
+
+    def test_if_range(self):
+        A = self.make_app(lambda: BODY, [('ETag', '"v1"'),
+                                         ('Last-Modified', 'Fri, 02 Jan 2009 03:04:05 GMT')])
+        for if_range, status in [('"v1"', 206), ('"v2"', 200), ('W/"v1"', 200),
+                                 ('Fri, 02 Jan 2009 03:04:05 GMT', 206),
+                                 ('Sat, 03 Jan 2009 03:04:05 GMT', 200),
+                                 ('rubbish', 200)]:
+            A.get('/', headers={'Range': 'bytes=0-9', 'If-Range': if_range}, status=status)
+
+    def test_if_range_automatic_etag(self):
+        A = self.make_app(lambda: BODY, conditional=True)
+        etag = A.get('/', status=200).headers['ETag']
+        A.get('/', headers={'Range': 'bytes=0-9', 'If-Range': etag}, status=206)
+
+    def test_accept_ranges_none(self):
+        A = self.make_app(lambda: BODY, [('Accept-Ranges', 'none')])
+        R = A.get('/', headers={'Range': 'bytes=0-9'}, status=200)
+        assert R.headers['Accept-Ranges'] == 'none'
+
+    def test_streamed_body(self):
+        def body():
+            yield BODY
+        A = self.make_app(body)
+        R = A.get('/', headers={'Range': 'bytes=0-9'}, status=200)
+        assert 'Accept-Ranges' not in R.headers
+        assert R.body == BODY
+
+    def test_head(self):
+        A = self.make_app(lambda: BODY)
+        R = A.head('/', status=200)
+        assert R.headers['Accept-Ranges'] == 'bytes'
+        assert R.headers['Content-Length'] == '1000'
+
+    def test_disabled(self):
+        class Resource(resource.Resource):
+            @resource.GET()
+            def text(self, request):
+                return http.ok([('Content-Type', 'text/plain')], BODY)
+        A = webtest.TestApp(app.RestishApp(Resource()))
+        R = A.get('/', headers={'Range': 'bytes=0-9'}, status=200)
+        assert 'Accept-Ranges' not in R.headers
+
+
+class TestFileRanges(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'test.txt')
+        f = open(self.filename, 'wb')
+        f.write(BODY)
+        f.close()
+        self.opened = []
+
+    def tearDown(self):
+        for f in self.opened:
+            assert f.closed
+        shutil.rmtree(self.directory)
+
+    def make_app(self, func):
+        class Resource(resource.Resource):
+            @resource.GET()
+            def text(self, request):
+                return func()
+        return webtest.TestApp(app.RestishApp(Resource(), ranges=True))
+
+    def open(self):
+        f = open(self.filename, 'rb')
+        self.opened.append(f)
+        return f
+
+    def test_file(self):
+        A = self.make_app(lambda: http.file_response(self.open(), chunk_size=16))
+        R = A.get('/', headers={'Range': 'bytes=100-199'}, status=206)
+        assert R.headers['Content-Range'] == 'bytes 100-199/1000'
+        assert R.body == BODY[100:200]
+        R = A.get('/', headers={'Range': 'bytes=0-0,-1'}, status=206)
+        assert R.headers['Content-Type'].startswith('multipart/byteranges')
+        assert R.headers['Content-Length'] == str(len(R.body))
+
+    def test_partly_read_file(self):
+        def response():
+            f = self.open()
+            f.read(500)
+            return http.file_response(f)
+        A = self.make_app(response)
+        R = A.get('/', headers={'Range': 'bytes=-10'}, status=206)
+        assert R.headers['Content-Range'] == 'bytes 490-499/500'
+        assert R.body == BODY[990:]
+
+    def test_not_satisfiable(self):
+        A = self.make_app(lambda: http.file_response(self.open()))
+        A.get('/', headers={'Range': 'bytes=5000-'}, status=416)
+
+    def test_mmap(self):
+        def response():
+            f = self.open()
+            body = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            f.close()
+            return http.ok([('Content-Type', 'text/plain')], body)
+        A = self.make_app(response)
+        R = A.get('/', headers={'Range': 'bytes=10-19'}, status=206)
+        assert R.headers['Content-Range'] == 'bytes 10-19/1000'
+        assert R.body == BODY[10:20]
+
+
+class TestParseRange(unittest.TestCase):
+
+    def test_parse_range(self):
+        for header, expected in [
+                ('bytes=0-499', [(0, 500)]),
+                ('bytes = 0-0 , -1', [(0, 1), (999, 1000)]),
+                ('bytes=0-10,5-20,21-30', [(0, 31)]),
+                ('bytes=2000-', []),
+                ('bytes=-0', []),
+                ('bytes=0-', [(0, 1000)]),
+                ('bytes=,0-1,', [(0, 2)]),
+                ('bytes=,', None),
+                ('bytes=-', None),
+                ('bytes=1-0', None),
+                ('items=0-1', None)]:
+            assert ranges.parse_range(header, 1000) == expected, header
+
+
+if __name__ == '__main__':
+    unittest.main()
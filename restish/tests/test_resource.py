@@ -152,9 +152,11 @@ class TestResource(unittest.TestCase):
             def text(self, request):
                 return http.ok([('Content-Type', 'text/plain')], 'text')
         get_response = Resource()(http.Request.blank('/', environ={'REQUEST_METHOD': 'GET'}))
-        head_response = Resource()(http.Request.blank('/', environ={'REQUEST_METHOD': 'HEAD'}))
+        request = http.Request.blank('/', environ={'REQUEST_METHOD': 'HEAD'})
+        head_response = Resource()(request)
         assert head_response.headers['content-length'] == get_response.headers['content-length']
         assert head_response.body == ''
+        assert request.method == 'HEAD'
 
     def test_default_head_forwards(self):
         # Check that the default HEAD implementation handles forwarding to a
@@ -172,6 +174,70 @@ class TestResource(unittest.TestCase):
         assert head_response.headers['content-length'] == '4'
         assert head_response.body == ''
 
+    def test_default_head_streamed(self):
+        # Check the GET body is closed, but never consumed.
+        consumed = []
+        class Body(object):
+            closed = False
+            def __iter__(self):
+                consumed.append(True)
+                yield 'text'
+            def close(self):
+                self.closed = True
+        body = Body()
+        class Resource(resource.Resource):
+            @resource.GET()
+            def text(self, request):
+                return http.ok([('Content-Type', 'text/plain'),
+                                ('Content-Length', '4')], body)
+        head_response = Resource()(http.Request.blank('/', environ={'REQUEST_METHOD': 'HEAD'}))
+        assert head_response.headers['content-length'] == '4'
+        assert head_response.body == ''
+        assert body.closed
+        assert not consumed
+
+    def test_head_headers(self):
+        class Resource(resource.Resource):
+            @resource.GET()
+            def text(self, request):
+                raise AssertionError('GET should not be called')
+            def head_headers(self, request):
+                return [('Content-Type', 'text/plain'), ('Content-Length', '100')]
+        head_response = Resource()(http.Request.blank('/', environ={'REQUEST_METHOD': 'HEAD'}))
+        assert head_response.status == '200 OK'
+        assert head_response.headers['content-length'] == '100'
+        assert head_response.body == ''
+
+    def test_head_headers_not_acceptable(self):
+        calls = []
+        class Resource(resource.Resource):
+            @resource.GET(accept='text/plain')
+            def text(self, request):
+                raise AssertionError('GET should not be called')
+            def head_headers(self, request):
+                calls.append(request)
+                return [('Content-Type', 'text/plain'), ('Content-Length', '100')]
+        request = http.Request.blank('/', environ={'REQUEST_METHOD': 'HEAD'},
+                                     headers={'Accept': 'application/json'})
+        head_response = Resource()(request)
+        assert head_response.status.startswith('406')
+        assert calls == []
+        assert request.method == 'HEAD'
+        request = http.Request.blank('/', environ={'REQUEST_METHOD': 'HEAD'},
+                                     headers={'Accept': 'text/plain'})
+        assert Resource()(request).status == '200 OK'
+
+    def test_head_headers_fallback(self):
+        class Resource(resource.Resource):
+            @resource.GET()
+            def text(self, request):
+                return http.ok([('Content-Type', 'text/plain')], 'text')
+            def head_headers(self, request):
+                return None
+        head_response = Resource()(http.Request.blank('/', environ={'REQUEST_METHOD': 'HEAD'}))
+        assert head_response.headers['content-length'] == '4'
+        assert head_response.body == ''
+
     def test_specialised_head(self):
         class Resource(resource.Resource):
             @resource.GET()
@@ -437,6 +503,98 @@ class TestChildLookup(unittest.TestCase):
         self.fail()
 
 
+class TestCompiledChildLookup(unittest.TestCase):
+
+    def test_specificity(self):
+        """
+        Check the compiled lookup picks the same child as the standard one.
+        """
+        class Resource(resource.Resource):
+            def __init__(self, segments=[]):
+                self.segments = segments
+            @resource.child('a/b/c')
+            def _1(self, request, segments):
+                return self.__class__(['a/b/c']), []
+            @resource.child('a/b/{c}')
+            def _2(self, request, segments, c):
+                return self.__class__(['a/b/{c}', c]), []
+            @resource.child('a/{b}/c/{d}')
+            def _3(self, request, segments, b, d):
+                return self.__class__(['a/{b}/c/{d}', b, d]), []
+            @resource.child('a/{b}/{c}')
+            def _4(self, request, segments, b, c):
+                return self.__class__(['a/{b}/{c}', b, c]), []
+            @resource.child('a')
+            def _5(self, request, segments):
+                return self.__class__(['a'] + segments), []
+            @resource.child('{a}/b/c')
+            def _6(self, request, segments, a):
+                return self.__class__(['{a}/b/c', a]), []
+            @resource.child('page-{n}')
+            def _7(self, request, segments, n):
+                return self.__class__(['page-{n}', n]), []
+            @resource.child('')
+            def _8(self, request, segments):
+                return self.__class__(['<empty>']), []
+            @resource.child(resource.any)
+            def any(self, request, segments):
+                return self.__class__(['<any>'] + segments), []
+            def __call__(self, request):
+                return http.ok([('Content-Type', 'text/plain')],
+                               '|'.join(self.segments).encode('utf-8'))
+        paths = ['/a/b/c', '/a/b/foo', '/a/foo/c/bar', '/a/foo/bar', '/a',
+                 '/a/x', '/foo/b/c', '/page-2', '/foo', '/', '/a/', '/%C2%A3',
+                 '/a/b%2Fc/d']
+        standard = webtest.TestApp(app.RestishApp(Resource()))
+        compiled = webtest.TestApp(app.RestishApp(Resource(), compiled=True))
+        for path in paths:
+            assert compiled.get(path).body == standard.get(path).body, path
+        assert compiled.get('/a/foo/bar').body == 'a/{b}/{c}|foo|bar'
+        assert compiled.get('/%C2%A3').body == '<any>|£'
+
+    def test_custom_matcher_precedence(self):
+        class Matcher(object):
+            score = (2,)
+            def __call__(self, request, segments):
+                if segments[0] == 'custom':
+                    return [], {}, segments[1:]
+        class Resource(resource.Resource):
+            @resource.child(Matcher())
+            def custom(self, request, segments):
+                return http.ok([('Content-Type', 'text/plain')], 'custom')
+            @resource.child('{name}')
+            def dynamic(self, request, segments, name):
+                return http.ok([('Content-Type', 'text/plain')], 'dynamic')
+        A = webtest.TestApp(app.RestishApp(Resource(), compiled=True))
+        assert A.get('/custom').body == 'custom'
+        assert A.get('/other').body == 'dynamic'
+
+    def test_overridden_resource_child(self):
+        class Resource(resource.Resource):
+            @resource.child()
+            def foo(self, request, segments):
+                return http.ok([('Content-Type', 'text/plain')], 'foo')
+            def resource_child(self, request, segments):
+                return http.ok([('Content-Type', 'text/plain')], 'override')
+        assert resource.child_router(Resource()) is None
+        A = webtest.TestApp(app.RestishApp(Resource(), compiled=True))
+        assert A.get('/foo').body == 'override'
+
+    def test_router_cached_per_class(self):
+        class Base(resource.Resource):
+            @resource.child()
+            def foo(self, request, segments):
+                pass
+        class Derived(Base):
+            @resource.child()
+            def bar(self, request, segments):
+                pass
+        resource.compile_child_routes(Base)
+        assert resource.child_router(Base()) is resource.child_router(Base())
+        assert resource.child_router(Derived()) is not resource.child_router(Base())
+        assert len(resource.child_router(Derived()).factories) == 2
+
+
 class TestAcceptContentNegotiation(unittest.TestCase):
 
     def test_no_match(self):
@@ -756,6 +914,99 @@ class TestContentTypeContentNegotiation(unittest.TestCase):
         assert response.body == 'json_in_json_out'
 
 
+class TestDispatcher(unittest.TestCase):
+
+    def test_precompiled(self):
+        class Resource(resource.Resource):
+            @resource.GET(accept='html')
+            def html(self, request):
+                return http.ok([], '<p />')
+        [dispatcher] = Resource.request_dispatchers['GET']
+        assert isinstance(dispatcher, resource.Dispatcher)
+        assert dispatcher.match['accept'] == ['text/html']
+        request = http.Request.blank('/')
+        response = dispatcher(Resource(), request)
+        assert response.body == '<p />'
+        assert response.headers['Content-Type'] == 'text/html'
+
+    def test_inherited(self):
+        class Base(resource.Resource):
+            @resource.GET()
+            def html(self, request):
+                return http.ok([], 'Base')
+        class Derived(Base):
+            pass
+        assert Derived.request_dispatchers['GET'][0] is Base.request_dispatchers['GET'][0]
+
+
+class TestDispatcherCache(unittest.TestCase):
+
+    def test_cache(self):
+        class Resource(resource.Resource):
+            @resource.GET(accept='html')
+            def html(self, request):
+                return http.ok([], '<p />')
+            @resource.GET(accept='json')
+            def json(self, request):
+                return http.ok([], '{}')
+        A = make_app(Resource())
+        assert A.get('/', headers={'Accept': 'application/json'}).body == '{}'
+        assert A.get('/', headers={'Accept': 'application/json'}).body == '{}'
+        assert A.get('/', headers={'Accept': 'text/html'}).body == '<p />'
+        A.get('/', headers={'Accept': 'image/png'}, status=406)
+        A.get('/', headers={'Accept': 'image/png'}, status=406)
+        cache = Resource.dispatcher_cache
+        assert (cache.hits, cache.misses) == (2, 3)
+        assert len(cache) == 3
+
+    def test_content_type_params(self):
+        class Resource(resource.Resource):
+            @resource.POST(content_type='multipart/form-data')
+            def form(self, request):
+                return http.ok([('Content-Type', 'text/plain')], 'form')
+        A = make_app(Resource())
+        for boundary in ['a', 'b', 'c']:
+            R = A.post('/', headers={'Content-Type': 'multipart/form-data; boundary=%s' % (boundary,)})
+            assert R.body == 'form'
+        assert len(Resource.dispatcher_cache) == 1
+
+    def test_per_class(self):
+        class Base(resource.Resource):
+            @resource.GET()
+            def html(self, request):
+                return http.ok([('Content-Type', 'text/html')], 'Base')
+        class Derived(Base):
+            @resource.GET(accept='json')
+            def json(self, request):
+                return http.ok([], 'Derived')
+        assert make_app(Base()).get('/', headers={'Accept': 'application/json'}).body == 'Base'
+        assert make_app(Derived()).get('/', headers={'Accept': 'application/json'}).body == 'Derived'
+        assert Base.dispatcher_cache is not Derived.dispatcher_cache
+
+    def test_size(self):
+        class Resource(resource.Resource):
+            dispatcher_cache_size = 1
+            @resource.GET()
+            def html(self, request):
+                return http.ok([('Content-Type', 'text/html')], '')
+        A = make_app(Resource())
+        A.get('/', headers={'Accept': 'text/html'})
+        A.get('/', headers={'Accept': 'text/plain'})
+        assert len(Resource.dispatcher_cache) == 1
+
+    def test_disabled(self):
+        class Resource(resource.Resource):
+            dispatcher_cache_size = 0
+            @resource.GET()
+            def html(self, request):
+                return http.ok([('Content-Type', 'text/html')], '')
+        A = make_app(Resource())
+        A.get('/')
+        A.get('/')
+        assert len(Resource.dispatcher_cache) == 0
+        assert Resource.dispatcher_cache.hits == 0
+
+
 class TestAcceptLists(unittest.TestCase):
 
     def test_match(self):
@@ -0,0 +1,193 @@
+import unittest
+import webtest
+
+from restish import app, cache, guard, http, resource, responsecache
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def make_cached_app(self, headers=None, body='text', **kw):
+        if headers is None:
+            headers = [('Cache-Control', 'max-age=60')]
+        calls = []
+        class Resource(resource.Resource):
+            @resource.GET(accept='text/plain')
+            def text(self, request):
+                calls.append(request.path_qs)
+                return http.ok(headers, body)
+            @resource.GET(accept='text/html')
+            def html(self, request):
+                calls.append(request.path_qs)
+                return http.ok(headers, '<p>%s</p>' % (body,))
+            @resource.POST()
+            def post(self, request):
+                calls.append(request.path_qs)
+                return http.ok([('Content-Type', 'text/plain')] + headers,
+                               body)
+        self.clock = Clock()
+        kw.setdefault('backend', cache.TTLCache(10, timer=self.clock))
+        self.cache = responsecache.ResponseCache(**kw)
+        A = app.RestishApp(Resource(), response_cache=self.cache)
+        return webtest.TestApp(A), calls
+
+    def test_cached(self):
+        A, calls = self.make_cached_app()
+        for i in range(2):
+            R = A.get('/', headers={'Accept': 'text/plain'}, status=200)
+            assert R.body == 'text'
+            assert R.headers['Content-Type'] == 'text/plain'
+            assert R.headers['Content-Length'] == '4'
+            assert R.headers['Cache-Control'] == 'max-age=60'
+        assert len(calls) == 1
+
+    def test_negotiated_type(self):
+        A, calls = self.make_cached_app()
+        assert A.get('/', headers={'Accept': 'text/plain'}).body == 'text'
+        assert A.get('/', headers={'Accept': 'text/html'}).body == '<p>text</p>'
+        assert A.get('/', headers={'Accept': 'text/html;q=1, text/plain;q=0.5'}).body == '<p>text</p>'
+        assert len(calls) == 2
+
+    def test_path_and_query(self):
+        A, calls = self.make_cached_app()
+        A.get('/')
+        A.get('/?a=1')
+        A.get('/?a=1')
+        assert calls == ['/', '/?a=1']
+
+    def test_expires(self):
+        A, calls = self.make_cached_app()
+        A.get('/')
+        self.clock.now += 59
+        A.get('/')
+        self.clock.now += 1
+        A.get('/')
+        assert len(calls) == 2
+
+    def test_s_maxage(self):
+        A, calls = self.make_cached_app([('Cache-Control', 'max-age=0, s-maxage=10')])
+        A.get('/')
+        A.get('/')
+        assert len(calls) == 1
+
+    def test_not_cacheable(self):
+        for headers in [[],
+                        [('Cache-Control', 'max-age=0')],
+                        [('Cache-Control', 'private, max-age=60')],
+                        [('Cache-Control', 'no-store')],
+                        [('Cache-Control', 'max-age=60'), ('Set-Cookie', 'a=b')],
+                        [('Cache-Control', 'max-age=60'), ('Vary', 'Cookie')]]:
+            A, calls = self.make_cached_app(headers)
+            A.get('/')
+            A.get('/')
+            assert len(calls) == 2, headers
+
+    def test_streamed(self):
+        A, calls = self.make_cached_app(body=iter(['text']))
+        A.get('/')
+        assert len(calls) == 1
+        assert len(self.cache.backend) == 0
+
+    def test_default_max_age(self):
+        A, calls = self.make_cached_app([], max_age=10)
+        A.get('/')
+        A.get('/')
+        assert len(calls) == 1
+
+    def test_vary(self):
+        A, calls = self.make_cached_app([('Cache-Control', 'max-age=60'),
+                                  ('Vary', 'Accept-Language')],
+                                 vary=['Accept-Language'])
+        A.get('/', headers={'Accept-Language': 'en'})
+        A.get('/', headers={'Accept-Language': 'en'})
+        A.get('/', headers={'Accept-Language': 'fr'})
+        assert len(calls) == 2
+
+    def test_post(self):
+        A, calls = self.make_cached_app()
+        A.post('/')
+        A.post('/')
+        assert len(calls) == 2
+
+    def test_not_acceptable(self):
+        A, calls = self.make_cached_app()
+        A.get('/', headers={'Accept': 'application/json'}, status=406)
+        assert len(self.cache.backend) == 0
+
+    def test_clear(self):
+        A, calls = self.make_cached_app()
+        A.get('/')
+        self.cache.clear()
+        A.get('/')
+        assert len(calls) == 2
+
+    def test_guarded(self):
+        """
+        Check a response to an authenticated request is not reused for
+        requests without the credentials.
+        """
+        def authorized(request, obj):
+            if request.environ.get('HTTP_AUTHORIZATION') != 'Basic secret':
+                raise guard.GuardError('Not authorized.')
+        class Resource(resource.Resource):
+            @resource.GET()
+            @guard.guard(authorized)
+            def text(self, request):
+                return http.ok([('Content-Type', 'text/plain'),
+                                ('Cache-Control', 'max-age=60')], 'secret')
+        A = webtest.TestApp(app.RestishApp(
+            Resource(), response_cache=responsecache.ResponseCache()))
+        R = A.get('/', headers={'Authorization': 'Basic secret'}, status=200)
+        assert R.body == 'secret'
+        R = A.get('/', status=401)
+        assert 'secret' not in R.body.splitlines()
+
+    def test_credentials(self):
+        for headers, shared in [([('Cache-Control', 'max-age=60')], False),
+                                ([('Cache-Control', 'public, max-age=60')], True),
+                                ([('Cache-Control', 's-maxage=60')], True)]:
+            for credentials in [{'Authorization': 'Basic abc'},
+                                {'Cookie': 'session=abc'}]:
+                A, calls = self.make_cached_app(headers)
+                A.get('/', headers=credentials)
+                A.get('/', headers=credentials)
+                A.get('/')
+                assert len(calls) == (shared and 1 or 3), (headers, credentials)
+                # A response to an anonymous request is not used for a request
+                # with credentials unless it is shared.
+                A, calls = self.make_cached_app(headers)
+                A.get('/')
+                A.get('/', headers=credentials)
+                assert len(calls) == (shared and 1 or 2), (headers, credentials)
+
+    def test_vary_cookie(self):
+        A, calls = self.make_cached_app([('Cache-Control', 'max-age=60'),
+                                  ('Vary', 'Cookie')], vary=['Cookie'])
+        A.get('/', headers={'Cookie': 'a=1'})
+        A.get('/', headers={'Cookie': 'a=1'})
+        A.get('/', headers={'Cookie': 'a=2'})
+        assert len(calls) == 2
+
+    def test_non_resource(self):
+        calls = []
+        def root(request):
+            calls.append(request)
+            return http.ok([('Content-Type', 'text/plain'),
+                            ('Cache-Control', 'max-age=60')], 'text')
+        A = webtest.TestApp(app.RestishApp(root, response_cache=responsecache.ResponseCache()))
+        A.get('/', headers={'Accept': 'text/plain'})
+        A.get('/', headers={'Accept': 'text/plain'})
+        A.get('/', headers={'Accept': 'text/html'})
+        assert len(calls) == 2
+
+
+if __name__ == '__main__':
+    unittest.main()
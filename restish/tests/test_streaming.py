@@ -56,3 +56,35 @@ class TestStreaming(unittest.TestCase):
         assert f.closed
         os.remove(filename)
 
+    def test_file_object(self):
+        (fd, filename) = tempfile.mkstemp()
+        f = os.fdopen(fd, 'w')
+        f.write('line 1\nline 2\n' * 1000)
+        f.close()
+        f = open(filename)
+        response = http.ok([('Content-Type', 'text/plain')], f)
+        assert isinstance(response.app_iter, http.FileIter)
+        # Read in blocks, not lines.
+        chunks = list(response.app_iter)
+        assert len(chunks) == 2
+        assert ''.join(chunks) == 'line 1\nline 2\n' * 1000
+        response.app_iter.close()
+        assert f.closed
+        os.remove(filename)
+
+    def test_file_wrapper(self):
+        wrapped = []
+        class FileWrapper(object):
+            def __init__(self, f, block_size):
+                wrapped.append((f, block_size))
+                self.f = f
+            def __iter__(self):
+                return iter([self.f.read()])
+            def close(self):
+                self.f.close()
+        f = StringIO.StringIO('file')
+        A = webtest.TestApp(app.RestishApp(Resource(f)))
+        R = A.get('/', extra_environ={'wsgi.file_wrapper': FileWrapper})
+        assert R.body == 'file'
+        assert wrapped == [(f, 8192)]
+        assert f.closed
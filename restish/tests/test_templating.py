@@ -1,6 +1,6 @@
 import unittest
 
-from restish import http, resource, templating
+from restish import http, page, resource, templating
 
 
 class TestModule(unittest.TestCase):
@@ -99,6 +99,64 @@ class TestArgs(unittest.TestCase):
             assert name in element(None, request)
 
 
+class TestRequestArgs(unittest.TestCase):
+
+    def test_built_once(self):
+        seen = []
+        def renderer(template, args, encoding=None):
+            seen.append(args)
+            if template == 'page':
+                element = args.pop('element')
+                return ''.join([element(name)() for name in ['a', 'b', 'a']])
+            return template
+        class Element(page.Element):
+            @templating.element('element')
+            def __call__(self, request):
+                return {}
+        class Page(page.Page):
+            @page.element('a')
+            def a(self, request):
+                return Element()
+            @page.element('b')
+            def b(self, request):
+                return Element()
+        request = http.Request.blank('/', environ={'restish.templating': templating.Templating(renderer)})
+        P = Page()
+        assert templating.args_built(request) == 0
+        assert templating.render_page(request, P, 'page') == 'elementelementelement'
+        # Once for the whole request, not for each element.
+        assert templating.args_built(request) == 1
+        # The args are shared, but each render gets its own copy.
+        assert templating.args_copied(request) == len(seen) == 4
+        assert len(set([id(args['urls']) for args in seen])) == 1
+        assert len(set([id(args) for args in seen])) == len(seen)
+        assert 'element' in seen[1]
+        templating.render_page(request, P, 'page')
+        assert templating.args_built(request) == 1
+        assert templating.args_copied(request) == 8
+        # But not across requests.
+        request = http.Request.blank('/', environ={'restish.templating': templating.Templating(renderer)})
+        templating.render(request, 'render')
+        assert templating.args_built(request) == 1
+        assert templating.args_copied(request) == 1
+
+    def test_overridden(self):
+        """
+        Check args added by a Templating subclass are still used.
+        """
+        class Templating(templating.Templating):
+            def element_args(self, request, element):
+                args = super(Templating, self).element_args(request, element)
+                args['extra'] = element
+                return args
+        def renderer(template, args, encoding=None):
+            return "%s %r" % (template, sorted(args))
+        request = http.Request.blank('/', environ={'restish.templating': Templating(renderer)})
+        assert templating.render_element(request, None, 'element') == "element ['element', 'extra', 'urls']"
+        assert templating.render_page(request, None, 'page') == "page ['element', 'extra', 'urls']"
+        assert templating.render(request, 'render') == "render ['urls']"
+
+
 class TestRendering(unittest.TestCase):
 
     def test_unconfigured(self):
@@ -135,6 +193,31 @@ class TestRendering(unittest.TestCase):
         assert response.headers['Content-Type'] == 'text/html; charset=utf-8'
         assert response.body == "page ['element', 'urls']"
 
+    def test_render_response_stream(self):
+        rendered = []
+        class Renderer(object):
+            def __call__(self, template, args, encoding=None):
+                raise AssertionError('stream should be used')
+            def stream(self, template, args, encoding=None):
+                for chunk in [template, ' ', repr(sorted(args))]:
+                    rendered.append(chunk)
+                    yield chunk.encode(encoding)
+        request = http.Request.blank('/', environ={'restish.templating': templating.Templating(Renderer())})
+        response = templating.render_response(request, None, 'page', stream=True)
+        assert response.status == "200 OK"
+        assert response.headers['Content-Type'] == 'text/html; charset=utf-8'
+        assert not rendered
+        assert list(response.app_iter) == ['page', ' ', "['element', 'urls']"]
+
+    def test_stream_fallback(self):
+        def renderer(template, args, encoding=None):
+            return "%s %r" % (template, sorted(args))
+        @templating.page('page', stream=True)
+        def page(page, request):
+            return {}
+        request = http.Request.blank('/', environ={'restish.templating': templating.Templating(renderer)})
+        assert page(None, request).app_iter == ["page ['element', 'urls']"]
+
     def test_encoding(self):
         """
         Check that only a rendered page encoded output by default.
@@ -70,6 +70,22 @@ class TestUtils(unittest.TestCase):
         self.assertEquals(url.split_path('/%2F'), ['/'])
         self.assertEquals(url.split_path('/%C2%A3'), [POUND])
 
+    def test_segment_memos(self):
+        url.decoded_segments.clear()
+        url.quoted_segments.clear()
+        for i in range(2):
+            self.assertEquals(url.split_path('/foo/%C2%A3/%2F'), ['foo', POUND, '/'])
+            self.assertEquals(url.join_path(['foo', POUND, '/']), '/foo/%C2%A3/%2F')
+        # Only the segments that needed work were remembered.
+        self.assertEquals(url.decoded_segments.stats()['hits'], 2)
+        self.assertEquals(url.decoded_segments.stats()['misses'], 2)
+        self.assertEquals(url.quoted_segments.stats()['hits'], 2)
+        self.assertEquals(url.quoted_segments.stats()['misses'], 2)
+
+    def test_non_ascii_segments(self):
+        self.assertEquals(url.split_path('/\xc2\xa3'), [POUND])
+        self.assertEquals(url.split_path('/\xc2\xa3'), [POUND])
+
     def test_join_path(self):
         self.assertEquals(url.join_path([]), '')
         self.assertEquals(url.join_path(['']), '/')
@@ -446,6 +462,87 @@ class TestURL(unittest.TestCase):
         assert u.rmq("p1") == "http://localhost:1234/path?p2=bar"
 
 
+class TestDerivedURLs(unittest.TestCase):
+    """
+    Check URLs derived from another URL are the same as if they were parsed
+    from scratch, even though some of their parts are passed on.
+    """
+
+    bases = ['http://localhost', 'http://localhost/', 'http://localhost/a/b',
+             'http://localhost/a/b/', 'http://localhost/a%20b/c?x=1&y',
+             'http://localhost/a b/?x=1&&y=%2F#frag', '/a//b', '', '/',
+             'http://localhost/%C2%A3?%C2%A3=%C2%A3']
+
+    def assertReparsed(self, u):
+        reparsed = url.URL(str(u))
+        self.assertEquals(u.parsed_url, reparsed.parsed_url)
+        self.assertEquals(u.path_segments, reparsed.path_segments)
+        self.assertEquals(u.query_list, reparsed.query_list)
+        for segment in u.path_segments:
+            assert isinstance(segment, unicode)
+
+    def test_child(self):
+        for base in self.bases:
+            for path in [(), ('c',), ('c', 'd'), ('',), (POUND, '/'), ('c', '')]:
+                u = url.URL(base)
+                l = url.split_path(u.path)
+                if l[-1:] == ['']:
+                    l[-1:] = path
+                else:
+                    l.extend(path)
+                expected = u.clone(path=url.join_path(l), query=None, fragment=None)
+                child = u.child(*path)
+                self.assertEquals(str(child), str(expected))
+                self.assertReparsed(child)
+                self.assertReparsed(child.child('e'))
+
+    def test_add_query(self):
+        for base in self.bases:
+            for args in [[], [('n', None)], [('n', 'v'), ('m', '')],
+                         [(POUND, POUND)], [('n', 1)], [('', None)]]:
+                u = url.URL(base)
+                expected = u.clone(query=url.join_query(url.split_query(u.query) + args))
+                derived = u.add_queries(args)
+                self.assertEquals(str(derived), str(expected))
+                self.assertReparsed(derived)
+                self.assertReparsed(derived.add_query('z', 'z'))
+
+    def test_children(self):
+        items = ['c', '', POUND, '/', ('c', 'd'), (), ('', 'x')]
+        for base in self.bases:
+            u = url.URL(base)
+            children = u.children(items)
+            self.assertEquals(len(children), len(items))
+            for item, child in zip(items, children):
+                if isinstance(item, basestring):
+                    item = (item,)
+                self.assertEquals(str(child), str(u.child(*item)))
+                assert isinstance(child, url.URL)
+                self.assertReparsed(child)
+
+    def test_siblings(self):
+        for base in self.bases:
+            u = url.URL(base)
+            if not u.path_segments:
+                continue
+            for item, sibling in zip(['c', POUND, ''], u.siblings(['c', POUND, ''])):
+                self.assertEquals(str(sibling), str(u.sibling(item)))
+                self.assertReparsed(sibling)
+
+    def test_children_generator(self):
+        u = url.URL('http://localhost/a/')
+        self.assertEquals(u.children(str(i) for i in range(3)),
+                          ['http://localhost/a/0', 'http://localhost/a/1',
+                           'http://localhost/a/2'])
+
+    def test_cached_parts_not_shared(self):
+        u = url.URL('http://localhost/a?b=c')
+        u.path_segments.append('x')
+        u.query_list.append(('x', None))
+        self.assertEquals(u.path_segments, ['a'])
+        self.assertEquals(u.query_list, [('b', 'c')])
+
+
 class Serialization(unittest.TestCase):
 
     def test_strangeSegs(self):
@@ -1,5 +1,11 @@
+import os
+import shutil
+import StringIO
+import sys
+import tempfile
 import unittest
 import webtest
+from wsgiref.util import FileWrapper
 
 from restish import app, http, util
 
@@ -43,3 +49,175 @@ class TestWSGI(unittest.TestCase):
         assert response.headers['Content-Type'] == 'text/plain'
         assert response.body == 'SCRIPT_NAME: /foo, PATH_INFO: /bar'
 
+
+    def test_environ_not_copied(self):
+        environs = []
+        def child(environ, start_response):
+            environs.append(environ)
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return []
+        request = http.Request.blank('/foo/bar')
+        util.wsgi(request, child, [u'bar'])
+        assert environs[0] is request.environ
+        assert request.environ['SCRIPT_NAME'] == ''
+        assert request.environ['PATH_INFO'] == '/foo/bar'
+        assert str(request.url) == 'http://localhost/foo/bar'
+
+    def test_environ_restored(self):
+        """
+        Test the environ is restored after a child rewrites PATH_INFO.
+        """
+        seen = []
+        def child(environ, start_response):
+            seen.append((environ['SCRIPT_NAME'], environ['PATH_INFO']))
+            environ['SCRIPT_NAME'] += '/bar'
+            environ['PATH_INFO'] = '/baz'
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            yield environ['PATH_INFO']
+        request = http.Request.blank('/foo/bar')
+        response = util.wsgi(request, child, [u'bar'])
+        assert seen == [('/foo', '/bar')]
+        # The child still sees its changes until it is closed.
+        assert list(response.app_iter) == ['/baz']
+        assert request.environ['PATH_INFO'] == '/baz'
+        response.app_iter.close()
+        assert request.environ['SCRIPT_NAME'] == ''
+        assert request.environ['PATH_INFO'] == '/foo/bar'
+
+    def test_file_wrapper(self):
+        """
+        Check the server's file_wrapper is passed on when the environ must be
+        restored once it is closed.
+        """
+        def child(environ, start_response):
+            environ['PATH_INFO'] = '/baz'
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return environ['wsgi.file_wrapper'](StringIO.StringIO('hello'))
+        request = http.Request.blank('/foo/bar', environ={'wsgi.file_wrapper': FileWrapper})
+        response = util.wsgi(request, child, [u'bar'])
+        assert isinstance(response.app_iter, FileWrapper)
+        assert ''.join(response.app_iter) == 'hello'
+        assert request.environ['PATH_INFO'] == '/baz'
+        response.app_iter.close()
+        assert request.environ['PATH_INFO'] == '/foo/bar'
+
+    def test_app_iter_untouched(self):
+        closed = []
+        class AppIter(object):
+            def __iter__(self):
+                yield 'one'
+                yield 'two'
+            def close(self):
+                closed.append(True)
+        app_iter = AppIter()
+        def child(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return app_iter
+        response = util.wsgi(http.Request.blank('/'), child, [])
+        assert response.app_iter is app_iter
+        testapp = webtest.TestApp(app.RestishApp(util.WSGIResource(child)))
+        assert testapp.get('/').body == 'onetwo'
+        assert closed == [True]
+
+    def test_write(self):
+        def child(environ, start_response):
+            write = start_response('200 OK', [('Content-Type', 'text/plain')])
+            write('one')
+            write('two')
+            return ['three']
+        testapp = webtest.TestApp(app.RestishApp(util.WSGIResource(child)))
+        assert testapp.get('/').body == 'onetwothree'
+
+    def test_lazy_start_response(self):
+        def child(environ, start_response):
+            write = start_response('200 OK', [('Content-Type', 'text/plain')])
+            write('one')
+            yield ''
+            yield 'two'
+            yield 'three'
+        testapp = webtest.TestApp(app.RestishApp(util.WSGIResource(child)))
+        assert testapp.get('/').body == 'onetwothree'
+
+    def test_exc_info(self):
+        def child(environ, start_response):
+            write = start_response('200 OK', [('Content-Type', 'text/plain')])
+            write('partial')
+            try:
+                raise ValueError()
+            except ValueError:
+                start_response('500 Internal Server Error',
+                               [('Content-Type', 'text/plain')],
+                               sys.exc_info())
+            return ['error']
+        testapp = webtest.TestApp(app.RestishApp(util.WSGIResource(child)))
+        response = testapp.get('/', status=500)
+        assert response.body == 'error'
+
+    def test_exc_info_after_headers(self):
+        def child(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            yield 'data'
+            try:
+                raise ValueError()
+            except ValueError:
+                start_response('500 Internal Server Error',
+                               [('Content-Type', 'text/plain')],
+                               sys.exc_info())
+        response = util.wsgi(http.Request.blank('/'), child, [])
+        assert response.status == '200 OK'
+        self.assertRaises(ValueError, list, response.app_iter)
+
+    def test_start_response_twice(self):
+        def child(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return []
+        self.assertRaises(AssertionError, util.wsgi,
+                          http.Request.blank('/'), child, [])
+
+
+class TestStaticResource(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.directory, 'static'))
+        os.mkdir(os.path.join(self.directory, 'static', 'css'))
+        for name, content in [('secret.txt', 'secret'),
+                              ('static/index.html', '<p>index</p>'),
+                              ('static/css/site.css', 'p {}')]:
+            f = open(os.path.join(self.directory, name), 'wb')
+            f.write(content)
+            f.close()
+        root = util.StaticResource(os.path.join(self.directory, 'static'))
+        self.testapp = webtest.TestApp(app.RestishApp(root))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_files(self):
+        response = self.testapp.get('/index.html', status=200)
+        assert response.headers['Content-Type'] == 'text/html'
+        assert response.headers['Content-Length'] == '12'
+        assert 'Last-Modified' in response.headers
+        assert response.body == '<p>index</p>'
+        response = self.testapp.get('/css/site.css', status=200)
+        assert response.headers['Content-Type'] == 'text/css'
+        assert response.body == 'p {}'
+
+    def test_head(self):
+        response = self.testapp.head('/index.html', status=200)
+        assert response.headers['Content-Length'] == '12'
+        assert response.body == ''
+
+    def test_not_found(self):
+        for path in ['/', '/css', '/css/', '/missing.html', '/../secret.txt',
+                     '/css/../../secret.txt', '/%2e%2e/secret.txt',
+                     '/css%2f..%2f..%2fsecret.txt']:
+            self.testapp.get(path, status=404)
+
+    def test_symlink_outside(self):
+        if not hasattr(os, 'symlink'):
+            return
+        os.symlink(os.path.join(self.directory, 'secret.txt'),
+                   os.path.join(self.directory, 'static', 'link.txt'))
+        self.testapp.get('/link.txt', status=404)
@@ -1,6 +1,10 @@
+import re
+import string
 import urlparse
 import urllib
 
+from restish.cache import BoundedMemo
+
 
 # Lists of characters considered "safe", i.e. should not be escape encoded.
 SAFE = '-_.!*\'()~'
@@ -9,10 +13,18 @@ SAFE_QUERY_NAME = SAFE
 SAFE_QUERY_VALUE = SAFE + '='
 
 
+# All the characters that never need quoting in a path segment.
+_SAFE_SEGMENT_CHARS = string.ascii_letters + string.digits + SAFE_SEGMENT
+
+
 # Marker object for unset attributes when None is a meaningful value.
 _UNSET = object()
 
 
+# Characters that urlsplit strips from a URL.
+_SPLIT_UNSAFE = re.compile('[\t\r\n]')
+
+
 def _decode(S):
     """ Simple decode from utf-8 """
     return S.decode('utf-8')
@@ -35,14 +47,94 @@ def _unquote(S):
     return urllib.unquote_plus(S)
 
 
+def _unsplittable(url, parts):
+    """
+    Test if urlsplit is guaranteed to return exactly the same parts that were
+    passed to urlunsplit to create url, i.e. the common case of a well-formed
+    http URL.
+    """
+    scheme, netloc, path, query, fragment = parts
+    query, fragment = query or '', fragment or ''
+    if scheme not in ('', 'http', 'https'):
+        return False
+    if path and (path[:1] != '/' or path[:2] == '//'):
+        return False
+    for part in (netloc, path, query, fragment):
+        if not isinstance(part, str):
+            return False
+    return not (_SPLIT_UNSAFE.search(url) or
+                '/' in netloc or '?' in netloc or '#' in netloc or
+                '?' in path or '#' in path or '#' in query)
+
+
+def _decode_segment(S):
+    """
+    Return the unicode version of a path segment or query component, as it
+    would be decoded after quoting.
+    """
+    if isinstance(S, unicode):
+        return S
+    return _decode(S)
+
+
+def _decode_path_segment(segment):
+    """
+    Unquote and decode a single path segment.
+    """
+    return _decode(urllib.unquote(segment))
+
+
+def _quote_path_segment(segment):
+    """
+    Quote a single (str) path segment.
+    """
+    return _quote(segment, SAFE_SEGMENT)
+
+
+# Bounded memos of decoded and quoted path segments. Paths are typically built
+# from a small vocabulary of segments (collection names, API versions, etc) so
+# the same segments are converted over and over again. The memos' maxsize
+# attributes can be changed to suit the application, or set to 0 to disable
+# them, and their stats() methods report the hit rate.
+#
+# Plain ASCII segments that need no unquoting or quoting bypass the memos,
+# there's nothing to gain from caching them.
+decoded_segments = BoundedMemo(_decode_path_segment, maxsize=1024)
+quoted_segments = BoundedMemo(_quote_path_segment, maxsize=1024)
+
+
+def _split_segment(S):
+    """
+    Unquote and decode a single path segment, via the decoded_segments memo
+    if necessary.
+    """
+    if '%' not in S:
+        try:
+            return unicode(S)
+        except UnicodeDecodeError:
+            pass
+    return decoded_segments(S)
+
+
+def _join_segment(S):
+    """
+    Encode and quote a single path segment, via the quoted_segments memo if
+    necessary.
+    """
+    S = _encode(S)
+    if not S.rstrip(_SAFE_SEGMENT_CHARS):
+        return S
+    return quoted_segments(S)
+
+
 def split_path(path):
     """
     Split a path of type str into a sequence of unicode segments.
     """
-    segments = [urllib.unquote(segment) for segment in path.split('/')]
+    segments = path.split('/')
     if segments[:1] == ['']:
         segments = segments[1:]
-    return [_decode(S) for S in segments]
+    return [_split_segment(S) for S in segments]
 
 
 def join_path(path_segments):
@@ -51,8 +143,7 @@ def join_path(path_segments):
     """
     if not path_segments:
         return ''
-    return '/' + '/'.join([_quote((_encode(seg)), SAFE_SEGMENT)
-        for seg in path_segments])
+    return '/' + '/'.join([_join_segment(seg) for seg in path_segments])
 
 
 def _split_query(query):
@@ -103,6 +194,11 @@ class URL(str):
     The URL class tries to be unicode-aware. Unicode path segments and query
     components are UTF-8 encoded on the way in and always returned as unicode
     instances. Note however that the URL itself is a byte string.
+
+    A URL is only split into its parts, and the path segments and query
+    decoded, when first needed. URLs derived from another URL, e.g. by child()
+    or add_query(), inherit the already decoded path segments or query list
+    and only quote the parts that were added.
     """
 
     def __init__(self, url):
@@ -110,7 +206,48 @@ class URL(str):
         Create a new URL instance from a str URL.
         """
         str.__init__(url)
-        self.parsed_url = urlparse.urlsplit(url)
+
+    @classmethod
+    def _derived(cls, parts, path_segments=None, query_list=None):
+        """
+        Create a new URL from its (scheme, netloc, path, query, fragment)
+        parts.
+
+        If path_segments or query_list are given then they must be the decoded
+        form of the path or query, i.e. the path or query must be exactly as
+        join_path or join_query would create them.
+        """
+        return cls._with_parts(urlparse.urlunsplit(parts), parts,
+                               path_segments, query_list)
+
+    @classmethod
+    def _with_parts(cls, url, parts, path_segments=None, query_list=None):
+        """
+        Create a new URL from the str url, which must be the urlunsplit parts,
+        passing on the parts (see _derived).
+        """
+        derived = cls(url)
+        # The parts can only be passed on if they will survive the round trip
+        # through urlunsplit and urlsplit unchanged.
+        if _unsplittable(derived, parts):
+            derived._parsed_url = urlparse.SplitResult(
+                parts[0], parts[1], parts[2], parts[3] or '', parts[4] or '')
+            if path_segments is not None:
+                derived._path_segments = path_segments
+                derived._is_canonical_path = True
+            if query_list is not None:
+                derived._query_list = query_list
+                derived._is_canonical_query = True
+        return derived
+
+    @property
+    def parsed_url(self):
+        """ The url split into a urlparse.SplitResult """
+        try:
+            return self._parsed_url
+        except AttributeError:
+            self._parsed_url = urlparse.urlsplit(str(self))
+            return self._parsed_url
 
     def __eq__(self, other):
         if isinstance(other, URL):
@@ -132,7 +269,11 @@ class URL(str):
     @property
     def path(self):
         """ The path of the url without query string or fragment """
-        return self.__class__(self.parsed_url[2])
+        try:
+            return self._path
+        except AttributeError:
+            self._path = self.__class__(self.parsed_url[2])
+            return self._path
 
     @property
     def path_qs(self):
@@ -142,7 +283,11 @@ class URL(str):
     @property
     def path_segments(self):
         """ A list of url segments """
-        return split_path(self.path)
+        try:
+            segments = self._path_segments
+        except AttributeError:
+            segments = self._path_segments = split_path(self.path)
+        return list(segments)
 
     @property
     def query(self):
@@ -152,7 +297,36 @@ class URL(str):
     @property
     def query_list(self):
         """ The query parameters as a list of tuples """
-        return split_query(self.query)
+        try:
+            query_list = self._query_list
+        except AttributeError:
+            query_list = self._query_list = split_query(self.query)
+        return list(query_list)
+
+    def _canonical_path(self):
+        """
+        Test if the path is exactly as join_path would create it from the
+        decoded path segments, in which case new segments can simply be
+        appended.
+        """
+        try:
+            return self._is_canonical_path
+        except AttributeError:
+            self._is_canonical_path = \
+                    join_path(self.path_segments) == self.parsed_url[2]
+            return self._is_canonical_path
+
+    def _canonical_query(self):
+        """
+        Test if the query is exactly as join_query would create it from the
+        decoded query list, in which case new args can simply be appended.
+        """
+        try:
+            return self._is_canonical_query
+        except AttributeError:
+            self._is_canonical_query = \
+                    join_query(self.query_list) == self.parsed_url[3]
+            return self._is_canonical_query
 
     @property
     def fragment(self):
@@ -182,8 +356,7 @@ class URL(str):
             query_ = query
         if fragment is not _UNSET:
             fragment_ = fragment
-        return self.__class__(urlparse.urlunsplit((scheme_, netloc_, path_,
-                                                   query_, fragment_)))
+        return self._derived((scheme_, netloc_, path_, query_, fragment_))
 
     ## path manipulations ##
 
@@ -205,12 +378,77 @@ class URL(str):
         """
         Construct a url where the given path segment is a child of this url
         """
-        l = list(self.path_segments)
+        l = self.path_segments
+        current = self.parsed_url[2]
         if l[-1:] == ['']:
             l[-1:] = path
+            current = current[:-1]
         else:
             l.extend(path)
-        return self.clone(path=join_path(l), query=None, fragment=None)
+        if self._canonical_path():
+            # Only the new segments need quoting.
+            new_path = current + join_path(path)
+        else:
+            new_path = join_path(l)
+        l[len(l) - len(path):] = [_decode_segment(seg) for seg in path]
+        scheme, netloc = self.parsed_url[:2]
+        return self._derived((scheme, netloc, new_path, None, None),
+                             path_segments=l, query_list=[])
+
+    def children(self, items):
+        """
+        Construct a list of urls where each item is a child of this url.
+
+        Each item is either a path segment or a sequence of path segments, i.e.
+        the result is the same as [self.child(item) for item in items] (or
+        self.child(*item) for sequences) but the common part of the urls is
+        only built once and only the items are quoted.
+        """
+        l = self.path_segments
+        if l[-1:] == ['']:
+            l.pop()
+        return self._bulk(l, items)
+
+    def siblings(self, items):
+        """
+        Construct a list of urls where each item is a sibling of this url.
+
+        Each item is either a path segment or a sequence of path segments, as
+        for children().
+        """
+        l = self.path_segments
+        l.pop()
+        return self._bulk(l, items)
+
+    def _bulk(self, segments, items):
+        """
+        Construct a list of urls with a path of the segments followed by each
+        of the items.
+        """
+        scheme, netloc = self.parsed_url[:2]
+        prefix_path = join_path(segments)
+        prefix = urlparse.urlunsplit((scheme, netloc, prefix_path, None, None))
+        unsplittable = _unsplittable(prefix,
+                                     (scheme, netloc, prefix_path, None, None))
+        cls = self.__class__
+        urls = []
+        for item in items:
+            if isinstance(item, basestring):
+                item = (item,)
+            tail = join_path(item)
+            path = prefix_path + tail
+            if netloc or prefix_path:
+                url = cls(prefix + tail)
+            else:
+                url = cls(urlparse.urlunsplit((scheme, netloc, path, None, None)))
+            # A quoted tail cannot upset urlsplit, unless it makes the path
+            # look like a netloc.
+            if unsplittable and path[:2] != '//':
+                url._parsed_url = urlparse.SplitResult(scheme, netloc, path,
+                                                       '', '')
+                url._is_canonical_path = url._is_canonical_query = True
+            urls.append(url)
+        return urls
 
     def parent(self):
         """
@@ -265,9 +503,7 @@ class URL(str):
         :arg value: The query value. None means do not use a value. e.g.
                     ``?key=``
         """
-        q = list(self.query_list)
-        q.append((name, value))
-        return self.clone(query=join_query(q))
+        return self.add_queries([(name, value)])
 
     def add_queries(self, query_list):
         """
@@ -275,9 +511,35 @@ class URL(str):
 
         :arg query_list: list of tuple (key, value) pairs
         """
-        q = list(self.query_list)
+        query_list = list(query_list)
+        q = self.query_list
         q.extend(query_list)
-        return self.clone(query=join_query(q))
+        # Args with an empty name disappear when the query is split again, so
+        # only pass the query list on without them.
+        if [K for (K, V) in query_list if not _encode(K)]:
+            query, decoded = join_query(q), None
+        else:
+            query, decoded = self.parsed_url[3], q
+            if self._canonical_query():
+                # Only the new query args need quoting.
+                added = join_query(query_list)
+                if query and added:
+                    query = '%s&%s' % (query, added)
+                else:
+                    query = query or added
+            else:
+                query = join_query(q)
+            # Decode the added args, as split_query would.
+            decoded[len(q) - len(query_list):] = [
+                (_decode_segment(K), V if V is None else unicode(V))
+                for (K, V) in query_list]
+        if self._canonical_path():
+            path_segments = self._path_segments
+        else:
+            path_segments = None
+        parts = self.parsed_url
+        return self._derived(parts[:3] + (query,) + parts[4:],
+                             path_segments=path_segments, query_list=decoded)
 
     def replace_query(self, name, value=None):
         """
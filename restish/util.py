@@ -2,7 +2,10 @@
 General-purpose utilities.
 """
 
-from restish import http, url
+import os
+import types
+
+from restish import http, resource, url
 
 
 class WSGIResource(object):
@@ -25,29 +28,223 @@ def wsgi(request, app, path_info_segments):
     """
     Low-level function to call out to another wsgi application.
 
-    WARNING: This is only a partial implementation for now. It does not handle
-    the start_response exc_info arg, nor does it handle calls to the write
-    function that must be returned from start_response.
+    The application is called with the request's environ, updated in place to
+    move the segments before path_info_segments from PATH_INFO to SCRIPT_NAME,
+    rather than a copy of it. (The request's URL is unchanged as a result.)
+    The original SCRIPT_NAME and PATH_INFO are restored when the application
+    returns or, if it changed them and its app_iter may still read them, when
+    its app_iter is closed.
+
+    The application's app_iter is passed on to the WSGI server untouched
+    unless the application used the write callable returned by
+    start_response, in which case the written data is sent before the
+    app_iter, or the app_iter must restore the environ when closed. An
+    app_iter created by the server's wsgi.file_wrapper is never wrapped, only
+    given a new close method, so the server can still send the file its own
+    way. start_response may be called with exc_info to replace the status and
+    headers, discarding anything written, until the application returns (or,
+    if it calls start_response lazily, yields its first data); after that the
+    exception is re-raised.
     """
-    # Copy and update the environ to set new SCRIPT_NAME and PATH_INFO.
     script_segments = request.path.path_segments
     if path_info_segments:
         script_segments = script_segments[:-len(path_info_segments)]
-    environ = dict(request.environ)
-    environ['SCRIPT_NAME'] = url.join_path(script_segments)
-    environ['PATH_INFO'] = url.join_path(path_info_segments)
+    environ = request.environ
+    saved = {'SCRIPT_NAME': environ.get('SCRIPT_NAME', ''),
+             'PATH_INFO': environ.get('PATH_INFO', '')}
+    script_name = environ['SCRIPT_NAME'] = url.join_path(script_segments)
+    path_info = environ['PATH_INFO'] = url.join_path(path_info_segments)
     # Call the wsgi application.
-    stuff = {}
-    def write(body_data):
-        raise NotImplementedError()
+    started = []
+    written = []
+    committed = []
     def start_response(status, headers, exc_info=None):
         if exc_info is not None:
-            raise NotImplementedError()
-        stuff['status'] = status
-        stuff['headers'] = headers
-        return write
-    result = app(environ, start_response)
-    return http.Response(stuff['status'], stuff['headers'], result)
+            try:
+                if committed:
+                    raise exc_info[0], exc_info[1], exc_info[2]
+            finally:
+                # Avoid a circular reference, see PEP 333.
+                exc_info = None
+            del written[:]
+        elif started:
+            raise AssertionError('start_response called a second time '
+                                 'without exc_info')
+        started[:] = [status, headers]
+        return written.append
+    try:
+        result = app(environ, start_response)
+        if not started:
+            # The application may call start_response as its app_iter
+            # starts.
+            result = _start_app_iter(result, written)
+            if not started:
+                raise AssertionError('start_response was not called')
+        elif written:
+            result = _PrependedAppIter(written, result)
+    except:
+        environ.update(saved)
+        raise
+    committed.append(True)
+    if isinstance(result, (list, tuple)) or \
+            (environ.get('SCRIPT_NAME') == script_name and
+             environ.get('PATH_INFO') == path_info):
+        environ.update(saved)
+    else:
+        result = _restoring_app_iter(result, environ, saved)
+    return http.Response(started[0], started[1], result)
+
+
+def _restoring_app_iter(app_iter, environ, saved):
+    """
+    Return an app_iter that restores the environ when closed, replacing the
+    close method of an app_iter created by the server's wsgi.file_wrapper
+    rather than hiding it from the server.
+    """
+    restoring = _RestoringAppIter(app_iter, environ, saved)
+    file_wrapper = environ.get('wsgi.file_wrapper')
+    if isinstance(file_wrapper, (type, types.ClassType)) and \
+            isinstance(app_iter, file_wrapper):
+        try:
+            app_iter.close = restoring.close
+        except (AttributeError, TypeError):
+            pass
+        else:
+            return app_iter
+    return restoring
+
+
+class _PrependedAppIter(object):
+    """
+    app_iter that yields the chunks and then the app_iter, closing the
+    app_iter when closed.
+    """
+
+    def __init__(self, chunks, app_iter):
+        self.chunks = chunks
+        self.app_iter = app_iter
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            yield chunk
+        for chunk in self.app_iter:
+            yield chunk
+
+    def close(self):
+        close = getattr(self.app_iter, 'close', None)
+        if close is not None:
+            close()
+
+
+def _start_app_iter(app_iter, written):
+    """
+    Iterate app_iter until start_response has been called, i.e. until it
+    yields its first non-empty chunk or finishes, returning an app_iter that
+    includes everything it and the write callable produced.
+    """
+    iterator = iter(app_iter)
+    for chunk in iterator:
+        if chunk:
+            written.append(chunk)
+            break
+    if written:
+        return _PrependedAppIter(written, _ResumedAppIter(iterator, app_iter))
+    close = getattr(app_iter, 'close', None)
+    if close is not None:
+        close()
+    return []
+
+
+class _ResumedAppIter(object):
+    """
+    app_iter that continues a partly consumed iterator, closing the original
+    app_iter when closed.
+    """
+
+    def __init__(self, iterator, app_iter):
+        self.iterator = iterator
+        self.app_iter = app_iter
+
+    def __iter__(self):
+        return self.iterator
+
+    def close(self):
+        close = getattr(self.app_iter, 'close', None)
+        if close is not None:
+            close()
+
+
+class _RestoringAppIter(object):
+    """
+    app_iter that updates the environ with saved, restoring the values the
+    application changed, once the app_iter is closed.
+    """
+
+    def __init__(self, app_iter, environ, saved):
+        self.app_iter = app_iter
+        # The app_iter's own close, which may be replaced by ours.
+        self._close = getattr(app_iter, 'close', None)
+        self.environ = environ
+        self.saved = saved
+
+    def __iter__(self):
+        return iter(self.app_iter)
+
+    def close(self):
+        try:
+            if self._close is not None:
+                self._close()
+        finally:
+            self.environ.update(self.saved)
+
+
+class StaticResource(resource.Resource):
+    """
+    Resource that serves the files in a directory, and its subdirectories,
+    using http.file_response.
+
+    Requests for anything that is not a file within the directory, including
+    directories, are not found.
+    """
+
+    def __init__(self, directory, chunk_size=65536, _segments=None):
+        self.directory = os.path.abspath(directory)
+        self.chunk_size = chunk_size
+        self._segments = _segments or []
+
+    def resource_child(self, request, segments):
+        return self.__class__(self.directory, self.chunk_size,
+                              self._segments + list(segments)), []
+
+    @resource.GET()
+    def get(self, request):
+        filename = self._filename()
+        if filename is None:
+            return http.not_found()
+        try:
+            f = open(filename, 'rb')
+        except IOError:
+            return http.not_found()
+        return http.file_response(f, chunk_size=self.chunk_size)
+
+    def _filename(self):
+        """
+        Return the filename of the file to serve, or None if it is not a file
+        within the directory.
+        """
+        for segment in self._segments:
+            if segment in ('', '.', '..') or '/' in segment or \
+                    os.sep in segment or '\0' in segment:
+                return None
+        if not self._segments:
+            return None
+        filename = os.path.join(self.directory, *self._segments)
+        if not os.path.realpath(filename).startswith(
+                os.path.join(os.path.realpath(self.directory), '')):
+            return None
+        if not os.path.isfile(filename):
+            return None
+        return filename
 
 
 class RequestBoundCallable(object):
@@ -37,7 +37,6 @@ or database engine.
       zip_safe=False,
       install_requires=[
           # -*- Extra requirements: -*-
-          'mimeparse>=0.1.3',
           'WebOb',
       ],
       entry_points="""
@@ -46,5 +45,5 @@ or database engine.
       restish = restish.pastertemplate:RestishTemplate
       """,
       test_suite="restish.tests",
-      tests_require=['WebTest', 'Jinja2', 'mako', 'Genshi', 'Tempita', 'Django'],
+      tests_require=['WebTest', 'mimeparse', 'Jinja2', 'mako', 'Genshi', 'Tempita', 'Django'],
       )